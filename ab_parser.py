@@ -0,0 +1,141 @@
+"""Streaming parser for ApacheBench (`ab`) reports.
+
+Turns the text report that the ab workers used to upload verbatim into a
+small dict of numbers, one line at a time, so the raw text never has to be
+stored or returned by the API.
+"""
+import re
+
+# "Label:   value [unit]" lines in the header and summary sections
+SCALAR_FIELDS = {
+    'Server Software': ('server_software', str),
+    'Server Hostname': ('server_hostname', str),
+    'Server Port': ('server_port', int),
+    'SSL/TLS Protocol': ('tls_protocol', str),
+    'Document Path': ('document_path', str),
+    'Document Length': ('document_length', int),
+    'Concurrency Level': ('concurrency', int),
+    'Time taken for tests': ('time_taken', float),
+    'Complete requests': ('complete_requests', int),
+    'Failed requests': ('failed_requests', int),
+    'Write errors': ('write_errors', int),
+    'Non-2xx responses': ('non_2xx', int),
+    'Keep-Alive requests': ('keepalive_requests', int),
+    'Total transferred': ('total_transferred', int),
+    'HTML transferred': ('html_transferred', int),
+    'Total body sent': ('body_sent', int),
+    'Requests per second': ('requests_per_second', float),
+    'Transfer rate': ('transfer_rate_kbps', float),
+}
+
+CONNECTION_PHASES = {
+    'Connect': 'connect',
+    'Processing': 'processing',
+    'Waiting': 'waiting',
+    'Total': 'total',
+}
+
+FAILURE_BREAKDOWN = re.compile(
+    r'\(Connect: (\d+), Receive: (\d+), Length: (\d+), Exceptions: (\d+)\)')
+PERCENTILE_LINE = re.compile(r'^\s*(\d+)%\s+(\d+)')
+NUMBER = re.compile(r'[-+]?\d+(?:\.\d+)?')
+
+# ab prints one line per SSL failure, so only the first few are kept
+MAX_ERROR_LINES = 10
+
+
+def _number(text, kind):
+    if kind is str:
+        return text.strip()
+    match = NUMBER.search(text)
+    return kind(match.group()) if match else None
+
+
+def parse(lines):
+    """Parse an iterable of report lines (e.g. an open file) into a dict."""
+    summary = {}
+    connection_times = {}
+    percentiles = {}
+    section = None
+
+    for line in lines:
+        line = line.rstrip('\r\n')
+        stripped = line.strip()
+        if not stripped:
+            continue
+
+        if stripped.startswith('Connection Times'):
+            section = 'connection'
+            continue
+        if stripped.startswith('Percentage of the requests'):
+            section = 'percentiles'
+            continue
+
+        if section == 'percentiles':
+            match = PERCENTILE_LINE.match(line)
+            if match:
+                percentiles[match.group(1)] = int(match.group(2))
+                continue
+            section = None
+
+        if section == 'connection':
+            label, _, rest = stripped.partition(':')
+            if label in CONNECTION_PHASES:
+                values = rest.split()
+                if len(values) >= 5:
+                    connection_times[CONNECTION_PHASES[label]] = {
+                        'min': int(values[0]),
+                        'mean': int(values[1]),
+                        'sd': float(values[2]),
+                        'median': int(values[3]),
+                        'max': int(values[4]),
+                    }
+                continue
+            if label.startswith('min'):
+                continue
+            section = None
+
+        if stripped.startswith('(Connect:'):
+            match = FAILURE_BREAKDOWN.search(stripped)
+            if match:
+                for key, value in zip(('connect', 'receive', 'length', 'exceptions'), match.groups()):
+                    summary[f'failed_{key}'] = int(value)
+            continue
+
+        if stripped.startswith('Time per request:'):
+            value = _number(stripped.partition(':')[2], float)
+            key = 'time_per_request_all_ms' if 'across all' in stripped else 'time_per_request_ms'
+            summary[key] = value
+            continue
+
+        if stripped.startswith('Total of ') and stripped.endswith('requests completed'):
+            # Printed instead of the report when ab aborts part way through
+            summary['complete_requests'] = _number(stripped, int)
+            summary['aborted'] = True
+            continue
+
+        if stripped.startswith(('apr_', 'SSL read failed', 'SSL handshake failed')):
+            summary['error_count'] = summary.get('error_count', 0) + 1
+            errors = summary.setdefault('errors', [])
+            if len(errors) < MAX_ERROR_LINES:
+                errors.append(stripped)
+            continue
+
+        label, sep, rest = stripped.partition(':')
+        if sep and label in SCALAR_FIELDS:
+            key, kind = SCALAR_FIELDS[label]
+            value = _number(rest, kind)
+            if value is not None:
+                summary[key] = value
+
+    if connection_times:
+        summary['connection_times'] = connection_times
+    if percentiles:
+        summary['percentiles'] = percentiles
+    if 'complete_requests' in summary and 'keepalive_requests' in summary and summary['complete_requests']:
+        summary['keepalive_ratio'] = summary['keepalive_requests'] / summary['complete_requests']
+    return summary
+
+
+def parse_text(text):
+    return parse(text.splitlines())
@@ -0,0 +1,49 @@
+#!/usr/bin/env python3
+"""Benchmark ab_parser against the reports in benchmarks/ab_corpus.
+
+    python3 benchmarks/bench_ab_parser.py -n 2000
+
+The corpus reports are reconstructed from the numbers in the LOAD-TEST-*.md
+write-ups, plus one aborted run. Drop further captured reports into the
+directory to include them.
+"""
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+import ab_parser  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--iterations', type=int, default=2000)
+    parser.add_argument('--corpus', default=os.path.join(HERE, 'ab_corpus'))
+    args = parser.parse_args()
+
+    for path in sorted(glob.glob(os.path.join(args.corpus, '*.txt'))):
+        with open(path) as f:
+            text = f.read()
+        lines = text.splitlines()
+
+        began = time.perf_counter()
+        for _ in range(args.iterations):
+            summary = ab_parser.parse(lines)
+        elapsed = time.perf_counter() - began
+
+        print(json.dumps({
+            'report': os.path.basename(path),
+            'report_bytes': len(text),
+            'summary_bytes': len(json.dumps(summary)),
+            'parse_us': round(elapsed / args.iterations * 1e6, 1),
+            'mb_per_sec': round(len(text) * args.iterations / elapsed / 1e6, 1),
+        }))
+
+
+if __name__ == '__main__':
+    main()
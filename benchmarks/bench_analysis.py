@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""Benchmark analysis.summarize on synthetic per-request columns.
+
+    python3 benchmarks/bench_analysis.py -n 10000000
+
+Columns are the archive's (see request_archive): ten minutes of log-normal
+latencies with a sprinkling of errors and new connections. Timing covers
+the analysis only, not generating or reading the data.
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import analysis  # noqa: E402
+
+
+def make_columns(requests, seed):
+    rng = np.random.default_rng(seed)
+    total_ms = rng.lognormal(4.6, 0.6, requests).astype(np.float32)
+    connect_ms = np.where(rng.random(requests) < 0.01, rng.exponential(5.0, requests), 0).astype(np.float32)
+    status = rng.choice(np.array([200, 301, 404, 503, 0], dtype=np.int16), requests,
+                        p=[0.95, 0.02, 0.015, 0.01, 0.005])
+    return {
+        'timestamp': 1.7e9 + np.sort(rng.random(requests)) * 600,
+        'status': status,
+        'bytes': rng.integers(1000, 60000, requests),
+        'connect_ms': connect_ms,
+        'ttfb_ms': connect_ms + total_ms * 0.7,
+        'total_ms': connect_ms + total_ms,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--requests', type=int, default=10000000)
+    parser.add_argument('--apdex-ms', type=float, default=analysis.DEFAULT_APDEX_MS)
+    args = parser.parse_args()
+
+    columns = make_columns(args.requests, 1)
+    began = time.perf_counter()
+    result = analysis.summarize(columns, args.apdex_ms)
+    elapsed = time.perf_counter() - began
+
+    print(json.dumps({
+        'requests': result['requests'],
+        'seconds': round(elapsed, 3),
+        'requests_per_second_analyzed': round(args.requests / elapsed),
+        'apdex': round(result['apdex'], 4),
+        'error_rate': round(result['error_rate'], 4),
+        'p99_ms': round(result['latency']['p99_ms'], 2),
+        'throughput': result['throughput'],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
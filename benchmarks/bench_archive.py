@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""Benchmark writing and reading a per-request Parquet archive.
+
+    python3 benchmarks/bench_archive.py -n 50000000 --dir /tmp/archive
+
+Writes n synthetic requests through request_archive.ArchiveWriter as an
+engine process would, then reads back only the status and total_ms columns
+memory-mapped, as offline analysis does. Peak RSS is reported after each
+phase to show the writer's memory stays bounded by one row group. Needs
+pyarrow.
+"""
+import argparse
+import json
+import os
+import random
+import resource
+import sys
+import time
+
+import pyarrow.compute as pc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import request_archive  # noqa: E402
+from object_store import LocalObjectStore  # noqa: E402
+
+URLS = ['/', '/blog/', '/about/', '/contact/', '/wp-login.php']
+
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--requests', type=int, default=5000000)
+    parser.add_argument('--dir', default='/tmp/bench-archive')
+    parser.add_argument('--row-group-size', type=int, default=request_archive.DEFAULT_ROW_GROUP_SIZE)
+    args = parser.parse_args()
+
+    os.makedirs(args.dir, exist_ok=True)
+    path = os.path.join(args.dir, 'part-000.parquet')
+    rng = random.Random(1)
+    # A pool of pre-drawn latencies keeps the generator from dominating the timing
+    latencies = [rng.lognormvariate(-2.3, 0.6) for _ in range(4096)]
+
+    began = time.perf_counter()
+    writer = request_archive.ArchiveWriter(path, URLS, row_group_size=args.row_group_size)
+    for i in range(args.requests):
+        total = latencies[i & 4095]
+        writer.record(i * 0.0001, i % len(URLS), 200 if i % 997 else 503, 30000,
+                      0.0, total * 0.8, total)
+    writer.close()
+    write_seconds = time.perf_counter() - began
+    write_rss = peak_rss_mb()
+
+    store = LocalObjectStore(os.path.join(args.dir, 'store'))
+    began = time.perf_counter()
+    request_archive.upload(store, 'bench', 'shard-000', [path])
+    paths = request_archive.download(store, 'bench', args.dir)
+    transfer_seconds = time.perf_counter() - began
+
+    began = time.perf_counter()
+    table = request_archive.read_table(paths, columns=['status', 'total_ms'])
+    errors = pc.sum(pc.greater_equal(table.column('status'), 500)).as_py()
+    read_seconds = time.perf_counter() - began
+
+    print(json.dumps({
+        'requests': args.requests,
+        'file_mb': round(os.path.getsize(path) / 2 ** 20, 1),
+        'write_seconds': round(write_seconds, 2),
+        'write_rows_per_second': round(args.requests / write_seconds),
+        'peak_rss_mb_after_write': round(write_rss, 1),
+        'upload_download_seconds': round(transfer_seconds, 2),
+        'read_two_columns_seconds': round(read_seconds, 3),
+        'errors': int(errors),
+        'peak_rss_mb_after_read': round(peak_rss_mb(), 1),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
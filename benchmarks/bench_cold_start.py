@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Measure cold-start and warm latency of each manager action.
+
+    python3 benchmarks/bench_cold_start.py --stub          # offline, in-memory tables
+    CONFIG_TABLE=... RESULTS_TABLE=... python3 benchmarks/bench_cold_start.py
+
+Each action gets a fresh interpreter: "cold" is module import plus the first
+invocation, "warm" is the median of the following invocations in the same
+process. With --stub, boto3 is replaced by in-memory tables so the numbers
+isolate import and handler overhead; without it the real tables are used.
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ROOT = os.path.join(HERE, '..')
+
+ACTIONS = ['create', 'start', 'status', 'results', 'list']
+
+CHILD = r'''
+import json, os, statistics, sys, time, types
+sys.path.insert(0, ROOT)
+began = time.perf_counter()
+
+if STUB:
+    class Table:
+        def __init__(self):
+            self.items = {}
+        def put_item(self, Item):
+            self.items[Item['testId']] = Item
+        def get_item(self, Key, **kwargs):
+            item = self.items.get(Key['testId'])
+            return {'Item': item} if item else {}
+        def update_item(self, **kwargs):
+            pass
+        def query(self, **kwargs):
+            return {'Items': []}
+        def scan(self, **kwargs):
+            return {'Items': list(self.items.values())}
+    tables = {}
+    class Resource:
+        def Table(self, name):
+            return tables.setdefault(name, Table())
+    class Condition:
+        # Stands in for boto3.dynamodb.conditions.Key/Attr; every operator is a no-op
+        def __init__(self, *args):
+            pass
+        def __getattr__(self, name):
+            return lambda *args: self
+        def __and__(self, other):
+            return self
+    boto3 = types.ModuleType('boto3')
+    boto3.resource = lambda *args, **kwargs: Resource()
+    conditions = types.ModuleType('boto3.dynamodb.conditions')
+    conditions.Key = conditions.Attr = Condition
+    sys.modules['boto3'] = boto3
+    sys.modules['boto3.dynamodb'] = types.ModuleType('boto3.dynamodb')
+    sys.modules['boto3.dynamodb.conditions'] = conditions
+    os.environ.setdefault('CONFIG_TABLE', 'bench-configs')
+    os.environ.setdefault('RESULTS_TABLE', 'bench-results')
+    os.environ['LAUNCH_BACKEND'] = 'fake'
+
+import lambda_function
+imported = time.perf_counter() - began
+
+def invoke(body):
+    started = time.perf_counter()
+    response = lambda_function.handler({'body': json.dumps(body)}, None)
+    return time.perf_counter() - started, response
+
+body = {'action': ACTION, 'target_url': 'https://example.com/', 'concurrent_users': 10}
+if ACTION != 'create':
+    # Setup is not timed, but it does warm the shared table clients
+    created = lambda_function.handler({'action': 'create', 'target_url': 'https://example.com/'}, None)
+    body['testId'] = json.loads(created['body'])['testId']
+    lambda_function._tables.clear()
+    lambda_function._dynamodb = None
+
+first, response = invoke(body)
+cold = imported + first
+warm = [invoke(body)[0] for _ in range(ITERATIONS)]
+print(json.dumps({
+    'action': ACTION,
+    'status': response['statusCode'],
+    'cold_ms': round(cold * 1000, 2),
+    'first_call_ms': round(first * 1000, 2),
+    'warm_p50_ms': round(statistics.median(warm) * 1000, 3),
+    'modules_loaded': len(sys.modules),
+}))
+'''
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--stub', action='store_true')
+    parser.add_argument('-n', '--iterations', type=int, default=50)
+    parser.add_argument('--actions', default=','.join(ACTIONS))
+    args = parser.parse_args()
+
+    for action in args.actions.split(','):
+        source = CHILD.replace('ROOT', repr(ROOT)).replace('STUB', repr(args.stub)) \
+            .replace('ACTION', repr(action)).replace('ITERATIONS', str(args.iterations))
+        result = subprocess.run([sys.executable, '-c', source], capture_output=True, text=True)
+        if result.returncode:
+            print(json.dumps({'action': action, 'error': result.stderr.strip().splitlines()[-1]}))
+        else:
+            print(result.stdout.strip())
+
+
+if __name__ == '__main__':
+    main()
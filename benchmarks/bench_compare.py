@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""Benchmark compare.compare on synthetic tests of many requests.
+
+    python3 benchmarks/bench_compare.py -n 5000000 --resamples 1000
+
+Both tests get log-normal latencies (the candidate 5% slower) and ten
+minutes of per-second throughput. Timing covers the comparison only, which
+is what the compare action does after loading the stored histograms.
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import compare  # noqa: E402
+from latency_histogram import LatencyHistogram  # noqa: E402
+
+DISTINCT_SAMPLES = 50000
+
+
+def make_sample(requests, scale, rps, seed):
+    rng = random.Random(seed)
+    histogram = LatencyHistogram()
+    # Recording distinct values with a weight keeps setup fast for large n
+    weight = max(1, requests // DISTINCT_SAMPLES)
+    for _ in range(DISTINCT_SAMPLES):
+        histogram.record(rng.lognormvariate(4.6, 0.6) * 1000 * scale, weight)
+    series = [rng.gauss(rps, rps * 0.05) for _ in range(600)]
+    return compare.Sample(histogram, series, histogram.total, histogram.total // 1000)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-n', '--requests', type=int, default=5000000)
+    parser.add_argument('--resamples', type=int, default=compare.DEFAULT_RESAMPLES)
+    args = parser.parse_args()
+
+    baseline = make_sample(args.requests, 1.0, 1000, 1)
+    candidate = make_sample(args.requests, 1.05, 990, 2)
+
+    began = time.perf_counter()
+    result = compare.compare(baseline, candidate, resamples=args.resamples)
+    elapsed = time.perf_counter() - began
+
+    print(json.dumps({
+        'requests_per_test': baseline.histogram.total,
+        'buckets': len(baseline.histogram.buckets()[0]),
+        'method': result['method'],
+        'resamples': result['resamples'],
+        'seconds': round(elapsed, 3),
+        'regressions': result['regressions'],
+        'p99_ms': result['latency']['p99_ms'],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""Benchmark throughput and TLS handshake cost per connection policy.
+
+    openssl req -x509 -newkey rsa:2048 -nodes -subj /CN=localhost \\
+        -keyout /tmp/key.pem -out /tmp/cert.pem
+    python3 benchmarks/bench_connection_policies.py --cert /tmp/cert.pem --key /tmp/key.pem
+
+Runs the load engine against a local HTTPS server once per policy: keep-alive
+for the whole test (ab -k), browser-like reconnects every few requests with
+and without TLS session resumption, and a new connection per request with
+and without resumption. Besides the engine's per-policy stats it reports the
+server process's CPU time per request, which is where the handshakes show.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import ssl
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import load_engine  # noqa: E402
+
+BODY = b'x' * 4096
+RESPONSE = b'HTTP/1.1 200 OK\r\nContent-Length: ' + str(len(BODY)).encode() + b'\r\n\r\n' + BODY
+CLOSE_RESPONSE = (b'HTTP/1.1 200 OK\r\nConnection: close\r\nContent-Length: '
+                  + str(len(BODY)).encode() + b'\r\n\r\n' + BODY)
+
+POLICIES = [
+    {'name': 'keepalive'},
+    {'name': 'browser', 'requests_per_connection': 6, 'tls_sessions': True},
+    {'name': 'browser_no_resume', 'requests_per_connection': 6},
+    {'name': 'new', 'requests_per_connection': 1},
+    {'name': 'new_resume', 'requests_per_connection': 1, 'tls_sessions': True},
+]
+
+
+async def _handle(reader, writer):
+    try:
+        while True:
+            head = await reader.readuntil(b'\r\n\r\n')
+            if b'Connection: close' in head:
+                writer.write(CLOSE_RESPONSE)
+                await writer.drain()
+                break
+            writer.write(RESPONSE)
+    except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+        pass
+    finally:
+        writer.close()
+
+
+def serve(port, cert, key, ready):
+    async def main():
+        ctx = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        ctx.load_cert_chain(cert, key)
+        server = await asyncio.start_server(_handle, '127.0.0.1', port, ssl=ctx, backlog=4096)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+    asyncio.run(main())
+
+
+def cpu_seconds(pid):
+    with open(f'/proc/{pid}/stat') as f:
+        fields = f.read().rsplit(')', 1)[1].split()
+    # utime and stime, in clock ticks
+    return (int(fields[11]) + int(fields[12])) / os.sysconf('SC_CLK_TCK')
+
+
+def unverified_context():
+    # The server's certificate is self-signed
+    ctx = load_engine.ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.check_hostname = False
+    ctx.verify_mode = ssl.CERT_NONE
+    ctx.set_alpn_protocols(['http/1.1'])
+    return ctx
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--cert', required=True)
+    parser.add_argument('--key', required=True)
+    parser.add_argument('-c', '--concurrency', type=int, default=50)
+    parser.add_argument('-t', '--duration', type=int, default=5)
+    parser.add_argument('-p', '--processes', type=int, default=1)
+    parser.add_argument('--port', type=int, default=18443)
+    args = parser.parse_args()
+
+    load_engine.ssl_context = unverified_context
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(args.port, args.cert, args.key, ready),
+                                     daemon=True)
+    server.start()
+    ready.wait(10)
+    time.sleep(0.2)
+
+    results = {}
+    try:
+        for policy in POLICIES:
+            cpu = cpu_seconds(server.pid)
+            stats = load_engine.run(f'https://127.0.0.1:{args.port}/', args.concurrency, args.duration,
+                                    processes=args.processes, policies=[policy])
+            cpu = cpu_seconds(server.pid) - cpu
+            entry = stats['policies'][policy['name']]
+            results[policy['name']] = {
+                'requests_per_second': round(entry['requests_per_second'], 1),
+                'failures': entry['failures'],
+                'requests_per_connection': round(entry['requests_per_connection'], 2),
+                'full_handshakes_per_second': round(entry['full_handshakes_per_second'], 1),
+                'resumption_rate': round(entry['resumption_rate'], 3),
+                'tls_p50_ms': entry['tls']['p50_ms'],
+                'tls_p99_ms': entry['tls']['p99_ms'],
+                'latency_p50_ms': entry['latency']['p50_ms'],
+                'latency_p99_ms': entry['latency']['p99_ms'],
+                'server_cpu_ms_per_request': round(cpu * 1000 / entry['requests'], 3) if entry['requests'] else None,
+            }
+    finally:
+        server.terminate()
+    print(json.dumps(results, indent=2))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+"""Benchmark the load engine against a local keep-alive HTTP server.
+
+    python3 benchmarks/bench_load_engine.py -c 250 -t 10
+    python3 benchmarks/bench_load_engine.py -c 250 -t 10 --rate 5000 --arrival poisson
+
+The server runs in its own process so it does not share the engine's cores;
+on a small box the server is usually the bottleneck, not the engine.
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import load_engine  # noqa: E402
+
+BODY = b'<html><body>' + b'x' * 4096 + b'</body></html>'
+RESPONSE = (
+    b'HTTP/1.1 200 OK\r\n'
+    b'Content-Type: text/html\r\n'
+    b'Content-Length: ' + str(len(BODY)).encode() + b'\r\n'
+    b'\r\n' + BODY
+)
+
+
+async def _handle(reader, writer):
+    try:
+        while True:
+            await reader.readuntil(b'\r\n\r\n')
+            writer.write(RESPONSE)
+    except (asyncio.IncompleteReadError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+def serve(port, ready):
+    async def main():
+        server = await asyncio.start_server(_handle, '127.0.0.1', port, backlog=4096)
+        ready.set()
+        async with server:
+            await server.serve_forever()
+    asyncio.run(main())
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--concurrency', type=int, default=250)
+    parser.add_argument('-t', '--duration', type=int, default=10)
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    parser.add_argument('--port', type=int, default=18080)
+    parser.add_argument('--rate', type=float, default=None,
+                        help='Run open-loop at this many requests per second')
+    parser.add_argument('--arrival', choices=load_engine.ARRIVALS, default='constant')
+    args = parser.parse_args()
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(args.port, ready), daemon=True)
+    server.start()
+    ready.wait(10)
+    time.sleep(0.2)
+
+    try:
+        stats = load_engine.run(f'http://127.0.0.1:{args.port}/', args.concurrency,
+                                args.duration, processes=args.processes,
+                                rate=args.rate, arrival=args.arrival)
+    finally:
+        server.terminate()
+    print(json.dumps({
+        'requests': stats['requests'],
+        'failures': stats['failures'],
+        'requests_per_second': round(stats['requests_per_second'], 1),
+        'latency': stats['latency'],
+        'connections': stats['connections'],
+        'late': stats['late'],
+        'unsent': stats['unsent'],
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
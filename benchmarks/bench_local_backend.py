@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Run a whole test through the manager with the local backend.
+
+    DYNAMODB_ENDPOINT=http://localhost:8000 CONFIG_TABLE=lt-config \\
+    RESULTS_TABLE=lt-results python3 benchmarks/bench_local_backend.py \\
+        -c 200 -t 10 --create-tables
+
+Goes through create_test, start_test (LAUNCH_BACKEND=local: one engine
+process per core on this host, or LOCAL_PROCESSES), the engines' claim and
+result writing, and get_test_results' aggregation, against a local
+keep-alive server. With
+DynamoDB Local this needs no AWS at all and is reproducible run to run.
+--create-tables creates the two tables with the schema of the templates.
+--stop-after calls stop_test that many seconds into the load and reports
+how long the engines took to go quiet.
+"""
+import argparse
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from bench_load_engine import serve  # noqa: E402
+
+
+def create_tables():
+    import boto3
+
+    dynamodb = boto3.resource('dynamodb', endpoint_url=os.environ.get('DYNAMODB_ENDPOINT'))
+    existing = {table.name for table in dynamodb.tables.all()}
+    if os.environ['CONFIG_TABLE'] not in existing:
+        dynamodb.create_table(
+            TableName=os.environ['CONFIG_TABLE'],
+            BillingMode='PAY_PER_REQUEST',
+            AttributeDefinitions=[{'AttributeName': name, 'AttributeType': 'S'}
+                                  for name in ('testId', 'status', 'created_at')],
+            KeySchema=[{'AttributeName': 'testId', 'KeyType': 'HASH'}],
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'status-created_at-index',
+                'KeySchema': [{'AttributeName': 'status', 'KeyType': 'HASH'},
+                              {'AttributeName': 'created_at', 'KeyType': 'RANGE'}],
+                'Projection': {'ProjectionType': 'ALL'}
+            }]
+        ).wait_until_exists()
+    if os.environ['RESULTS_TABLE'] not in existing:
+        dynamodb.create_table(
+            TableName=os.environ['RESULTS_TABLE'],
+            BillingMode='PAY_PER_REQUEST',
+            AttributeDefinitions=[{'AttributeName': name, 'AttributeType': 'S'}
+                                  for name in ('testId', 'timestamp')],
+            KeySchema=[{'AttributeName': 'testId', 'KeyType': 'HASH'},
+                       {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}]
+        ).wait_until_exists()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--concurrency', type=int, default=200)
+    parser.add_argument('-t', '--duration', type=int, default=10)
+    parser.add_argument('--port', type=int, default=18081)
+    parser.add_argument('--create-tables', action='store_true')
+    parser.add_argument('--stop-after', type=float, default=None,
+                        help='Seconds after the start barrier to call stop_test')
+    args = parser.parse_args()
+
+    os.environ['LAUNCH_BACKEND'] = 'local'
+    if args.create_tables:
+        create_tables()
+    import lambda_function
+
+    ready = multiprocessing.Event()
+    server = multiprocessing.Process(target=serve, args=(args.port, ready), daemon=True)
+    server.start()
+    ready.wait(10)
+
+    try:
+        created = lambda_function.create_test({
+            'target_url': f'http://127.0.0.1:{args.port}/',
+            'concurrent_users': args.concurrency,
+            'duration': args.duration,
+            'ramp_up': 0,
+            'engine': 'python',
+            'regions': ['local'],
+            'start_delay': 2,
+        })
+        test_id = json.loads(created['body'])['testId']
+        began = time.monotonic()
+        started = lambda_function.start_test({'testId': test_id})
+        if started['statusCode'] != 200:
+            raise SystemExit(started['body'])
+        if args.stop_after is not None:
+            start_at = json.loads(started['body'])['start_at']
+            time.sleep(max(0.0, start_at + args.stop_after - time.time()))
+            lambda_function.stop_test({'testId': test_id})
+        codes = lambda_function.get_launch_backend().wait()
+        elapsed = time.monotonic() - began
+        results = lambda_function.get_test_results({'testId': test_id})
+    finally:
+        server.terminate()
+
+    aggregate = json.loads(results['body'])['aggregate']
+    print(json.dumps({
+        'workers': len(codes),
+        'worker_exit_codes': sorted(set(codes.values())),
+        'seconds_start_to_results': round(elapsed, 2),
+        'requests': aggregate['requests'],
+        'failures': aggregate['failures'],
+        'requests_per_second': round(aggregate['requests_per_second'], 1),
+        'latency': aggregate.get('latency'),
+        'stop': aggregate.get('stop'),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
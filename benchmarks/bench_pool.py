@@ -0,0 +1,140 @@
+#!/usr/bin/env python3
+"""Benchmark time to first request through a local warm worker pool.
+
+    python3 benchmarks/bench_pool.py -w 2 --boot-delay 5
+
+Runs worker_pool with LocalProcessProvider engines against a local server.
+The first test finds the pool empty, so its engines are started for it
+(--boot-delay stands in for instance boot and install); the second test is
+claimed by the same engines, now warm. The engines then exit once idle for
+--idle-timeout, which is timed as the scale-down.
+
+Idle engines poll for shards every 0.5-1 claim poll intervals, so a warm
+start takes up to one interval; with a boot delay much below the interval
+the comparison says little about instances, whose boot takes far longer.
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import work_queue  # noqa: E402
+import worker_pool  # noqa: E402
+from launch_backends import plan_shards  # noqa: E402
+
+# Seconds; a real instance boots and installs the worker in a minute or more
+DEFAULT_BOOT_DELAY = 5.0
+BODY = b'x' * 1024
+RESPONSE = (b'HTTP/1.1 200 OK\r\nContent-Length: ' + str(len(BODY)).encode() + b'\r\n\r\n' + BODY)
+
+
+def serve(port, first_seen):
+    """Keep-alive server recording when each path was first requested."""
+    async def handle(reader, writer):
+        try:
+            while True:
+                head = await reader.readuntil(b'\r\n\r\n')
+                path = head.split(b' ', 2)[1].decode()
+                first_seen.setdefault(path, time.monotonic())
+                writer.write(RESPONSE)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, '127.0.0.1', port)
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(main(),), daemon=True).start()
+
+
+def publish(store, port, workers, users, duration):
+    test_id = str(uuid.uuid4())
+    shards = plan_shards(users, ['local'], workers_per_region=workers)
+    store.put({
+        'testId': test_id,
+        'status': 'running',
+        'engine': 'python',
+        'target_url': f'http://127.0.0.1:{port}/{test_id}',
+        'concurrent_users': users,
+        'duration': duration,
+        'created_at': datetime.utcnow().isoformat(),
+        'shards': {shard['shardId']: {'region': shard['region'],
+                                      'concurrent_users': shard['concurrent_users']}
+                   for shard in shards}
+    })
+    return test_id, len(shards)
+
+
+def wait_for(condition, timeout):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        if time.monotonic() > deadline:
+            raise TimeoutError
+        time.sleep(0.01)
+    return time.monotonic()
+
+
+def run_test(pool, store, table, port, first_seen, args):
+    test_id, shards = publish(store, port, args.workers, args.users, args.duration)
+    began = time.monotonic()
+    started = pool.scale(shards)
+    first = wait_for(lambda: f'/{test_id}' in first_seen, args.boot_delay + 60)
+    done = wait_for(lambda: sum('summary' in item for item in table.items(test_id)) == shards,
+                    args.duration + 60)
+    return {
+        'engines_started': len(started),
+        'time_to_first_request_s': round(first - began, 3),
+        'time_to_results_s': round(done - began, 3),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-w', '--workers', type=int, default=2)
+    parser.add_argument('-c', '--users', type=int, default=4)
+    parser.add_argument('-t', '--duration', type=int, default=2)
+    parser.add_argument('--boot-delay', type=float, default=DEFAULT_BOOT_DELAY,
+                        help='Seconds a new engine takes before it looks for work')
+    parser.add_argument('--idle-timeout', type=float, default=3.0)
+    parser.add_argument('--port', type=int, default=8791)
+    args = parser.parse_args()
+
+    first_seen = {}
+    serve(args.port, first_seen)
+    results_dir = tempfile.mkdtemp(prefix='pool-results-')
+    manager, store = worker_pool.shared_claim_store()
+    provider = worker_pool.LocalProcessProvider(store, results_dir, args.idle_timeout, args.boot_delay)
+    pool = worker_pool.WorkerPool(store, provider, max_workers=args.workers)
+    table = worker_pool.JsonLinesTable(results_dir)
+    try:
+        cold = run_test(pool, store, table, args.port, first_seen, args)
+        warm = run_test(pool, store, table, args.port, first_seen, args)
+        idle_at = time.monotonic()
+        wait_for(lambda: not provider.live(), args.idle_timeout + 30)
+        scale_down = time.monotonic() - idle_at
+    finally:
+        manager.shutdown()
+
+    print(json.dumps({
+        'engines': args.workers,
+        'boot_delay_s': args.boot_delay,
+        'claim_poll_interval_s': work_queue.DEFAULT_POLL_INTERVAL,
+        'cold': cold,
+        'warm': warm,
+        'scale_down_s': round(scale_down, 3),
+    }, indent=2))
+
+
+if __name__ == '__main__':
+    main()
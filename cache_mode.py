@@ -0,0 +1,90 @@
+"""Cache-busting and cache-layer classification for cache-aware tests.
+
+A cache-aware test sends a configurable share of its requests with a unique
+query string or cookie so they miss the caches, and classifies every response
+by the layer that served it:
+
+- edge_hit: CloudFront (or another shared cache) answered without the origin,
+  going by X-Cache or a non-zero Age header.
+- page_cache_hit: the request reached WordPress but WP Super Cache served a
+  cached page, going by its header or the comment it appends to the HTML.
+- miss: WordPress built the page. Redis and OpCache hits cannot be told apart
+  from the outside and count as misses.
+
+Results keep a separate histogram and counters per class, so origin capacity
+can be read apart from edge capacity.
+"""
+import zlib
+
+EDGE_HIT = 'edge_hit'
+PAGE_CACHE_HIT = 'page_cache_hit'
+MISS = 'miss'
+CLASSES = (EDGE_HIT, PAGE_CACHE_HIT, MISS)
+
+BUST_METHODS = ('query', 'cookie')
+DEFAULT_BUST_PARAM = 'lt_nocache'
+# WP Super Cache never serves cached pages to commenters
+DEFAULT_BUST_COOKIE = 'comment_author_loadtest'
+
+SUPER_CACHE_MARKER = b'WP-Super-Cache'
+# The marker comment is appended at the very end of the page
+MARKER_TAIL_BYTES = 512
+
+
+def classify(headers, body=b''):
+    """Return the cache class of a response from its lowercased headers and body."""
+    x_cache = headers.get('x-cache', '').lower()
+    if x_cache.startswith(('hit', 'refreshhit')):
+        return EDGE_HIT
+    if not x_cache:
+        try:
+            if int(headers.get('age', '0')) > 0:
+                return EDGE_HIT
+        except ValueError:
+            pass
+
+    if 'wp-super-cache' in headers or _has_marker(headers, body):
+        return PAGE_CACHE_HIT
+    return MISS
+
+
+def _has_marker(headers, body):
+    if not body:
+        return False
+    if headers.get('content-encoding', '').lower() in ('gzip', 'deflate'):
+        try:
+            # wbits=47 accepts both gzip and zlib framing
+            body = zlib.decompressobj(47).decompress(body)
+        except zlib.error:
+            return False
+    return SUPER_CACHE_MARKER in body[-MARKER_TAIL_BYTES:]
+
+
+class CacheBuster:
+    """Turns a share of requests into unique, uncacheable ones."""
+
+    def __init__(self, ratio, method='query', name=None):
+        ratio = float(ratio)
+        if not 0.0 <= ratio <= 1.0:
+            raise ValueError('Cache-bust ratio must be between 0 and 1')
+        if method not in BUST_METHODS:
+            raise ValueError(f'Unknown cache-bust method: {method}')
+        self.ratio = ratio
+        self.method = method
+        self.name = name or (DEFAULT_BUST_PARAM if method == 'query' else DEFAULT_BUST_COOKIE)
+
+    @classmethod
+    def from_spec(cls, spec):
+        if not spec:
+            return None
+        return cls(spec.get('bust_ratio', 0), spec.get('bust_method', 'query'), spec.get('bust_name'))
+
+    def request(self, target, path, rng):
+        """Return request bytes for path, busted with probability ratio, else None."""
+        if not self.ratio or rng.random() >= self.ratio:
+            return None
+        token = '%016x' % rng.getrandbits(64)
+        if self.method == 'query':
+            separator = '&' if '?' in path else '?'
+            return target.request_bytes(f'{path}{separator}{self.name}={token}')
+        return target.request_bytes(path, f'Cookie: {self.name}={token}\r\n')
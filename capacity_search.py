@@ -0,0 +1,180 @@
+"""SLO-driven capacity search.
+
+Replaces running a test at 100 users, then 250, and comparing the tables by
+hand. A capacity test runs short steps at increasing load (concurrent users
+or open-loop rate), multiplying the level until a step breaks the SLO, then
+bisects between the last passing and first failing level. A step whose SLO is
+clearly broken part way through is cut short.
+
+The search itself only sees `run_step(level)`, so it is independent
+of how load is generated; load_worker drives it with the load engine.
+"""
+import re
+
+from latency_histogram import LatencyHistogram
+from timeseries import SERIES_SIGNIFICANT_FIGURES
+
+DIMENSIONS = ('users', 'rate')
+DEFAULT_FACTOR = 2.0
+DEFAULT_TOLERANCE = 0.1
+DEFAULT_MAX_STEPS = 12
+DEFAULT_STEP_DURATION = 60
+
+# Seconds of a step ignored by the early-abort check while connections warm up
+ABORT_WARMUP = 5
+# How far past the SLO a running step must be before it is cut short
+ABORT_LATENCY_FACTOR = 2.0
+ABORT_ERROR_FACTOR = 5.0
+ABORT_MIN_ERROR_RATE = 0.05
+ABORT_MIN_REQUESTS = 100
+
+PERCENTILE_KEY = re.compile(r'^p(\d+(?:_\d+)?)_ms$')
+
+
+class Slo:
+    """Latency percentile and error-rate objective, e.g. p95 < 2 s, errors < 0.1%."""
+
+    def __init__(self, percentile=95.0, latency_ms=2000.0, error_rate=0.001):
+        self.percentile = float(percentile)
+        self.latency_ms = float(latency_ms)
+        self.error_rate = float(error_rate)
+        if not 0 < self.percentile <= 100 or self.latency_ms <= 0 or not 0 <= self.error_rate < 1:
+            raise ValueError('SLO needs a percentile in (0, 100], a positive latency and an error rate in [0, 1)')
+
+    @classmethod
+    def from_spec(cls, spec):
+        """Build from {'p95_ms': 2000, 'error_rate': 0.001} or the attribute names."""
+        spec = dict(spec or {})
+        for key in list(spec):
+            match = PERCENTILE_KEY.match(key)
+            if match:
+                spec['percentile'] = match.group(1).replace('_', '.')
+                spec['latency_ms'] = spec.pop(key)
+        return cls(spec.get('percentile', 95), spec.get('latency_ms', 2000),
+                   spec.get('error_rate', 0.001))
+
+    def to_spec(self):
+        return {'percentile': str(self.percentile), 'latency_ms': str(self.latency_ms),
+                'error_rate': str(self.error_rate)}
+
+    def evaluate(self, stats):
+        """Return (latency_ms, error_rate, passed) for engine stats."""
+        histogram = LatencyHistogram.decode(stats['histogram'])
+        latency_ms = histogram.value_at_percentile(self.percentile) / 1000.0 if histogram.total else 0.0
+        rate = error_rate(stats['requests'], stats['failures'], stats['non_2xx'])
+        passed = stats['requests'] > 0 and latency_ms <= self.latency_ms and rate <= self.error_rate
+        return latency_ms, rate, passed
+
+
+def error_rate(requests, failures, non_2xx=0):
+    """Share of attempts that failed or got a non-2xx response.
+
+    requests counts every response, non-2xx ones included; failures are the
+    attempts that got none (connect errors, timeouts).
+    """
+    attempts = requests + failures
+    return (failures + non_2xx) / attempts if attempts else 0.0
+
+
+class AbortMonitor:
+    """Watches a running step's per-second buckets and calls abort once the SLO is clearly broken.
+
+    Buckets are merged per-second dicts as passed to load_engine's on_series.
+    """
+
+    def __init__(self, slo, abort):
+        self.slo = slo
+        self.abort = abort
+        self.first_second = None
+        self.requests = 0
+        self.errors = 0
+        self.latency = LatencyHistogram(significant_figures=SERIES_SIGNIFICANT_FIGURES)
+        self.aborted = False
+
+    def __call__(self, merged):
+        for entry in merged:
+            if self.first_second is None:
+                self.first_second = entry['second']
+            if entry['second'] - self.first_second < ABORT_WARMUP:
+                continue
+            self.requests += entry['requests']
+            self.errors += entry['errors']
+            self.latency.merge(entry['latency'])
+        if self.aborted or self.requests < ABORT_MIN_REQUESTS:
+            return
+
+        latency_ms = self.latency.value_at_percentile(self.slo.percentile) / 1000.0
+        # Only a guide: HTTP errors are also counted in requests, failed connections are not
+        rate = min(1.0, self.errors / self.requests)
+        if (latency_ms > self.slo.latency_ms * ABORT_LATENCY_FACTOR
+                or rate > max(self.slo.error_rate * ABORT_ERROR_FACTOR, ABORT_MIN_ERROR_RATE)):
+            self.aborted = True
+            self.abort()
+
+
+def next_level(level, dimension):
+    return max(1, int(round(level))) if dimension == 'users' else round(level, 1)
+
+
+def search(run_step, slo, start, maximum, dimension='users', factor=DEFAULT_FACTOR,
+           tolerance=DEFAULT_TOLERANCE, max_steps=DEFAULT_MAX_STEPS, on_step=None):
+    """Find the highest load level that meets slo.
+
+    run_step(level) returns engine stats (as from load_engine.run) with an
+    'aborted' flag, and a 'stopped' flag when the test was stopped, which
+    ends the search with the steps measured so far; on_step, if given, is called with each step's record.
+    Returns {'steps', 'max_sustainable', 'breaking_level'}, where
+    max_sustainable is the passing step with the highest throughput.
+    """
+    if dimension not in DIMENSIONS:
+        raise ValueError(f'Unknown capacity dimension: {dimension}')
+    steps = []
+    good = bad = None
+    level = next_level(start, dimension)
+    while len(steps) < max_steps:
+        stats = run_step(level)
+        latency_ms, rate, passed = slo.evaluate(stats)
+        step = {
+            'level': level,
+            'requests_per_second': stats['requests_per_second'],
+            'latency_ms': latency_ms,
+            'error_rate': rate,
+            'passed': passed and not stats.get('aborted') and not stats.get('stopped'),
+            'aborted': bool(stats.get('aborted')),
+            'stopped': bool(stats.get('stopped')),
+            'latency': stats['latency'],
+        }
+        steps.append(step)
+        if on_step is not None:
+            on_step(step)
+        if step['stopped']:
+            # A cut-short step says nothing about its level
+            break
+
+        if step['passed']:
+            good = level if good is None else max(good, level)
+        else:
+            bad = level if bad is None else min(bad, level)
+
+        if bad is None:
+            if level >= maximum:
+                break
+            candidate = min(maximum, level * factor)
+        elif good is None:
+            # Even the starting level fails: search downwards
+            candidate = level / factor
+        else:
+            if (bad - good) / good <= tolerance:
+                break
+            candidate = (good + bad) / 2
+        candidate = next_level(candidate, dimension)
+        if candidate == level or candidate in (good, bad) or candidate < 1:
+            break
+        level = candidate
+
+    passing = [step for step in steps if step['passed']]
+    return {
+        'steps': steps,
+        'max_sustainable': max(passing, key=lambda step: step['requests_per_second']) if passing else None,
+        'breaking_level': bad,
+    }
@@ -0,0 +1,89 @@
+"""Clock-offset estimates for workers that start on a shared barrier.
+
+start_test publishes one start-at timestamp for every worker of a test. Each
+worker estimates how far its clock is from true time before waiting on it,
+preferring the Amazon Time Sync Service (SNTP on the link-local address every
+EC2 instance can reach) and falling back to the target's HTTP Date header,
+which is only good to about a second. The offset corrects both the barrier
+wait and the per-second series keys, so the shards' series line up on one
+timeline; the uncertainty (half the best round trip, plus the Date header's
+resolution) is reported with the results as the known skew.
+"""
+import socket
+import struct
+import time
+from email.utils import parsedate_to_datetime
+from urllib.request import Request, urlopen
+
+AMAZON_TIME_SYNC = '169.254.169.123'
+NTP_PORT = 123
+# Seconds between the NTP epoch (1900) and the Unix epoch (1970)
+NTP_EPOCH_DELTA = 2208988800
+DEFAULT_SAMPLES = 4
+DEFAULT_TIMEOUT = 1.0
+
+
+def _ntp_to_unix(data):
+    seconds, fraction = struct.unpack('!II', data)
+    return seconds - NTP_EPOCH_DELTA + fraction / 2 ** 32
+
+
+def sntp_sample(server=AMAZON_TIME_SYNC, port=NTP_PORT, timeout=DEFAULT_TIMEOUT, clock=time.time):
+    """One SNTP exchange; returns (offset, round_trip_delay) in seconds."""
+    # LI 0, version 4, mode 3 (client)
+    request = b'\x23' + b'\0' * 47
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.settimeout(timeout)
+        sent = clock()
+        sock.sendto(request, (server, port))
+        data, _ = sock.recvfrom(512)
+        received = clock()
+    if len(data) < 48:
+        raise ValueError('Short SNTP response')
+    server_received = _ntp_to_unix(data[32:40])
+    server_sent = _ntp_to_unix(data[40:48])
+    offset = ((server_received - sent) + (server_sent - received)) / 2
+    delay = (received - sent) - (server_sent - server_received)
+    return offset, delay
+
+
+def http_date_sample(url, timeout=DEFAULT_TIMEOUT * 5, clock=time.time):
+    """Offset from a server's Date header; returns (offset, round_trip_delay)."""
+    request = Request(url, method='HEAD', headers={'User-Agent': 'load-test-clock/1.0'})
+    sent = clock()
+    with urlopen(request, timeout=timeout) as response:
+        date = response.headers.get('Date')
+    received = clock()
+    if not date:
+        raise ValueError('No Date header')
+    # Date is truncated to the second: assume the middle of it
+    server_time = parsedate_to_datetime(date).timestamp() + 0.5
+    return server_time - (sent + received) / 2, received - sent
+
+
+def estimate_offset(samples=DEFAULT_SAMPLES, server=AMAZON_TIME_SYNC, fallback_url=None,
+                    sntp=sntp_sample, http_date=http_date_sample):
+    """Estimate this host's clock offset (true time minus local time).
+
+    Returns {'offset', 'uncertainty', 'source'} in seconds; source is 'sntp',
+    'http-date' or 'none' when neither could be reached (offset 0).
+    """
+    results = []
+    for _ in range(samples):
+        try:
+            results.append(sntp(server))
+        except (OSError, ValueError):
+            # Off EC2 the link-local server never answers; don't wait out every sample
+            break
+    if results:
+        # The sample with the shortest round trip has the tightest bound
+        offset, delay = min(results, key=lambda result: result[1])
+        return {'offset': offset, 'uncertainty': max(delay, 0.0) / 2, 'source': 'sntp'}
+
+    if fallback_url:
+        try:
+            offset, delay = http_date(fallback_url)
+            return {'offset': offset, 'uncertainty': delay / 2 + 0.5, 'source': 'http-date'}
+        except (OSError, ValueError):
+            pass
+    return {'offset': 0.0, 'uncertainty': None, 'source': 'none'}
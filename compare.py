@@ -0,0 +1,168 @@
+"""Statistical comparison of a candidate test against a baseline.
+
+Latency percentiles are compared with a bootstrap over each test's merged
+latency histogram: resampling a histogram of n requests is one multinomial
+draw over its buckets, so every resample is a row of bucket counts and the
+percentiles of all resamples come out of one cumulative sum. That keeps a
+comparison of millions of requests to a few NumPy calls. Resamples are drawn
+in chunks of at most REPLICATE_CHUNK_CELLS cells, so memory stays bounded
+however many buckets a histogram has; only each chunk's percentiles are
+kept. Throughput is
+bootstrapped over the per-second request counts and the error rate over the
+request count.
+
+NumPy is optional: without it the point deltas are still reported, but with
+no confidence intervals, and regressions are judged on the point estimates.
+"""
+import math
+
+DEFAULT_PERCENTILES = (50, 90, 95, 99)
+DEFAULT_RESAMPLES = 1000
+DEFAULT_CONFIDENCE = 0.95
+# Relative change in a percentile or throughput that counts as a regression
+DEFAULT_THRESHOLD = 0.05
+# Absolute increase in the error rate that counts as a regression
+DEFAULT_ERROR_THRESHOLD = 0.001
+# Resamples x buckets (or seconds) drawn at once; 8 MB per int64 array
+REPLICATE_CHUNK_CELLS = 1 << 20
+
+
+class Sample:
+    """What compare needs from one test."""
+
+    def __init__(self, histogram, rps=(), requests=0, errors=0):
+        # requests counts every attempt, errors the failed or non-2xx ones
+        self.histogram = histogram
+        self.rps = list(rps)
+        self.requests = requests
+        self.errors = errors
+
+    @property
+    def error_rate(self):
+        return self.errors / self.requests if self.requests else 0.0
+
+    @property
+    def throughput(self):
+        return sum(self.rps) / len(self.rps) if self.rps else 0.0
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        return None
+    return numpy
+
+
+def _chunks(resamples, width, chunk_cells):
+    rows = max(1, chunk_cells // max(1, width))
+    for start in range(0, resamples, rows):
+        yield min(rows, resamples - start)
+
+
+def _percentile_replicates(np, histogram, percentiles, resamples, rng, chunk_cells=REPLICATE_CHUNK_CELLS):
+    values, counts = histogram.buckets()
+    values = np.asarray(values, dtype=np.float64) / 1000.0
+    counts = np.asarray(counts, dtype=np.int64)
+    total = int(counts.sum())
+    targets = {p: max(1, math.ceil(p / 100.0 * total)) for p in percentiles}
+    result = {p: [] for p in percentiles}
+    for rows in _chunks(resamples, len(counts), chunk_cells):
+        draws = rng.multinomial(total, counts / total, size=rows)
+        cumulative = np.cumsum(draws, axis=1)
+        for p, target in targets.items():
+            # First bucket whose running count reaches the target, per resample
+            result[p].append(values[(cumulative >= target).argmax(axis=1)])
+    return {p: np.concatenate(chunks) for p, chunks in result.items()}
+
+
+def _mean_replicates(np, data, resamples, rng, chunk_cells=REPLICATE_CHUNK_CELLS):
+    data = np.asarray(data, dtype=np.float64)
+    means = []
+    for rows in _chunks(resamples, len(data), chunk_cells):
+        picks = rng.integers(0, len(data), size=(rows, len(data)))
+        means.append(data[picks].mean(axis=1))
+    return np.concatenate(means)
+
+
+def _delta(baseline, candidate, relative_replicates=None, bounds=None, np=None):
+    entry = {
+        'baseline': baseline,
+        'candidate': candidate,
+        'delta': candidate - baseline,
+        'relative': (candidate - baseline) / baseline if baseline else None,
+        'ci': None,
+    }
+    if relative_replicates is not None:
+        low, high = np.quantile(relative_replicates, bounds)
+        entry['ci'] = [float(low), float(high)]
+    return entry
+
+
+def compare(baseline, candidate, percentiles=DEFAULT_PERCENTILES, resamples=DEFAULT_RESAMPLES,
+            confidence=DEFAULT_CONFIDENCE, threshold=DEFAULT_THRESHOLD,
+            error_threshold=DEFAULT_ERROR_THRESHOLD, seed=0):
+    """Compare two Samples and flag regressions of the candidate.
+
+    Latency and throughput CIs are on the relative change (candidate vs
+    baseline); the error-rate CI is on the absolute change. A metric is a
+    regression when its whole CI is past the threshold in the bad direction.
+    """
+    np = _numpy()
+    rng = np.random.default_rng(seed) if np is not None else None
+    bounds = [(1 - confidence) / 2, 1 - (1 - confidence) / 2]
+    result = {
+        'method': 'bootstrap' if np is not None else 'point',
+        'resamples': resamples if np is not None else 0,
+        'confidence': confidence,
+        'latency': {},
+        'regressions': [],
+    }
+
+    if baseline.histogram is not None and candidate.histogram is not None \
+            and baseline.histogram.total and candidate.histogram.total:
+        base_reps = cand_reps = None
+        if np is not None:
+            base_reps = _percentile_replicates(np, baseline.histogram, percentiles, resamples, rng)
+            cand_reps = _percentile_replicates(np, candidate.histogram, percentiles, resamples, rng)
+        for p in percentiles:
+            name = f'p{p:g}_ms'.replace('.', '_')
+            relative = None
+            if np is not None:
+                relative = (cand_reps[p] - base_reps[p]) / np.maximum(base_reps[p], 1e-3)
+            entry = _delta(baseline.histogram.value_at_percentile(p) / 1000.0,
+                           candidate.histogram.value_at_percentile(p) / 1000.0,
+                           relative, bounds, np)
+            low = entry['ci'][0] if entry['ci'] else entry['relative']
+            entry['regression'] = low is not None and low > threshold
+            result['latency'][name] = entry
+            if entry['regression']:
+                result['regressions'].append(f'latency.{name}')
+
+    if baseline.rps and candidate.rps:
+        relative = None
+        if np is not None:
+            base_reps = _mean_replicates(np, baseline.rps, resamples, rng)
+            cand_reps = _mean_replicates(np, candidate.rps, resamples, rng)
+            relative = (cand_reps - base_reps) / np.maximum(base_reps, 1e-9)
+        entry = _delta(baseline.throughput, candidate.throughput, relative, bounds, np)
+        high = entry['ci'][1] if entry['ci'] else entry['relative']
+        entry['regression'] = high is not None and high < -threshold
+        result['throughput'] = entry
+        if entry['regression']:
+            result['regressions'].append('throughput')
+
+    entry = _delta(baseline.error_rate, candidate.error_rate)
+    if np is not None and baseline.requests and candidate.requests:
+        base_reps = rng.binomial(baseline.requests, baseline.error_rate, resamples) / baseline.requests
+        cand_reps = rng.binomial(candidate.requests, candidate.error_rate, resamples) / candidate.requests
+        low, high = np.quantile(cand_reps - base_reps, bounds)
+        entry['ci'] = [float(low), float(high)]
+    low = entry['ci'][0] if entry['ci'] else entry['delta']
+    entry['regression'] = low > error_threshold
+    result['error_rate'] = entry
+    if entry['regression']:
+        result['regressions'].append('error_rate')
+
+    result['regression'] = bool(result['regressions'])
+    return result
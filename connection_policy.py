@@ -0,0 +1,97 @@
+"""Connection policies: how virtual users open, reuse and resume connections.
+
+Browsers arrive with fresh connections and resume their TLS session when
+they come back; `ab -k` keeps one connection per user for the whole test,
+which hides most of the handshake load on the ALB. A policy sets:
+
+- requests_per_connection: keep a connection for at most this many requests,
+  then open a new one; 1 opens a connection for every request, 0 keeps it
+  for as long as the server does (the engine's default).
+- tls_sessions: resume the previous connection's TLS session (session ID or
+  ticket) when reconnecting, so the handshake is an abbreviated one.
+
+A test can mix policies, each run by a share of the users. The results keep
+throughput, connections, full and resumed handshakes and the TLS handshake
+histogram per policy, so the cost of each kind of churn can be read apart.
+
+    [{"name": "browsers", "share": 0.8, "requests_per_connection": 6, "tls_sessions": true},
+     {"name": "bots", "share": 0.2, "requests_per_connection": 1, "tls_sessions": false}]
+"""
+import contextvars
+import ssl
+
+DEFAULT_NAME = 'default'
+
+# Session the next TLS handshake in this context resumes (see ResumingContext)
+resume_session = contextvars.ContextVar('resume_session', default=None)
+
+
+class ConnectionPolicy:
+    def __init__(self, name=DEFAULT_NAME, share=1.0, requests_per_connection=0, tls_sessions=False):
+        share = float(share)
+        requests_per_connection = int(requests_per_connection)
+        if share <= 0:
+            raise ValueError(f'Share of policy {name} must be positive')
+        if requests_per_connection < 0:
+            raise ValueError(f'requests_per_connection of policy {name} must be 0 (unlimited) or more')
+        self.name = str(name)
+        self.share = share
+        self.requests_per_connection = requests_per_connection
+        self.tls_sessions = bool(tls_sessions)
+
+    @classmethod
+    def from_spec(cls, spec):
+        return cls(spec.get('name', DEFAULT_NAME), spec.get('share', 1.0),
+                   spec.get('requests_per_connection', 0), spec.get('tls_sessions', False))
+
+    def to_spec(self):
+        # The share as a string, since the spec is stored in DynamoDB
+        return {
+            'name': self.name,
+            'share': str(self.share),
+            'requests_per_connection': self.requests_per_connection,
+            'tls_sessions': self.tls_sessions,
+        }
+
+
+def parse(spec):
+    """Turn a policy spec, or a list of them, into a list of ConnectionPolicy."""
+    if not spec:
+        return []
+    if isinstance(spec, dict):
+        spec = [spec]
+    policies = [ConnectionPolicy.from_spec(entry) for entry in spec]
+    names = [policy.name for policy in policies]
+    if len(set(names)) != len(names):
+        raise ValueError('Connection policy names must be unique')
+    return policies
+
+
+def assign(policies, users):
+    """The policy of each of users, in proportion to the shares.
+
+    Users are dealt out in order, each to the policy furthest behind its
+    share, so any prefix of the users is split as evenly as possible.
+    """
+    total = sum(policy.share for policy in policies)
+    counts = [0] * len(policies)
+    assigned = []
+    for i in range(users):
+        index = max(range(len(policies)),
+                    key=lambda k: policies[k].share / total * (i + 1) - counts[k])
+        counts[index] += 1
+        assigned.append(policies[index])
+    return assigned
+
+
+class ResumingContext(ssl.SSLContext):
+    """Client SSLContext that resumes the session in resume_session, if any.
+
+    asyncio creates the TLS object itself, from a callback scheduled while
+    the connection opens, and offers no way to pass a session; the callback
+    does run in the opening task's context, where resume_session is set.
+    """
+
+    def wrap_bio(self, incoming, outgoing, server_side=False, server_hostname=None, session=None):
+        return super().wrap_bio(incoming, outgoing, server_side, server_hostname,
+                                session=session or resume_session.get())
@@ -0,0 +1,211 @@
+"""Load-generator metrics as CloudWatch Embedded Metric Format (EMF) records.
+
+Workers already merge their requests into one bucket per second (see
+timeseries). EmfPublisher turns each bucket into an EMF log record: a JSON
+object that CloudWatch Logs extracts metrics from, so client-observed
+throughput, errors and latency land in CloudWatch next to the ALB, EFS and
+Aurora metrics without a PutMetricData call per metric.
+
+Per second and shard the record carries Requests, Errors and Bytes, also
+rolled up by TestId (sums add up across shards), and LatencyP50/P90/P99 in
+ms, which only make sense per shard. All are high-resolution (1 s) metrics.
+
+Records go to a sink:
+
+- CloudWatchLogsSink: put_log_events to a log group, one stream per shard,
+  buffering up to flush_interval seconds of records per call.
+- FileSink: JSON lines appended to a file.
+- StdoutSink: JSON lines on stdout, which the Lambda runtime and the
+  CloudWatch agent both pick up as EMF.
+
+sink_from_url picks one: 'cloudwatch:<log group>', 'file:<path>' or 'stdout'.
+"""
+import json
+import sys
+import threading
+import time
+
+DEFAULT_NAMESPACE = 'LoadTest'
+DEFAULT_FLUSH_INTERVAL = 5.0
+# put_log_events limits: events per call, and bytes per call counting 26 per event
+MAX_BATCH_EVENTS = 10000
+MAX_BATCH_BYTES = 1048576
+EVENT_OVERHEAD_BYTES = 26
+LATENCY_PERCENTILES = (50, 90, 99)
+
+
+class EmfPublisher:
+    """on_series callback (see load_engine.run) that writes one EMF record per second."""
+
+    def __init__(self, sink, test_id, shard_id, namespace=DEFAULT_NAMESPACE, properties=None):
+        self.sink = sink
+        self.test_id = test_id
+        self.shard_id = shard_id
+        self.namespace = namespace
+        # Searchable in Logs Insights, but not metric dimensions
+        self.properties = properties or {}
+
+    def record(self, entry):
+        """The EMF record of a merged per-second bucket (see timeseries.merge_buckets)."""
+        metrics = [
+            {'Name': 'Requests', 'Unit': 'Count', 'StorageResolution': 1},
+            {'Name': 'Errors', 'Unit': 'Count', 'StorageResolution': 1},
+            {'Name': 'Bytes', 'Unit': 'Bytes', 'StorageResolution': 1},
+        ]
+        directives = [{
+            'Namespace': self.namespace,
+            'Dimensions': [['TestId', 'ShardId'], ['TestId']],
+            'Metrics': metrics,
+        }]
+        record = dict(self.properties, **{
+            'TestId': self.test_id,
+            'ShardId': self.shard_id,
+            'Requests': entry['requests'],
+            'Errors': entry['errors'],
+            'Bytes': entry['bytes'],
+        })
+        histogram = entry['latency']
+        if histogram.total:
+            # Percentiles cannot be combined across shards, so they keep the shard dimension
+            directives.append({
+                'Namespace': self.namespace,
+                'Dimensions': [['TestId', 'ShardId']],
+                'Metrics': [{'Name': f'LatencyP{p}', 'Unit': 'Milliseconds', 'StorageResolution': 1}
+                            for p in LATENCY_PERCENTILES],
+            })
+            for p in LATENCY_PERCENTILES:
+                record[f'LatencyP{p}'] = histogram.value_at_percentile(p) / 1000.0
+        record['_aws'] = {'Timestamp': int(entry['second']) * 1000, 'CloudWatchMetrics': directives}
+        return record
+
+    def __call__(self, merged):
+        try:
+            self.sink.write([self.record(entry) for entry in merged])
+        except Exception as e:
+            # Lost metrics must not abort the test; the results table still has every second
+            print(f'Error publishing metrics: {e}')
+
+    def close(self):
+        self.sink.close()
+
+
+class Sink:
+    def write(self, records):
+        """Take EMF records (dicts), oldest first."""
+        raise NotImplementedError
+
+    def close(self):
+        """Write out anything still buffered."""
+
+
+class StdoutSink(Sink):
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+
+    def write(self, records):
+        self.stream.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records))
+        self.stream.flush()
+
+
+class FileSink(Sink):
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, records):
+        with open(self.path, 'a') as f:
+            f.write(''.join(json.dumps(record, separators=(',', ':')) + '\n' for record in records))
+
+
+class CloudWatchLogsSink(Sink):
+    """Batches records into put_log_events calls on one log stream.
+
+    The log group must exist; the stream is created on the first call.
+    Records are held until flush_interval has passed since the last call or
+    a batch limit is reached, so a shard makes at most one call per interval.
+    latencies keeps the duration of every call, in seconds.
+    """
+
+    def __init__(self, log_group, log_stream, client=None, region=None,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, clock=time.monotonic):
+        self.log_group = log_group
+        self.log_stream = log_stream
+        self._client = client
+        self.region = region
+        self.flush_interval = flush_interval
+        self.clock = clock
+        self.pending = []
+        self.pending_bytes = 0
+        self.last_flush = clock()
+        self.stream_ready = False
+        self.latencies = []
+        self.lock = threading.Lock()
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client('logs', region_name=self.region)
+        return self._client
+
+    def write(self, records):
+        with self.lock:
+            for record in records:
+                message = json.dumps(record, separators=(',', ':'))
+                size = len(message.encode('utf-8')) + EVENT_OVERHEAD_BYTES
+                if (len(self.pending) >= MAX_BATCH_EVENTS
+                        or self.pending_bytes + size > MAX_BATCH_BYTES):
+                    self._flush()
+                self.pending.append({'timestamp': record['_aws']['Timestamp'], 'message': message})
+                self.pending_bytes += size
+            if self.clock() - self.last_flush >= self.flush_interval:
+                self._flush()
+
+    def close(self):
+        with self.lock:
+            self._flush()
+
+    def _flush(self):
+        self.last_flush = self.clock()
+        if not self.pending:
+            return
+        events, self.pending, self.pending_bytes = self.pending, [], 0
+        if not self.stream_ready:
+            self._create_stream()
+        began = time.perf_counter()
+        try:
+            self.client.put_log_events(
+                logGroupName=self.log_group,
+                logStreamName=self.log_stream,
+                # Calls must be in timestamp order, which buckets from several flushes may not be
+                logEvents=sorted(events, key=lambda event: event['timestamp'])
+            )
+        finally:
+            self.latencies.append(time.perf_counter() - began)
+
+    def _create_stream(self):
+        try:
+            self.client.create_log_stream(logGroupName=self.log_group, logStreamName=self.log_stream)
+        except Exception as e:
+            # botocore's ClientError; checked by code so botocore need not be imported here
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') != 'ResourceAlreadyExistsException':
+                raise
+        self.stream_ready = True
+
+
+def sink_from_url(url, log_stream=None, client=None, region=None):
+    """Return the sink for 'cloudwatch:<log group>', 'file:<path>' or 'stdout'.
+
+    log_stream names the CloudWatch Logs stream, e.g. '<test id>/<shard id>',
+    and region the log group's region.
+    """
+    if url == 'stdout':
+        return StdoutSink()
+    if url.startswith('cloudwatch:'):
+        log_group = url[len('cloudwatch:'):]
+        if not log_group or not log_stream:
+            raise ValueError(f'CloudWatch Logs sink needs a log group and stream: {url}')
+        return CloudWatchLogsSink(log_group, log_stream, client, region)
+    if url.startswith('file:'):
+        url = url[len('file:'):]
+    return FileSink(url)
@@ -1,9 +1,126 @@
+import base64
 import json
-import boto3
 import os
-import uuid
+import threading
+import time
 from datetime import datetime
 
+DEFAULT_LIST_LIMIT = 50
+MAX_LIST_LIMIT = 100
+
+# Read-only actions a batch request may contain, and how many run at once
+BATCH_ACTIONS = ('status', 'results', 'list')
+MAX_BATCH_REQUESTS = 100
+BATCH_WORKERS = 16
+BATCH_GET_ATTEMPTS = 4
+
+# Cap on bootstrap resamples for compare
+MAX_RESAMPLES = 10000
+
+# Seconds from start_test to the moment every shard starts sending: launched
+# instances need to boot and install the worker, pooled engines only to claim
+DEFAULT_START_DELAY = 240
+POOLED_START_DELAY = 15
+
+# Attributes returned by list when only a summary is requested
+SUMMARY_FIELDS = ('testId', 'name', 'status', 'target_url', 'concurrent_users',
+                  'duration', 'created_at', 'started_at')
+
+# boto3 and the helper modules are imported on first use so a cold start only
+# pays for what the requested action needs; clients live for the whole
+# execution environment and are shared by warm invocations.
+_dynamodb = None
+_tables = {}
+_backends = {}
+_result_cache = None
+_init_lock = threading.Lock()
+# boto3 resources are not thread-safe: batch's worker threads each get their own
+_thread = threading.local()
+
+# Statuses after which neither the config item nor the results change
+TERMINAL_STATUSES = ('completed', 'stopped', 'failed')
+
+def new_dynamodb_resource(session=None):
+    import boto3
+    
+    # DYNAMODB_ENDPOINT points at DynamoDB Local for runs without AWS
+    return (session or boto3).resource('dynamodb', endpoint_url=os.environ.get('DYNAMODB_ENDPOINT'))
+
+def get_dynamodb():
+    global _dynamodb
+    
+    resource = getattr(_thread, 'dynamodb', None)
+    if resource is not None:
+        return resource
+    if _dynamodb is None:
+        with _init_lock:
+            if _dynamodb is None:
+                _dynamodb = new_dynamodb_resource()
+    return _dynamodb
+
+def get_table(env_name):
+    name = os.environ[env_name]
+    tables = getattr(_thread, 'tables', _tables)
+    table = tables.get(name)
+    if table is None:
+        table = tables[name] = get_dynamodb().Table(name)
+    return table
+
+def init_batch_thread():
+    # A session and resource per batch worker thread, instead of sharing the module's
+    import boto3.session
+    
+    _thread.dynamodb = new_dynamodb_resource(boto3.session.Session())
+    _thread.tables = {}
+
+def get_launch_backend():
+    from launch_backends import get_backend
+    
+    name = os.environ.get('LAUNCH_BACKEND', 'ec2')
+    if name not in _backends:
+        kwargs = {}
+        if name == 'ec2' and 'INSTANCE_PROFILE' in os.environ:
+            kwargs['instance_profile'] = os.environ['INSTANCE_PROFILE']
+        if name == 'local' and 'LOCAL_PROCESSES' in os.environ:
+            kwargs['processes'] = int(os.environ['LOCAL_PROCESSES'])
+        if name == 'pool':
+            kwargs['pool'] = get_worker_pool()
+        _backends[name] = get_backend(name, **kwargs)
+    return _backends[name]
+
+def get_worker_pool():
+    from work_queue import DynamoDbClaimStore
+    from worker_pool import (DEFAULT_IDLE_TIMEOUT, DEFAULT_MAX_WORKERS, DEFAULT_MIN_IDLE,
+                             DEFAULT_POOL_NAME, Ec2PoolProvider, WorkerPool)
+    
+    idle_timeout = int(os.environ.get('POOL_IDLE_TIMEOUT', DEFAULT_IDLE_TIMEOUT))
+    region = os.environ.get('POOL_REGION', os.environ.get('AWS_REGION', 'us-east-1'))
+    provider = Ec2PoolProvider(
+        pool_user_data(idle_timeout, region),
+        name=os.environ.get('POOL_NAME', DEFAULT_POOL_NAME),
+        region=region,
+        instance_profile=os.environ.get('INSTANCE_PROFILE')
+    )
+    return WorkerPool(
+        DynamoDbClaimStore(get_table('CONFIG_TABLE')),
+        provider,
+        min_idle=int(os.environ.get('POOL_MIN_IDLE', DEFAULT_MIN_IDLE)),
+        max_workers=int(os.environ.get('POOL_MAX_WORKERS', DEFAULT_MAX_WORKERS))
+    )
+
+def get_result_cache():
+    global _result_cache
+    
+    if _result_cache is None:
+        from result_cache import ResultCache
+        with _init_lock:
+            if _result_cache is None:
+                _result_cache = ResultCache(
+                    max_entries=int(os.environ.get('RESULT_CACHE_ENTRIES', 256)),
+                    ttl=float(os.environ.get('RESULT_CACHE_TTL', 5))
+                )
+    return _result_cache
+
 def handler(event, context):
     try:
         # Handle API Gateway proxy integration
@@ -18,27 +135,11 @@ def handler(event, context):
             body = event
         
         action = body.get('action', 'list')
+        headers = {name.lower(): value for name, value in (event.get('headers') or {}).items()}
         
-        if action == 'create':
-            return create_test(body)
-        elif action == 'start':
-            return start_test(body)
-        elif action == 'stop':
-            return stop_test(body)
-        elif action == 'status':
-            return get_test_status(body)
-        elif action == 'results':
-            return get_test_results(body)
-        elif action == 'list':
-            return list_tests()
-        else:
-            return {
-                'statusCode': 200,
-                'body': json.dumps({
-                    'message': 'Load Test Manager',
-                    'actions': ['create', 'start', 'stop', 'status', 'results', 'list']
-                })
-            }
+        if action == 'batch':
+            return batch(body, headers)
+        return dispatch(action, body, headers)
             
     except Exception as e:
         return {
@@ -46,38 +147,285 @@ def handler(event, context):
             'body': json.dumps({'error': str(e)})
         }
 
+def dispatch(action, body, headers):
+    if action == 'create':
+        return create_test(body)
+    elif action == 'start':
+        return start_test(body)
+    elif action == 'stop':
+        return stop_test(body)
+    elif action == 'status':
+        return get_test_status(body, headers)
+    elif action == 'results':
+        return get_test_results(body, headers)
+    elif action == 'list':
+        return list_tests(body)
+    elif action == 'capacity':
+        return capacity_test(body)
+    elif action == 'compare':
+        return compare_tests(body)
+    elif action == 'pool':
+        return pool_status(body)
+    else:
+        return {
+            'statusCode': 200,
+            'body': json.dumps({
+                'message': 'Load Test Manager',
+                'actions': ['create', 'start', 'stop', 'status', 'results', 'list', 'batch', 'capacity', 'compare',
+                            'pool']
+            })
+        }
+
+def batch(event, headers):
+    # Either explicit sub-requests or testIds expanded into status/results requests
+    requests = event.get('requests')
+    if requests is None:
+        include = event.get('include', ['status'])
+        requests = [
+            {'action': action, 'testId': test_id}
+            for test_id in event.get('testIds', [])
+            for action in include
+        ]
+    
+    if not isinstance(requests, list) or not requests:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'requests or testIds required'})
+        }
+    if len(requests) > MAX_BATCH_REQUESTS:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': f'At most {MAX_BATCH_REQUESTS} requests per batch'})
+        }
+    for request in requests:
+        if request.get('action') not in BATCH_ACTIONS:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': f'Batch supports only {", ".join(BATCH_ACTIONS)}'})
+            }
+    
+    # Statuses not already cached are fetched with one BatchGetItem per 100 keys
+    prefetch_statuses([r['testId'] for r in requests if r['action'] == 'status' and r.get('testId')])
+    
+    from concurrent.futures import ThreadPoolExecutor
+    
+    def run(request):
+        try:
+            response = dispatch(request['action'], request, {})
+        except Exception as e:
+            response = {'statusCode': 500, 'body': json.dumps({'error': str(e)})}
+        return {
+            'action': request['action'],
+            'testId': request.get('testId'),
+            'statusCode': response['statusCode'],
+            'result': json.loads(response['body']) if response['body'] else None
+        }
+    
+    with ThreadPoolExecutor(max_workers=min(BATCH_WORKERS, len(requests)),
+                            initializer=init_batch_thread) as pool:
+        responses = list(pool.map(run, requests))
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({'responses': responses}, default=str)
+    }
+
+def prefetch_statuses(test_ids):
+    cache = get_result_cache()
+    missing = list(dict.fromkeys(
+        test_id for test_id in test_ids if cache.peek(('status', test_id)) is None
+    ))
+    if not missing:
+        return
+    
+    dynamodb = get_dynamodb()
+    table_name = os.environ['CONFIG_TABLE']
+    for start in range(0, len(missing), 100):
+        request = {table_name: {'Keys': [{'testId': test_id} for test_id in missing[start:start + 100]]}}
+        for attempt in range(BATCH_GET_ATTEMPTS):
+            response = dynamodb.batch_get_item(RequestItems=request)
+            for item in response['Responses'].get(table_name, []):
+                cache.put(('status', item['testId']), json.dumps(item, default=str),
+                          item.get('status') in TERMINAL_STATUSES)
+            # Unprocessed keys are retried; anything still missing falls back to GetItem
+            request = response.get('UnprocessedKeys')
+            if not request:
+                break
+            time.sleep(0.05 * 2 ** attempt)
+
 def create_test(event):
-    dynamodb = boto3.resource('dynamodb')
-    table = dynamodb.Table(os.environ['CONFIG_TABLE'])
+    try:
+        config = build_config(event)
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': str(e)})
+        }
+    
+    get_table('CONFIG_TABLE').put_item(Item=config)
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'testId': config['testId'],
+            'message': 'Test configuration created successfully'
+        })
+    }
+
+def build_config(event):
+    # Validates the request and returns the config item; raises ValueError for bad input
+    import uuid
     
     test_id = str(uuid.uuid4())
     
     # Get regions with fallback
     regions = event.get('regions', os.environ.get('TEST_REGIONS', 'us-east-1,us-west-2').split(','))
     
-    config = {
+    # Every shard needs at least one user, so zero, negative and fractional counts are refused
+    concurrent_users = event.get('concurrent_users', 100)
+    if isinstance(concurrent_users, str) and concurrent_users.strip().isdigit():
+        concurrent_users = int(concurrent_users)
+    if isinstance(concurrent_users, bool) or not isinstance(concurrent_users, int) or concurrent_users <= 0:
+        raise ValueError('concurrent_users must be a positive integer')
+    
+    # Optional URL mix: weighted URLs, or a sitemap the workers sample from
+    workload_spec = None
+    target_url = event.get('target_url')
+    if event.get('urls'):
+        from workload import normalize_urls
+        try:
+            urls, weights = normalize_urls(event['urls'])
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f'Invalid urls: {str(e)}')
+        workload_spec = {'urls': [{'url': url, 'weight': str(weight)} for url, weight in zip(urls, weights)]}
+        target_url = target_url or urls[0]
+    elif event.get('sitemap_url'):
+        workload_spec = {
+            'sitemap_url': event['sitemap_url'],
+            'sample': int(event.get('sitemap_sample', 200)),
+            'seed': int(event.get('sitemap_seed', 0))
+        }
+        target_url = target_url or event['sitemap_url']
+    
+    # Cache-aware mode: classify responses by cache layer, busting a share of requests
+    cache_mode = None
+    if event.get('cache_bust_ratio') is not None:
+        from cache_mode import CacheBuster
+        try:
+            buster = CacheBuster(event['cache_bust_ratio'], event.get('cache_bust_method', 'query'))
+        except (TypeError, ValueError) as e:
+            raise ValueError(f'Invalid cache mode: {str(e)}')
+        cache_mode = {'bust_ratio': str(buster.ratio), 'bust_method': buster.method}
+    
+    # Open-loop tests are sized by offered rate; concurrent_users caps requests in flight
+    target_rps = event.get('target_rps')
+    arrival = event.get('arrival', 'constant')
+    if arrival not in ('constant', 'poisson'):
+        raise ValueError('arrival must be constant or poisson')
+    if target_rps is not None:
+        try:
+            target_rps = float(target_rps)
+        except (TypeError, ValueError):
+            target_rps = 0
+        if target_rps <= 0:
+            raise ValueError('target_rps must be positive')
+        target_rps = str(target_rps)
+    
+    # Seconds from start until the synchronized start of every shard
+    start_delay = event.get('start_delay')
+    if start_delay is not None:
+        try:
+            start_delay = int(start_delay)
+        except (TypeError, ValueError):
+            start_delay = -1
+        if start_delay < 0:
+            raise ValueError('start_delay must be a non-negative number of seconds')
+    
+    # Connection policies: reconnect every N requests, resume TLS sessions or not
+    connection_policies = None
+    if event.get('connection_policies'):
+        import connection_policy
+        try:
+            policies = connection_policy.parse(event['connection_policies'])
+        except (AttributeError, KeyError, TypeError, ValueError) as e:
+            raise ValueError(f'Invalid connection policies: {str(e)}')
+        connection_policies = [policy.to_spec() for policy in policies]
+    
+    # Per-request archive: workers upload Parquet files to the configured object store
+    archive_url = None
+    if event.get('archive'):
+        archive_url = os.environ.get('ARCHIVE_URL')
+        if not archive_url:
+            raise ValueError('ARCHIVE_URL not configured for request archives')
+    
+    # Per-second client-side metrics as EMF (see emf.sink_from_url), next to the stack's own
+    metrics_url = None
+    if event.get('metrics', True):
+        metrics_url = os.environ.get('METRICS_URL')
+    
+    return {
         'testId': test_id,
         'name': event.get('name', 'Load Test'),
-        'target_url': event.get('target_url'),
-        'concurrent_users': event.get('concurrent_users', 100),
+        'target_url': target_url,
+        'concurrent_users': concurrent_users,
         'duration': event.get('duration', 300),
         'ramp_up': event.get('ramp_up', 60),
+        'workers_per_region': event.get('workers_per_region'),
+        'engine': event.get('engine', 'ab'),
+        'workload': workload_spec,
+        'cache_mode': cache_mode,
+        'target_rps': target_rps,
+        'arrival': arrival,
+        'start_delay': start_delay,
+        'archive_url': archive_url,
+        'connection_policies': connection_policies,
+        'metrics_url': metrics_url,
         'regions': regions,
         'created_at': datetime.utcnow().isoformat(),
         'status': 'created'
     }
+
+def capacity_test(event, backend=None):
+    # Create and start a capacity search: step tests bisecting to the highest load meeting the SLO
+    from capacity_search import DEFAULT_FACTOR, DEFAULT_MAX_STEPS, DEFAULT_STEP_DURATION, DEFAULT_TOLERANCE, DIMENSIONS, Slo
+    
+    try:
+        config = build_config(dict(event, engine='python', name=event.get('name', 'Capacity search')))
+        slo = Slo.from_spec(event.get('slo'))
+        dimension = event.get('dimension', 'users')
+        if dimension not in DIMENSIONS:
+            raise ValueError(f'dimension must be one of {", ".join(DIMENSIONS)}')
+        start = float(event.get('start', 10))
+        maximum = float(event.get('max', 1000))
+        if start <= 0 or maximum < start:
+            raise ValueError('start must be positive and max at least start')
+        spec = {
+            'slo': slo.to_spec(),
+            'dimension': dimension,
+            'start': str(start),
+            'max': str(maximum),
+            'step_duration': int(event.get('step_duration', DEFAULT_STEP_DURATION)),
+            'factor': str(float(event.get('factor', DEFAULT_FACTOR))),
+            'tolerance': str(float(event.get('tolerance', DEFAULT_TOLERANCE))),
+            'max_steps': int(event.get('max_steps', DEFAULT_MAX_STEPS))
+        }
+    except (TypeError, ValueError) as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': str(e)})
+        }
     
-    table.put_item(Item=config)
+    config['mode'] = 'capacity'
+    config['capacity'] = spec
+    get_table('CONFIG_TABLE').put_item(Item=config)
     
-    return {
-        'statusCode': 200,
-        'body': json.dumps({
-            'testId': test_id,
-            'message': 'Test configuration created successfully'
-        })
-    }
+    response = start_test({'testId': config['testId']}, backend)
+    body = json.loads(response['body'])
+    body['testId'] = config['testId']
+    response['body'] = json.dumps(body)
+    return response
 
-def start_test(event):
+def start_test(event, backend=None):
     test_id = event.get('testId')
     if not test_id:
         return {
@@ -85,8 +433,7 @@ def start_test(event):
             'body': json.dumps({'error': 'testId required'})
         }
     
-    dynamodb = boto3.resource('dynamodb')
-    config_table = dynamodb.Table(os.environ['CONFIG_TABLE'])
+    config_table = get_table('CONFIG_TABLE')
     
     # Get test configuration
     response = config_table.get_item(Key={'testId': test_id})
@@ -98,84 +445,388 @@ def start_test(event):
     
     config = response['Item']
     
-    # Launch EC2 instance for load testing
-    ec2 = boto3.client('ec2')
-    
     # Ensure URL has proper protocol
     target_url = config['target_url']
     if not target_url.startswith(('http://', 'https://')):
         target_url = f'https://{target_url}'
     
-    user_data = f'''#!/bin/bash
-export AWS_DEFAULT_REGION=us-east-1
+    if backend is None:
+        backend = get_launch_backend()
+    
+    engine = config.get('engine', 'ab')
+    if engine != 'python' and backend.python_only:
+        # Its engines only claim python shards, so an ab test would never run
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': f'The {backend.name} launch backend requires the python engine'})
+        }
+    if engine == 'python' and backend.needs_user_data and 'WORKER_PACKAGE' not in os.environ:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'WORKER_PACKAGE not configured for python engine'})
+        }
+    if engine != 'python' and config.get('workload'):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'URL mixes and sitemaps require the python engine'})
+        }
+    if engine != 'python' and config.get('cache_mode'):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Cache-aware mode requires the python engine'})
+        }
+    if engine != 'python' and config.get('target_rps'):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Open-loop (target_rps) tests require the python engine'})
+        }
+    if engine != 'python' and config.get('archive_url'):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Request archives require the python engine'})
+        }
+    if engine != 'python' and config.get('connection_policies'):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Connection policies require the python engine'})
+        }
+    
+    regions = config.get('regions') or ['us-east-1']
+    if config.get('mode') == 'capacity':
+        regions = regions[:1]
+    if backend.region is not None and [region.strip() for region in regions] != [backend.region]:
+        # Its engines all run in one region, so traffic would not come from the others
+        return {
+            'statusCode': 400,
+            'body': json.dumps({
+                'error': f'The {backend.name} launch backend only runs engines in {backend.region}; '
+                         f'set regions to ["{backend.region}"]'
+            })
+        }
+    
+    from launch_backends import DEFAULT_USERS_PER_WORKER, plan_shards
+    
+    # Split the requested concurrency into one shard per worker
+    try:
+        if config.get('mode') == 'capacity':
+            # One worker runs every step so the steps differ only in load level
+            shards = plan_shards(config['concurrent_users'], regions, workers_per_region=1)
+        else:
+            shards = plan_shards(
+                config['concurrent_users'],
+                regions,
+                workers_per_region=config.get('workers_per_region') or backend.workers_per_region(regions),
+                users_per_worker=int(config.get('users_per_worker', DEFAULT_USERS_PER_WORKER))
+            )
+    except ValueError as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': str(e)})
+        }
+    
+    shard_map = {}
+    launch_error = None
+    booting = backend.needs_user_data
+    try:
+        # e.g. scale a worker pool up before its engines look for the shards
+        booting = backend.prepare(test_id, shards) or booting
+    except Exception as e:
+        launch_error = f'Failed to prepare workers: {str(e)}'
+    
+    # Every shard waits for the same instant so their series share one timeline;
+    # a capacity search has a single shard and starts as soon as it can
+    start_at = None
+    if config.get('mode') != 'capacity':
+        start_delay = config.get('start_delay')
+        if start_delay is None:
+            start_delay = DEFAULT_START_DELAY if booting else POOLED_START_DELAY
+        start_at = int(time.time()) + int(start_delay)
+        config['start_at'] = start_at
+    
+    for shard in shards if launch_error is None else []:
+        if not backend.needs_user_data:
+            # Pooled engines claim the shard and read the settings from the config item
+            user_data = None
+        elif engine == 'python':
+            user_data = python_user_data(config, target_url, test_id, shard)
+        else:
+            user_data = ab_user_data(config, target_url, test_id, shard)
+        
+        try:
+            worker_id = backend.launch(test_id, shard, user_data)
+        except Exception as e:
+            launch_error = f'Failed to launch worker for {shard["shardId"]} in {shard["region"]}: {str(e)}'
+            break
+        
+        shard_map[shard['shardId']] = {
+            'region': shard['region'],
+            'concurrent_users': shard['concurrent_users'],
+            'first_user': shard['first_user'],
+            'worker_id': worker_id
+        }
+    
+    # Update test status; the shard map is kept even on failure so launched workers can be traced
+    config_table.update_item(
+        Key={'testId': test_id},
+        UpdateExpression='SET #status = :status, started_at = :started_at, shards = :shards, start_at = :start_at',
+        ExpressionAttributeNames={'#status': 'status'},
+        ExpressionAttributeValues={
+            ':status': 'failed' if launch_error else 'running',
+            ':started_at': datetime.utcnow().isoformat(),
+            ':shards': shard_map,
+            ':start_at': start_at
+        }
+    )
+    
+    if launch_error:
+        return {
+            'statusCode': 500,
+            'body': json.dumps({'error': launch_error, 'shards': shard_map}, default=str)
+        }
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps({
+            'message': (f'Test started successfully, {len(shard_map)} workers launched' if backend.needs_user_data
+                        else f'Test started successfully, {len(shard_map)} shards open for pooled engines'),
+            'shards': shard_map,
+            'start_at': start_at
+        }, default=str)
+    }
+
+def ab_user_data(config, target_url, test_id, shard):
+    # The parser ships inside the user data so ab workers need no package
+    with open(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ab_parser.py')) as f:
+        parser_source = f.read()
+    
+    table_region = os.environ.get('AWS_REGION', 'us-east-1')
+    
+    return f'''#!/bin/bash
+export AWS_DEFAULT_REGION={table_region}
 yum update -y
 yum install -y httpd-tools python3 pip
 pip3 install boto3
 
+mkdir -p /opt/loadtest
+cat > /opt/loadtest/ab_parser.py << 'PARSER'
+{parser_source}
+PARSER
+
+# Polls for stop_test and interrupts ab, which then prints what it measured so far
+cat > /opt/loadtest/stop_watch.py << 'WATCH'
+import json
+import os
+import signal
+import sys
+import time
+
+import boto3
+
+table = boto3.resource('dynamodb', region_name='{table_region}').Table('{os.environ['CONFIG_TABLE']}')
+while True:
+    time.sleep(2)
+    try:
+        item = table.get_item(Key={{'testId': '{test_id}'}}, ProjectionExpression='stop_requested_at',
+                              ConsistentRead=True).get('Item') or {{}}
+    except Exception as e:
+        print('Error checking for stop:', e)
+        continue
+    if 'stop_requested_at' in item:
+        with open('/tmp/stop.json', 'w') as f:
+            json.dump({{'requested_at': float(item['stop_requested_at']), 'seen_at': time.time()}}, f)
+        os.kill(int(sys.argv[1]), signal.SIGINT)
+        break
+WATCH
+
+# Wait for the shared start so every shard's load begins together
+python3 -c "import time; time.sleep(max(0, {config.get('start_at') or 0} - time.time()))"
+
 # Run load test
-ab -c {config['concurrent_users']} -t {config['duration']} "{target_url}" > /tmp/results.txt 2>&1
+ab -c {shard['concurrent_users']} -t {config['duration']} "{target_url}" > /tmp/results.txt 2>&1 &
+AB_PID=$!
+python3 /opt/loadtest/stop_watch.py $AB_PID &
+WATCH_PID=$!
+wait $AB_PID
+export QUIET_AT=$(date +%s.%N)
+kill $WATCH_PID 2>/dev/null
 
-# Upload results to DynamoDB
+# Upload parsed summary to DynamoDB
 python3 << 'EOF'
 import boto3
+import json
 import os
+import sys
 from datetime import datetime
+from decimal import Decimal
 
-os.environ['AWS_DEFAULT_REGION'] = 'us-east-1'
+sys.path.insert(0, '/opt/loadtest')
+import ab_parser
 
 with open('/tmp/results.txt', 'r') as f:
-    results = f.read()
+    summary = ab_parser.parse(f)
 
-dynamodb = boto3.resource('dynamodb', region_name='us-east-1')
+dynamodb = boto3.resource('dynamodb', region_name='{table_region}')
 table = dynamodb.Table('{os.environ['RESULTS_TABLE']}')
 
-table.put_item(Item={{
+item = {{
     'testId': '{test_id}',
     'timestamp': datetime.utcnow().isoformat(),
-    'results': results,
-    'region': 'us-east-1'
-}})
+    'engine': 'ab',
+    'summary': json.loads(json.dumps(summary), parse_float=Decimal),
+    'shardId': '{shard['shardId']}',
+    'region': '{shard['region']}'
+}}
+if os.path.exists('/tmp/stop.json'):
+    with open('/tmp/stop.json') as f:
+        stop = json.load(f)
+    stop['quiet_at'] = float(os.environ['QUIET_AT'])
+    stop['stop_to_quiet_ms'] = round((stop['quiet_at'] - stop['requested_at']) * 1000, 1)
+    item['stop'] = json.loads(json.dumps(stop), parse_float=Decimal)
+table.put_item(Item=item)
 EOF
 
-# Shutdown after test
-shutdown -h +5
+# Shutdown after test, at once when it was stopped
+if [ -f /tmp/stop.json ]; then
+  shutdown -h now
+else
+  shutdown -h +5
+fi
 '''
+
+def python_user_data(config, target_url, test_id, shard):
+    # The worker package is a zip of load_worker.py and the modules it imports
+    table_region = os.environ.get('AWS_REGION', 'us-east-1')
     
-    try:
-        ec2.run_instances(
-            ImageId='ami-0c02fb55956c7d316',
-            MinCount=1,
-            MaxCount=1,
-            InstanceType='t3.micro',
-            UserData=user_data,
-            TagSpecifications=[{
-                'ResourceType': 'instance',
-                'Tags': [
-                    {'Key': 'Name', 'Value': f'LoadTest-{test_id[:8]}'},
-                    {'Key': 'TestId', 'Value': test_id}
-                ]
-            }]
-        )
-    except Exception as e:
+    workload_setup = workload_arg = ''
+    if config.get('workload'):
+        workload_setup = f"""cat > /opt/loadtest/workload.json << 'WORKLOAD'
+{json.dumps(config['workload'], default=str)}
+WORKLOAD
+"""
+        workload_arg = '--workload /opt/loadtest/workload.json \\\n  '
+    
+    cache_arg = ''
+    if config.get('cache_mode'):
+        cache_mode = config['cache_mode']
+        cache_arg = (f"--cache-bust-ratio {cache_mode['bust_ratio']} "
+                     f"--cache-bust-method {cache_mode['bust_method']} \\\n  ")
+    
+    rate_arg = ''
+    if config.get('target_rps') and config.get('mode') != 'capacity':
+        # Each shard offers the share of the rate that matches its users
+        rate = float(config['target_rps']) * int(shard['concurrent_users']) / int(config['concurrent_users'])
+        rate_arg = f"--rate {rate:.3f} --arrival {config.get('arrival') or 'constant'} \\\n  "
+    
+    capacity_arg = ''
+    if config.get('mode') == 'capacity':
+        workload_setup += f"""cat > /opt/loadtest/capacity.json << 'CAPACITY'
+{json.dumps(config['capacity'], default=str)}
+CAPACITY
+"""
+        capacity_arg = f"--capacity /opt/loadtest/capacity.json --arrival {config.get('arrival') or 'constant'} \\\n  "
+    
+    policies_arg = ''
+    if config.get('connection_policies'):
+        workload_setup += f"""cat > /opt/loadtest/policies.json << 'POLICIES'
+{json.dumps(config['connection_policies'], default=str)}
+POLICIES
+"""
+        policies_arg = '--connection-policies /opt/loadtest/policies.json \\\n  '
+    
+    archive_arg = packages = ''
+    if config.get('archive_url'):
+        archive_arg = f"--archive '{config['archive_url']}' \\\n  "
+        packages = ' pyarrow'
+    
+    start_arg = ''
+    if config.get('start_at'):
+        start_arg = f"--start-at {config['start_at']} \\\n  "
+    
+    emf_arg = ''
+    if config.get('metrics_url'):
+        emf_arg = f"--emf '{config['metrics_url']}' \\\n  "
+    
+    return f'''#!/bin/bash
+export AWS_DEFAULT_REGION={table_region}
+yum install -y python3 pip unzip
+pip3 install boto3 uvloop{packages}
+
+mkdir -p /opt/loadtest
+aws s3 cp {os.environ['WORKER_PACKAGE']} /opt/loadtest/worker.zip
+cd /opt/loadtest && unzip -o worker.zip
+{workload_setup}
+# Run load test
+python3 /opt/loadtest/load_worker.py \\
+  --test-id '{test_id}' \\
+  --url "{target_url}" \\
+  --shard-id '{shard['shardId']}' \\
+  --worker-region '{shard['region']}' \\
+  --concurrency {shard['concurrent_users']} \\
+  --first-user {shard['first_user']} \\
+  --duration {config['duration']} \\
+  --ramp-up {config.get('ramp_up', 0)} \\
+  {workload_arg}{cache_arg}{rate_arg}{capacity_arg}{policies_arg}{start_arg}{archive_arg}{emf_arg}--config-table '{os.environ['CONFIG_TABLE']}' \\
+  --results-table '{os.environ['RESULTS_TABLE']}' \\
+  --region '{table_region}' > /var/log/load_worker.log 2>&1
+
+# Shutdown after test, at once when it was stopped (load_worker.STOPPED_EXIT_CODE)
+if [ $? -eq 3 ]; then
+  shutdown -h now
+else
+  shutdown -h +5
+fi
+'''
+
+def pool_user_data(idle_timeout, pool_region):
+    # Installs once, then serves shard after shard until idle; the instance terminates on shutdown
+    table_region = os.environ.get('AWS_REGION', 'us-east-1')
+    
+    return f'''#!/bin/bash
+export AWS_DEFAULT_REGION={table_region}
+yum install -y python3 pip unzip
+pip3 install boto3 uvloop pyarrow
+
+mkdir -p /opt/loadtest
+aws s3 cp {os.environ['WORKER_PACKAGE']} /opt/loadtest/worker.zip
+cd /opt/loadtest && unzip -o worker.zip
+
+TOKEN=$(curl -s -X PUT http://169.254.169.254/latest/api/token -H 'X-aws-ec2-metadata-token-ttl-seconds: 60')
+WORKER_ID=$(curl -s -H "X-aws-ec2-metadata-token: $TOKEN" http://169.254.169.254/latest/meta-data/instance-id)
+
+python3 /opt/loadtest/load_worker.py --claim --serve \\
+  --claim-timeout {idle_timeout} \\
+  --worker-id "$WORKER_ID" \\
+  --worker-region '{pool_region}' \\
+  --config-table '{os.environ['CONFIG_TABLE']}' \\
+  --results-table '{os.environ['RESULTS_TABLE']}' \\
+  --region '{table_region}' > /var/log/load_worker.log 2>&1
+
+shutdown -h now
+'''
+
+def pool_status(event):
+    # Tops the pool up to its idle floor; run on a schedule to keep warm engines around
+    backend = get_launch_backend()
+    if getattr(backend, 'pool', None) is None:
         return {
-            'statusCode': 500,
-            'body': json.dumps({'error': f'Failed to launch instance: {str(e)}'})
+            'statusCode': 400,
+            'body': json.dumps({'error': 'LAUNCH_BACKEND is not a worker pool'})
         }
     
-    # Update test status
-    config_table.update_item(
-        Key={'testId': test_id},
-        UpdateExpression='SET #status = :status, started_at = :started_at',
-        ExpressionAttributeNames={'#status': 'status'},
-        ExpressionAttributeValues={
-            ':status': 'running',
-            ':started_at': datetime.utcnow().isoformat()
+    try:
+        demand = int(event.get('demand', 0))
+    except (TypeError, ValueError):
+        demand = -1
+    if demand < 0:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'demand must be a non-negative integer'})
         }
-    )
     
+    started = backend.pool.scale(demand)
     return {
         'statusCode': 200,
-        'body': json.dumps({'message': 'Test started successfully, EC2 instance launched'})
+        'body': json.dumps({'started': started, 'pool': backend.pool.status()})
     }
 
 def stop_test(event):
@@ -186,25 +837,36 @@ def stop_test(event):
             'body': json.dumps({'error': 'testId required'})
         }
     
-    dynamodb = boto3.resource('dynamodb')
-    config_table = dynamodb.Table(os.environ['CONFIG_TABLE'])
+    from decimal import Decimal
     
-    config_table.update_item(
+    config_table = get_table('CONFIG_TABLE')
+    
+    # Workers poll stop_requested_at and drain; a repeated stop keeps the first time
+    response = config_table.update_item(
         Key={'testId': test_id},
-        UpdateExpression='SET #status = :status, stopped_at = :stopped_at',
+        UpdateExpression='SET #status = :status, stopped_at = :stopped_at, '
+                         'stop_requested_at = if_not_exists(stop_requested_at, :requested_at)',
         ExpressionAttributeNames={'#status': 'status'},
         ExpressionAttributeValues={
             ':status': 'stopped',
-            ':stopped_at': datetime.utcnow().isoformat()
-        }
+            ':stopped_at': datetime.utcnow().isoformat(),
+            ':requested_at': Decimal(str(round(time.time(), 3)))
+        },
+        ReturnValues='ALL_NEW'
     )
     
+    if _result_cache is not None:
+        _result_cache.invalidate(test_id)
+    
     return {
         'statusCode': 200,
-        'body': json.dumps({'message': 'Test stopped successfully'})
+        'body': json.dumps({
+            'message': 'Test stopped successfully',
+            'stop_requested_at': float(response['Attributes']['stop_requested_at'])
+        })
     }
 
-def get_test_status(event):
+def get_test_status(event, headers=None):
     test_id = event.get('testId')
     if not test_id:
         return {
@@ -212,22 +874,51 @@ def get_test_status(event):
             'body': json.dumps({'error': 'testId required'})
         }
     
-    dynamodb = boto3.resource('dynamodb')
-    config_table = dynamodb.Table(os.environ['CONFIG_TABLE'])
+    return cached_response(('status', test_id), headers, lambda: load_test_status(test_id))
+
+def load_test_status(test_id):
+    config_table = get_table('CONFIG_TABLE')
     
     response = config_table.get_item(Key={'testId': test_id})
     if 'Item' not in response:
         return {
             'statusCode': 404,
             'body': json.dumps({'error': 'Test not found'})
-        }
+        }, False
     
+    item = response['Item']
     return {
         'statusCode': 200,
-        'body': json.dumps(response['Item'], default=str)
+        'body': json.dumps(item, default=str)
+    }, item.get('status') in TERMINAL_STATUSES
+
+def cached_response(key, headers, load):
+    # load() returns (response, final); only 200 responses are cached
+    cache = get_result_cache()
+    cached = cache.get(key)
+    if cached is None:
+        response, final = load()
+        if response['statusCode'] != 200:
+            return response
+        body = response['body']
+        etag = cache.put(key, body, final)
+        cache_state = 'MISS'
+    else:
+        body, etag = cached
+        cache_state = 'HIT'
+    
+    from result_cache import etag_matches
+    
+    response_headers = {
+        'ETag': etag,
+        'X-Cache': cache_state,
+        'X-Cache-Hit-Ratio': f'{cache.hit_ratio:.3f}'
     }
+    if etag_matches((headers or {}).get('if-none-match'), etag):
+        return {'statusCode': 304, 'headers': response_headers, 'body': ''}
+    return {'statusCode': 200, 'headers': response_headers, 'body': body}
 
-def get_test_results(event):
+def get_test_results(event, headers=None):
     test_id = event.get('testId')
     if not test_id:
         return {
@@ -235,26 +926,418 @@ def get_test_results(event):
             'body': json.dumps({'error': 'testId required'})
         }
     
-    dynamodb = boto3.resource('dynamodb')
-    results_table = dynamodb.Table(os.environ['RESULTS_TABLE'])
+    key = ('results', test_id, bool(event.get('series')), str(event.get('since')), str(event.get('apdex_ms')))
+    return cached_response(key, headers, lambda: load_test_results(event, test_id))
+
+def load_test_results(event, test_id):
+    results_table = get_table('RESULTS_TABLE')
     
-    response = results_table.query(
-        KeyConditionExpression='testId = :testId',
-        ExpressionAttributeValues={':testId': test_id}
+    # Summary items sort before the per-second series items
+    items = query_all(
+        results_table,
+        KeyConditionExpression='testId = :testId AND #ts < :series',
+        ExpressionAttributeNames={'#ts': 'timestamp'},
+        ExpressionAttributeValues={':testId': test_id, ':series': 'series#'}
     )
     
+    # Older ab workers stored the whole report text; summarize it on the way out
+    for item in items:
+        if 'results' in item and 'summary' not in item:
+            import ab_parser
+            item['summary'] = ab_parser.parse_text(item.pop('results'))
+    
+    # Capacity searches also record each step as it finishes
+    steps = [item for item in items if item.get('kind') == 'step']
+    items = [item for item in items if item.get('kind') != 'step']
+    
+    try:
+        apdex_ms = float(event['apdex_ms']) if event.get('apdex_ms') is not None else None
+    except (TypeError, ValueError):
+        apdex_ms = 0
+    if apdex_ms is not None and apdex_ms <= 0:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'apdex_ms must be a positive number of milliseconds'})
+        }, False
+    
+    body = {
+        'results': items,
+        'aggregate': aggregate_results(items, apdex_ms)
+    }
+    
+    if steps:
+        final = next((item['capacity'] for item in items if 'capacity' in item), None)
+        body['capacity'] = final or {'steps': [item['step'] for item in steps]}
+    
+    if event.get('series') or event.get('since') is not None:
+        from timeseries import curve, series_key
+        
+        try:
+            since = parse_since(event.get('since'))
+        except ValueError:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'since must be epoch seconds or an ISO timestamp'})
+            }, False
+        
+        # '~' sorts after every shard id, so items for the `since` second itself are skipped
+        lower = series_key(since) + '#~' if since is not None else 'series#'
+        series_items = query_all(
+            results_table,
+            KeyConditionExpression='testId = :testId AND #ts BETWEEN :lower AND :upper',
+            ExpressionAttributeNames={'#ts': 'timestamp'},
+            ExpressionAttributeValues={':testId': test_id, ':lower': lower, ':upper': 'series#~'}
+        )
+        points = curve(series_items)
+        body['series'] = points
+        analysis = load_analysis()
+        if analysis is not None and points:
+            body['throughput'] = analysis.throughput([point['rps'] for point in points])
+        # Poll again with since=next_since to fetch only newer seconds
+        body['next_since'] = points[-1]['second'] if points else since
+    
+    return {
+        'statusCode': 200,
+        'body': json.dumps(body, default=str)
+    }, results_final(test_id, items)
+
+def results_final(test_id, items):
+    # Results are final once every shard has reported; a stopped test's workers may still upload
+    config = get_table('CONFIG_TABLE').get_item(Key={'testId': test_id}).get('Item')
+    if config is None:
+        return False
+    if config.get('status') == 'completed':
+        return True
+    
+    shards = config.get('shards') or {}
+    reported = {item.get('shardId') for item in items if 'summary' in item}
+    if not shards or not set(shards) <= reported:
+        return False
+    
+    # Nothing will report any more, so record the test as completed
+    from botocore.exceptions import ClientError
+    try:
+        get_table('CONFIG_TABLE').update_item(
+            Key={'testId': test_id},
+            UpdateExpression='SET #status = :completed, completed_at = :completed_at',
+            ConditionExpression='#status = :running',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={
+                ':completed': 'completed',
+                ':running': 'running',
+                ':completed_at': datetime.utcnow().isoformat()
+            }
+        )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    get_result_cache().invalidate(test_id)
+    return True
+
+def query_all(table, **kwargs):
+    items = []
+    while True:
+        response = table.query(**kwargs)
+        items.extend(response.get('Items', []))
+        if 'LastEvaluatedKey' not in response:
+            return items
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def parse_since(since):
+    if since is None or since == '':
+        return None
+    if isinstance(since, (int, float)) or str(since).isdigit():
+        return int(since)
+    return int(datetime.fromisoformat(str(since).replace('Z', '+00:00')).timestamp())
+
+def load_analysis():
+    # analysis needs NumPy, which only some deployments package with the function
+    try:
+        import analysis
+    except ImportError:
+        return None
+    return analysis
+
+def aggregate_results(items, apdex_ms=None):
+    # Workers run concurrently, so cluster throughput is the sum of worker rates
+    summaries = [item for item in items if 'summary' in item]
+    if not summaries:
+        return None
+    
+    totals = {'requests': 0, 'failures': 0, 'non_2xx': 0, 'requests_per_second': 0.0}
+    for item in summaries:
+        summary = item['summary']
+        if item.get('engine') == 'python':
+            totals['requests'] += int(summary.get('requests', 0))
+            totals['failures'] += int(summary.get('failures', 0))
+        else:
+            totals['requests'] += int(summary.get('complete_requests', 0))
+            totals['failures'] += int(summary.get('failed_requests', 0))
+        totals['non_2xx'] += int(summary.get('non_2xx', 0))
+        if 'unsent' in summary:
+            # Open-loop shortfall: sends behind schedule and slots never sent
+            totals['late'] = totals.get('late', 0) + int(summary.get('late', 0))
+            totals['unsent'] = totals.get('unsent', 0) + int(summary['unsent'])
+        totals['requests_per_second'] += float(summary.get('requests_per_second', 0))
+    
+    totals['workers'] = len(summaries)
+    totals['regions'] = sorted({item.get('region', 'unknown') for item in summaries})
+    
+    # Merge worker histograms so percentiles cover every request of the test
+    histograms = [item['histogram'] for item in summaries if 'histogram' in item]
+    if histograms:
+        from latency_histogram import merge_encoded
+        merged = merge_encoded(histograms)
+        totals['latency'] = merged.summary()
+        
+        analysis = load_analysis()
+        if analysis is not None:
+            # Failed requests are frustrated; responses, non-2xx included, are judged on
+            # latency alone, as analysis.apdex does for an archive of the same test
+            values, counts = merged.buckets()
+            threshold = apdex_ms or analysis.DEFAULT_APDEX_MS
+            totals['apdex'] = {
+                # Histogram values are microseconds
+                'score': analysis.histogram_apdex(values, counts, threshold * 1000.0,
+                                                  errors=totals['failures']),
+                'threshold_ms': threshold
+            }
+    
+    # Cache-aware tests: hits and misses side by side, rates summed like the totals
+    cached = [item for item in summaries if 'cache_histograms' in item]
+    if cached:
+        from latency_histogram import merge_encoded
+        totals['cache'] = {}
+        for name in sorted({name for item in cached for name in item['cache_histograms']}):
+            entries = [item['cache'].get(name, {}) for item in cached]
+            requests = sum(int(entry.get('requests', 0)) for entry in entries)
+            totals['cache'][name] = {
+                'requests': requests,
+                'share': requests / totals['requests'] if totals['requests'] else 0.0,
+                'requests_per_second': sum(float(entry.get('requests_per_second', 0)) for entry in entries),
+                'transfer_rate': sum(float(entry.get('transfer_rate', 0)) for entry in entries),
+                'latency': merge_encoded(
+                    item['cache_histograms'][name] for item in cached if name in item['cache_histograms']
+                ).summary()
+            }
+    
+    # DNS/connect/TLS per new connection, TTFB/transfer per request: where the time went
+    timed = [item for item in summaries if 'phase_histograms' in item]
+    if timed:
+        from latency_histogram import merge_encoded
+        totals['phases'] = {}
+        for name in ('dns', 'connect', 'tls', 'ttfb', 'transfer'):
+            totals['phases'][name] = merge_encoded(
+                item['phase_histograms'][name] for item in timed if name in item['phase_histograms']
+            ).summary()
+            if name in ('dns', 'connect', 'tls'):
+                totals['phases'][name]['failures'] = sum(
+                    int(item.get('phases', {}).get(name, {}).get('failures', 0)) for item in timed
+                )
+    
+    # Connection policies side by side: throughput and TLS handshake cost of each
+    with_policies = [item for item in summaries if 'policy_histograms' in item]
+    if with_policies:
+        from latency_histogram import merge_encoded
+        totals['policies'] = {}
+        for name in sorted({name for item in with_policies for name in item['policy_histograms']}):
+            entries = [item['policies'][name] for item in with_policies if name in item['policies']]
+            policy = {key: sum(int(entry.get(key, 0)) for entry in entries)
+                      for key in ('requests', 'failures', 'connections', 'handshakes', 'resumed')}
+            policy['requests_per_second'] = sum(float(entry.get('requests_per_second', 0)) for entry in entries)
+            policy['full_handshakes_per_second'] = sum(
+                float(entry.get('full_handshakes_per_second', 0)) for entry in entries)
+            policy['requests_per_connection'] = (
+                policy['requests'] / policy['connections'] if policy['connections'] else 0.0)
+            policy['resumption_rate'] = policy['resumed'] / policy['handshakes'] if policy['handshakes'] else 0.0
+            histograms = [item['policy_histograms'][name] for item in with_policies
+                          if name in item['policy_histograms']]
+            policy['latency'] = merge_encoded(h['latency'] for h in histograms).summary()
+            policy['tls'] = merge_encoded(h['tls'] for h in histograms).summary()
+            totals['policies'][name] = policy
+    
+    # Synchronized starts: how late the last shard began and how far the series may be skewed
+    clocks = [item['clock'] for item in summaries if item.get('clock')]
+    if clocks:
+        uncertainties = [float(clock['uncertainty_ms']) for clock in clocks if clock.get('uncertainty_ms') is not None]
+        totals['clock'] = {
+            'start_at': int(clocks[0]['start_at']),
+            'max_start_lag_ms': max(float(clock.get('start_lag_ms', 0)) for clock in clocks),
+            'max_offset_ms': max(abs(float(clock['offset_ms'])) for clock in clocks),
+            # None when some worker could not estimate its offset at all
+            'max_uncertainty_ms': max(uncertainties) if len(uncertainties) == len(clocks) else None,
+            'sources': sorted({clock['source'] for clock in clocks})
+        }
+    
+    # Stopped tests: how long after stop_test the slowest worker went quiet
+    stops = [item['stop'] for item in summaries if item.get('stop')]
+    if stops:
+        totals['stop'] = {
+            'requested_at': float(stops[0]['requested_at']),
+            'workers_stopped': len(stops),
+            'max_stop_to_quiet_ms': max(float(stop['stop_to_quiet_ms']) for stop in stops),
+            'abandoned': sum(int(stop.get('abandoned', 0)) for stop in stops)
+        }
+    
+    # Where to fetch the per-request archive from (see request_archive.download)
+    archives = [item['archive'] for item in summaries if item.get('archive')]
+    if archives:
+        totals['archive'] = {
+            'url': archives[0]['url'],
+            'objects': sorted(key for archive in archives for key in archive['keys']),
+            'rows': sum(int(archive['rows']) for archive in archives)
+        }
+    return totals
+
+def compare_tests(event):
+    baseline_id = event.get('baseline')
+    candidate_id = event.get('candidate')
+    if not baseline_id or not candidate_id:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'baseline and candidate testIds required'})
+        }
+    
+    import compare
+    
+    try:
+        options = {
+            'percentiles': [float(p) for p in event.get('percentiles', compare.DEFAULT_PERCENTILES)],
+            'resamples': min(int(event.get('resamples', compare.DEFAULT_RESAMPLES)), MAX_RESAMPLES),
+            'confidence': float(event.get('confidence', compare.DEFAULT_CONFIDENCE)),
+            'threshold': float(event.get('threshold', compare.DEFAULT_THRESHOLD)),
+            'error_threshold': float(event.get('error_threshold', compare.DEFAULT_ERROR_THRESHOLD))
+        }
+    except (TypeError, ValueError) as e:
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': f'Invalid comparison options: {str(e)}'})
+        }
+    
+    samples = {}
+    for role, test_id in (('baseline', baseline_id), ('candidate', candidate_id)):
+        samples[role] = load_sample(test_id)
+        if samples[role] is None:
+            return {
+                'statusCode': 404,
+                'body': json.dumps({'error': f'No results for {role} test {test_id}'})
+            }
+    
+    result = compare.compare(samples['baseline'], samples['candidate'], **options)
+    result['baseline'] = baseline_id
+    result['candidate'] = candidate_id
     return {
         'statusCode': 200,
-        'body': json.dumps({'results': response.get('Items', [])}, default=str)
+        'body': json.dumps(result, default=str)
     }
 
-def list_tests():
-    dynamodb = boto3.resource('dynamodb')
-    config_table = dynamodb.Table(os.environ['CONFIG_TABLE'])
+def load_sample(test_id):
+    # Merged histogram, steady-state per-second throughput and error counts of one test
+    from compare import Sample
+    from latency_histogram import merge_encoded
+    from timeseries import curve
+    
+    results_table = get_table('RESULTS_TABLE')
+    items = query_all(
+        results_table,
+        KeyConditionExpression='testId = :testId AND #ts < :series',
+        ExpressionAttributeNames={'#ts': 'timestamp'},
+        ExpressionAttributeValues={':testId': test_id, ':series': 'series#'}
+    )
+    for item in items:
+        if 'results' in item and 'summary' not in item:
+            import ab_parser
+            item['summary'] = ab_parser.parse_text(item.pop('results'))
+    totals = aggregate_results([item for item in items if item.get('kind') != 'step'])
+    if totals is None:
+        return None
+    
+    points = curve(query_all(
+        results_table,
+        KeyConditionExpression='testId = :testId AND #ts BETWEEN :lower AND :upper',
+        ExpressionAttributeNames={'#ts': 'timestamp'},
+        ExpressionAttributeValues={':testId': test_id, ':lower': 'series#', ':upper': 'series#~'}
+    ))
+    # Compare steady state only: skip the ramp-up and the last, partial second
+    config = get_table('CONFIG_TABLE').get_item(Key={'testId': test_id}).get('Item') or {}
+    if points:
+        steady_from = points[0]['second'] + int(config.get('ramp_up') or 0)
+        points = [point for point in points[:-1] if point['second'] >= steady_from]
+    
+    histograms = [item['histogram'] for item in items if 'summary' in item and 'histogram' in item]
+    return Sample(
+        merge_encoded(histograms) if histograms else None,
+        rps=[point['rps'] for point in points],
+        requests=totals['requests'] + totals['failures'],
+        errors=totals['failures'] + totals['non_2xx']
+    )
+
+def list_tests(event):
+    from boto3.dynamodb.conditions import Attr, Key
+    
+    config_table = get_table('CONFIG_TABLE')
+    
+    try:
+        limit = min(max(int(event.get('limit', DEFAULT_LIST_LIMIT)), 1), MAX_LIST_LIMIT)
+        start_key = decode_cursor(event['cursor']) if event.get('cursor') else None
+    except (TypeError, ValueError):
+        return {
+            'statusCode': 400,
+            'body': json.dumps({'error': 'Invalid limit or cursor'})
+        }
     
-    response = config_table.scan()
+    params = {'Limit': limit}
+    if start_key:
+        params['ExclusiveStartKey'] = start_key
+    # Full items by default, as list always returned; fields='summary' projects the listing columns
+    if event.get('fields') == 'summary':
+        params['ProjectionExpression'] = ', '.join(f'#{field}' for field in SUMMARY_FIELDS)
+        params['ExpressionAttributeNames'] = {f'#{field}': field for field in SUMMARY_FIELDS}
+    
+    since = event.get('since')
+    until = event.get('until')
+    
+    if event.get('status'):
+        # Newest first from the status/created_at index; cost depends only on the page size
+        condition = Key('status').eq(event['status'])
+        if since and until:
+            condition &= Key('created_at').between(since, until)
+        elif since:
+            condition &= Key('created_at').gte(since)
+        elif until:
+            condition &= Key('created_at').lte(until)
+        response = config_table.query(
+            IndexName=os.environ.get('STATUS_INDEX', 'status-created_at-index'),
+            KeyConditionExpression=condition,
+            ScanIndexForward=False,
+            **params
+        )
+    else:
+        # Without a status there is no partition to query, so page through the table
+        filters = None
+        if since:
+            filters = Attr('created_at').gte(since)
+        if until:
+            filters = Attr('created_at').lte(until) if filters is None else filters & Attr('created_at').lte(until)
+        if filters is not None:
+            params['FilterExpression'] = filters
+        response = config_table.scan(**params)
+    
+    last_key = response.get('LastEvaluatedKey')
     
     return {
         'statusCode': 200,
-        'body': json.dumps({'tests': response.get('Items', [])}, default=str)
-    }
\ No newline at end of file
+        'body': json.dumps({
+            'tests': response.get('Items', []),
+            'cursor': encode_cursor(last_key) if last_key else None
+        }, default=str)
+    }
+
+def encode_cursor(last_key):
+    return base64.urlsafe_b64encode(json.dumps(last_key, default=str).encode()).decode()
+
+def decode_cursor(cursor):
+    try:
+        return json.loads(base64.urlsafe_b64decode(cursor.encode()))
+    except Exception:
+        raise ValueError('Invalid cursor')
@@ -0,0 +1,178 @@
+"""HDR-style latency histogram with fixed memory and a compact wire format.
+
+Values are recorded as integer microseconds into log-linear buckets, so every
+recorded value is kept to within 10**-significant_figures of its true value
+no matter how many requests a worker makes. Histograms from different workers
+merge by adding their counts, which is what lets the manager compute
+percentiles for a whole test without ever storing individual samples.
+"""
+import base64
+import math
+import zlib
+
+DEFAULT_HIGHEST = 3600 * 1000 * 1000   # one hour in microseconds
+DEFAULT_SIGNIFICANT_FIGURES = 3
+REPORTED_PERCENTILES = (50, 90, 99, 99.9)
+
+
+def _write_varint(out, value):
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def _read_varint(data, pos):
+    result = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        result |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return result, pos
+        shift += 7
+
+
+class LatencyHistogram:
+    def __init__(self, highest=DEFAULT_HIGHEST, significant_figures=DEFAULT_SIGNIFICANT_FIGURES):
+        self.highest = highest
+        self.significant_figures = significant_figures
+
+        largest_single_unit = 2 * 10 ** significant_figures
+        self.sub_bucket_count = 1 << math.ceil(math.log2(largest_single_unit))
+        self.sub_bucket_half_count = self.sub_bucket_count // 2
+        self.sub_bucket_half_count_magnitude = self.sub_bucket_half_count.bit_length() - 1
+        self.sub_bucket_mask = self.sub_bucket_count - 1
+
+        buckets = 1
+        smallest_untrackable = self.sub_bucket_count
+        while smallest_untrackable <= highest:
+            smallest_untrackable <<= 1
+            buckets += 1
+        self.counts = [0] * ((buckets + 1) * self.sub_bucket_half_count)
+        self.total = 0
+        self.min = None
+        self.max = 0
+        self.sum = 0
+
+    def _index(self, value):
+        bucket_index = (value | self.sub_bucket_mask).bit_length() - (self.sub_bucket_half_count_magnitude + 1)
+        sub_bucket_index = value >> bucket_index
+        return ((bucket_index + 1) << self.sub_bucket_half_count_magnitude) + \
+            (sub_bucket_index - self.sub_bucket_half_count)
+
+    def _value_at_index(self, index):
+        bucket_index = (index >> self.sub_bucket_half_count_magnitude) - 1
+        sub_bucket_index = (index & (self.sub_bucket_half_count - 1)) + self.sub_bucket_half_count
+        if bucket_index < 0:
+            sub_bucket_index -= self.sub_bucket_half_count
+            bucket_index = 0
+        # Report the highest value that shares this bucket, as HdrHistogram does
+        return (sub_bucket_index << bucket_index) + (1 << bucket_index) - 1
+
+    def record(self, value, count=1):
+        """Record an integer value in microseconds; values are clamped to `highest`."""
+        value = min(max(int(value), 0), self.highest)
+        self.counts[self._index(value)] += count
+        self.total += count
+        self.sum += value * count
+        if self.min is None or value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def record_seconds(self, seconds, count=1):
+        self.record(seconds * 1000000, count)
+
+    def merge(self, other):
+        if len(other.counts) != len(self.counts):
+            raise ValueError('Cannot merge histograms with different layouts')
+        for index, count in enumerate(other.counts):
+            if count:
+                self.counts[index] += count
+        self.total += other.total
+        self.sum += other.sum
+        if other.min is not None and (self.min is None or other.min < self.min):
+            self.min = other.min
+        self.max = max(self.max, other.max)
+        return self
+
+    def value_at_percentile(self, percentile):
+        if not self.total:
+            return 0
+        target = max(1, math.ceil(percentile / 100.0 * self.total))
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return min(self._value_at_index(index), self.max)
+        return self.max
+
+    def buckets(self):
+        """Return (values, counts) for the non-empty buckets, lowest value first."""
+        values = []
+        counts = []
+        for index, count in enumerate(self.counts):
+            if count:
+                values.append(min(self._value_at_index(index), self.max))
+                counts.append(count)
+        return values, counts
+
+    def mean(self):
+        return self.sum / self.total if self.total else 0
+
+    def summary(self, percentiles=REPORTED_PERCENTILES):
+        """Latency summary in milliseconds."""
+        result = {
+            'count': self.total,
+            'min_ms': (self.min or 0) / 1000.0,
+            'mean_ms': self.mean() / 1000.0,
+            'max_ms': self.max / 1000.0,
+        }
+        for p in percentiles:
+            result[f'p{p:g}_ms'.replace('.', '_')] = self.value_at_percentile(p) / 1000.0
+        return result
+
+    def encode(self):
+        """Serialize to a base64 string of (index gap, count) varint pairs."""
+        out = bytearray()
+        for value in (self.highest, self.significant_figures, self.min or 0, self.max, self.sum):
+            _write_varint(out, value)
+        last = -1
+        for index, count in enumerate(self.counts):
+            if count:
+                _write_varint(out, index - last)
+                _write_varint(out, count)
+                last = index
+        return base64.b64encode(zlib.compress(bytes(out))).decode('ascii')
+
+    @classmethod
+    def decode(cls, encoded):
+        data = zlib.decompress(base64.b64decode(encoded))
+        header = []
+        pos = 0
+        for _ in range(5):
+            value, pos = _read_varint(data, pos)
+            header.append(value)
+        highest, significant_figures, minimum, maximum, total_sum = header
+        histogram = cls(highest, significant_figures)
+        index = -1
+        while pos < len(data):
+            gap, pos = _read_varint(data, pos)
+            count, pos = _read_varint(data, pos)
+            index += gap
+            histogram.counts[index] = count
+            histogram.total += count
+        histogram.min = minimum if histogram.total else None
+        histogram.max = maximum
+        histogram.sum = total_sum
+        return histogram
+
+
+def merge_encoded(encoded_histograms):
+    """Merge serialized histograms into one LatencyHistogram (or None)."""
+    merged = None
+    for encoded in encoded_histograms:
+        histogram = LatencyHistogram.decode(encoded)
+        merged = histogram if merged is None else merged.merge(histogram)
+    return merged
@@ -0,0 +1,238 @@
+"""Shard planning and worker launch backends for start_test.
+
+A test's concurrency is split into shards, one per worker, spread over the
+test's regions. Each backend knows how to bring up one worker for a shard;
+start_test only deals with the plan and the backend interface, so the fan-out
+logic can be exercised without touching EC2.
+"""
+import math
+import os
+import subprocess
+import sys
+import tempfile
+
+# Users one t3.micro worker can drive before its own CPU/NIC is the bottleneck
+DEFAULT_USERS_PER_WORKER = 250
+DEFAULT_INSTANCE_TYPE = 't3.micro'
+AMAZON_LINUX_AMI = 'resolve:ssm:/aws/service/ami-amazon-linux-latest/amzn2-ami-hvm-x86_64-gp2'
+WORKER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'load_worker.py')
+# Seconds a local worker waits for start_test to publish the shards it was launched for
+LOCAL_CLAIM_TIMEOUT = 60
+
+
+def plan_shards(concurrent_users, regions, workers_per_region=None,
+                users_per_worker=DEFAULT_USERS_PER_WORKER):
+    """Split concurrent_users across regions and workers.
+
+    Returns a list of {'shardId', 'region', 'concurrent_users', 'first_user'}
+    dicts, first_user being the test-wide number of the shard's first user.
+    When workers_per_region is not given it is sized so no worker drives more
+    than users_per_worker users.
+    """
+    concurrent_users = int(concurrent_users)
+    if concurrent_users < 1:
+        raise ValueError('concurrent_users must be a positive integer')
+    regions = [region.strip() for region in regions if region.strip()]
+    if not regions:
+        raise ValueError('At least one region is required')
+
+    if workers_per_region is None:
+        per_region = math.ceil(concurrent_users / len(regions))
+        workers_per_region = max(1, math.ceil(per_region / users_per_worker))
+    workers = len(regions) * int(workers_per_region)
+    workers = max(1, min(workers, concurrent_users))
+
+    base, extra = divmod(concurrent_users, workers)
+    shards = []
+    first_user = 0
+    for index in range(workers):
+        users = base + (1 if index < extra else 0)
+        shards.append({
+            'shardId': f'shard-{index:03d}',
+            # Round-robin so each region gets an even share of the workers
+            'region': regions[index % len(regions)],
+            'concurrent_users': users,
+            'first_user': first_user,
+        })
+        first_user += users
+    return shards
+
+
+class LaunchBackend:
+    """Interface for bringing up one worker per shard."""
+
+    name = None
+    # Whether launch uses the worker user data start_test renders
+    needs_user_data = True
+    # Whether only python engines (load_worker --claim) ever pick the shards up
+    python_only = False
+    # The one region every worker runs in, or None when workers run in the shards' regions
+    region = None
+
+    def workers_per_region(self, regions):
+        """Workers per region to plan for when the test does not say; None sizes by users."""
+        return None
+
+    def prepare(self, test_id, shards):
+        """Called once with all of a test's shards before any is launched.
+
+        Returns True when workers had to be booted for the test.
+        """
+        return False
+
+    def launch(self, test_id, shard, user_data):
+        """Start a worker for `shard` and return its worker/instance id.
+
+        None means no worker was started for the shard yet.
+        """
+        raise NotImplementedError
+
+
+class Ec2Backend(LaunchBackend):
+    name = 'ec2'
+
+    def __init__(self, instance_type=DEFAULT_INSTANCE_TYPE, image_id=AMAZON_LINUX_AMI,
+                 instance_profile=None, client_factory=None):
+        self.instance_type = instance_type
+        self.image_id = image_id
+        self.instance_profile = instance_profile
+        self.client_factory = client_factory or _boto3_ec2_client
+
+    def launch(self, test_id, shard, user_data):
+        params = {
+            'ImageId': self.image_id,
+            'MinCount': 1,
+            'MaxCount': 1,
+            'InstanceType': self.instance_type,
+            'UserData': user_data,
+            'InstanceInitiatedShutdownBehavior': 'terminate',
+            'TagSpecifications': [{
+                'ResourceType': 'instance',
+                'Tags': [
+                    {'Key': 'Name', 'Value': f'LoadTest-{test_id[:8]}-{shard["shardId"]}'},
+                    {'Key': 'TestId', 'Value': test_id},
+                    {'Key': 'ShardId', 'Value': shard['shardId']}
+                ]
+            }]
+        }
+        if self.instance_profile:
+            params['IamInstanceProfile'] = {'Arn': self.instance_profile}
+        response = self.client_factory(shard['region']).run_instances(**params)
+        return response['Instances'][0]['InstanceId']
+
+
+class QueueBackend(LaunchBackend):
+    """Launches nothing: shards stay open for pooled engines to claim (see work_queue)."""
+
+    name = 'queue'
+    needs_user_data = False
+
+    def launch(self, test_id, shard, user_data):
+        return None
+
+
+class PoolBackend(QueueBackend):
+    """Shards are claimed by a warm worker pool, scaled up to fit the test (see worker_pool)."""
+
+    name = 'pool'
+    python_only = True
+
+    def __init__(self, pool=None):
+        self.pool = pool
+
+    @property
+    def region(self):
+        # Pool engines claim any shard, so they all run where the provider starts them
+        return getattr(getattr(self.pool, 'provider', None), 'region', None)
+
+    def prepare(self, test_id, shards):
+        if self.pool is None:
+            return False
+        # Newly started engines have to boot before they can claim
+        return bool(self.pool.scale(len(shards)))
+
+
+class LocalBackend(LaunchBackend):
+    """Runs each shard as an engine process on this host, one per core.
+
+    For CI and offline runs. Every process is `load_worker.py --claim` with a
+    single engine process, so shards are claimed and results written exactly
+    as on a cloud worker, through the CONFIG_TABLE and RESULTS_TABLE tables
+    (DynamoDB Local, with DYNAMODB_ENDPOINT, for a run without AWS).
+    """
+
+    name = 'local'
+    needs_user_data = False
+    python_only = True
+
+    def __init__(self, processes=None, log_dir=None, claim_timeout=LOCAL_CLAIM_TIMEOUT):
+        self.processes = int(processes or os.cpu_count() or 1)
+        self.log_dir = log_dir or tempfile.gettempdir()
+        self.claim_timeout = claim_timeout
+        self.running = {}
+
+    def workers_per_region(self, regions):
+        return max(1, self.processes // max(1, len(regions)))
+
+    def launch(self, test_id, shard, user_data):
+        worker_id = f'local-{test_id[:8]}-{shard["shardId"]}'
+        with open(os.path.join(self.log_dir, f'{worker_id}.log'), 'w') as log:
+            self.running[worker_id] = subprocess.Popen(
+                # Any worker may claim any shard, so each reports the region of the shard it claims
+                [sys.executable, WORKER_SCRIPT, '--claim', '--processes', '1',
+                 '--claim-timeout', str(self.claim_timeout), '--worker-id', worker_id],
+                stdout=log, stderr=subprocess.STDOUT
+            )
+        return worker_id
+
+    def wait(self, timeout=None):
+        """Wait for every launched worker; returns {worker_id: exit code}."""
+        return {worker_id: process.wait(timeout) for worker_id, process in self.running.items()}
+
+
+class FakeEc2Backend(LaunchBackend):
+    """Records launches in memory; used to exercise fan-out locally."""
+
+    name = 'fake'
+
+    def __init__(self, fail_regions=()):
+        self.fail_regions = set(fail_regions)
+        self.launched = []
+
+    def launch(self, test_id, shard, user_data):
+        if shard['region'] in self.fail_regions:
+            raise RuntimeError(f'Simulated launch failure in {shard["region"]}')
+        worker_id = f'i-fake{len(self.launched):013d}'
+        self.launched.append({
+            'testId': test_id,
+            'shard': dict(shard),
+            'user_data': user_data,
+            'worker_id': worker_id,
+        })
+        return worker_id
+
+
+_ec2_clients = {}
+
+
+def _boto3_ec2_client(region):
+    # Cached per region so warm Lambda invocations skip endpoint resolution
+    if region not in _ec2_clients:
+        import boto3
+        _ec2_clients[region] = boto3.client('ec2', region_name=region)
+    return _ec2_clients[region]
+
+
+BACKENDS = {
+    Ec2Backend.name: Ec2Backend,
+    FakeEc2Backend.name: FakeEc2Backend,
+    QueueBackend.name: QueueBackend,
+    PoolBackend.name: PoolBackend,
+    LocalBackend.name: LocalBackend,
+}
+
+
+def get_backend(name, **kwargs):
+    if name not in BACKENDS:
+        raise ValueError(f'Unknown launch backend: {name}')
+    return BACKENDS[name](**kwargs)
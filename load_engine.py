@@ -0,0 +1,938 @@
+#!/usr/bin/env python3
+"""Asyncio HTTP/1.1 load engine used by the test workers in place of `ab`.
+
+Each process runs one event loop driving a share of the virtual users. Every
+user owns one keep-alive connection and reuses it until the server closes it,
+so a single small instance can push the target far harder than `ab` could.
+
+Connection policies (see connection_policy) make users reconnect after a
+number of requests and optionally resume TLS sessions, as browsers do.
+
+Tests given a target rate run open-loop instead: a fixed pool of senders
+works through a schedule of intended send times, and latency is measured
+from those, so a slow target cannot hide its tail by slowing the load down.
+"""
+import asyncio
+import ipaddress
+import math
+import multiprocessing
+import os
+import queue
+import random
+import socket
+import ssl
+import threading
+import time
+from urllib.parse import urlsplit
+
+from cache_mode import CLASSES as CACHE_CLASSES, CacheBuster, classify as classify_cache
+from connection_policy import ResumingContext, assign as assign_policies, parse as parse_policies, resume_session
+from latency_histogram import LatencyHistogram
+from timeseries import SeriesRecorder, merge_buckets
+from workload import AliasTable
+
+USER_AGENT = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+              '(KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36')
+
+CONNECT_TIMEOUT = 10
+REQUEST_TIMEOUT = 30
+# Seconds a per-second bucket is held back so every process has flushed it
+SERIES_LAG = 2
+ARRIVALS = ('constant', 'poisson')
+# Seconds between checks of the stop event
+STOP_POLL_INTERVAL = 0.2
+# Once stopped, seconds requests in flight get to complete before they are cut off
+DRAIN_TIMEOUT = 5.0
+# Seconds before the start barrier that connections are opened; short enough
+# that servers with a keep-alive timeout of a few seconds keep them
+WARMUP_LEAD = 1.0
+# An open-loop send this far behind its intended time counts as late
+LATE_THRESHOLD = 0.01
+# Timed separately for every request; the first three only when it opened a connection
+PHASES = ('dns', 'connect', 'tls', 'ttfb', 'transfer')
+CONNECTION_PHASES = PHASES[:3]
+
+
+class Target:
+    def __init__(self, url):
+        if not url.startswith(('http://', 'https://')):
+            url = f'https://{url}'
+        parts = urlsplit(url)
+        self.url = url
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port or (443 if parts.scheme == 'https' else 80)
+        self.path = parts.path or '/'
+        if parts.query:
+            self.path += '?' + parts.query
+        try:
+            ipaddress.ip_address(self.host)
+            self.numeric = True
+        except ValueError:
+            self.numeric = False
+        if parts.port:
+            self.host_header = f'{self.host}:{parts.port}'
+        else:
+            self.host_header = self.host
+
+    def request_bytes(self, path=None, extra_headers=''):
+        return (
+            f'GET {path or self.path} HTTP/1.1\r\n'
+            f'Host: {self.host_header}\r\n'
+            f'User-Agent: {USER_AGENT}\r\n'
+            'Accept: text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8\r\n'
+            'Accept-Encoding: gzip, deflate\r\n'
+            'Connection: keep-alive\r\n'
+            f'{extra_headers}'
+            '\r\n'
+        ).encode('latin-1')
+
+
+class PhaseError(Exception):
+    """Opening a connection failed in phase ('dns', 'connect' or 'tls')."""
+
+    def __init__(self, phase, error):
+        super().__init__(f'{phase}: {error!r}')
+        self.phase = phase
+
+
+class CacheClassStats:
+    __slots__ = ('requests', 'bytes', 'latency')
+
+    def __init__(self):
+        self.requests = 0
+        self.bytes = 0
+        self.latency = LatencyHistogram()
+
+    def to_dict(self):
+        return {'requests': self.requests, 'bytes': self.bytes, 'histogram': self.latency.encode()}
+
+
+class PolicyStats:
+    __slots__ = ('requests', 'failures', 'bytes', 'connections', 'handshakes', 'resumed', 'latency', 'tls')
+
+    def __init__(self):
+        self.requests = 0
+        self.failures = 0
+        self.bytes = 0
+        self.connections = 0
+        # TLS handshakes, and those that resumed a session
+        self.handshakes = 0
+        self.resumed = 0
+        self.latency = LatencyHistogram()
+        self.tls = LatencyHistogram()
+
+    def to_dict(self):
+        result = {key: getattr(self, key) for key in self.__slots__ if key not in ('latency', 'tls')}
+        result['histogram'] = self.latency.encode()
+        result['tls_histogram'] = self.tls.encode()
+        return result
+
+
+class Client:
+    """A user's connection policy, its stats, and the TLS session it resumes on reconnecting."""
+    __slots__ = ('policy', 'stats', 'session')
+
+    def __init__(self, policy, stats):
+        self.policy = policy
+        self.stats = stats
+        self.session = None
+
+
+class Stats:
+    """Counters for one process; merged across processes by `merge`."""
+
+    COUNTERS = ('requests', 'failures', 'non_2xx', 'bytes', 'connections', 'keepalive_reused',
+                'busted', 'late', 'unsent', 'abandoned', 'connect_fallbacks')
+
+    def __init__(self, cache_aware=False, policies=()):
+        self.requests = 0
+        self.failures = 0
+        self.non_2xx = 0
+        self.bytes = 0
+        self.connections = 0
+        self.keepalive_reused = 0
+        self.busted = 0
+        # Resolved addresses that failed to connect before another one did
+        self.connect_fallbacks = 0
+        # Open-loop only: sends behind schedule, and slots never sent by the deadline
+        self.late = 0
+        self.unsent = 0
+        # Stopped tests only: requests still in flight when the drain timed out,
+        # and the (corrected) wall-clock time the last request ended
+        self.in_flight = 0
+        self.abandoned = 0
+        self.quiet_at = None
+        self.latency = LatencyHistogram()
+        # Per phase (see PHASES), and connections that failed in each connection phase
+        self.phases = {name: LatencyHistogram() for name in PHASES}
+        self.phase_failures = {name: 0 for name in CONNECTION_PHASES}
+        # Per cache class (see cache_mode.CLASSES) when the test is cache-aware
+        self.cache = {name: CacheClassStats() for name in CACHE_CLASSES} if cache_aware else None
+        # Per connection policy name when the test sets policies
+        self.policies = {policy.name: PolicyStats() for policy in policies} or None
+
+    def record(self, latency, status, nbytes, reused, cache_class=None):
+        self.requests += 1
+        self.bytes += nbytes
+        if reused:
+            self.keepalive_reused += 1
+        if not 200 <= status < 300:
+            self.non_2xx += 1
+        self.latency.record_seconds(latency)
+        if cache_class is not None:
+            entry = self.cache[cache_class]
+            entry.requests += 1
+            entry.bytes += nbytes
+            entry.latency.record_seconds(latency)
+
+    def record_connection(self, conn):
+        self.connect_fallbacks += conn.fallbacks
+        for name in CONNECTION_PHASES:
+            seconds = conn.timings[name]
+            if seconds is not None:
+                self.phases[name].record_seconds(seconds)
+
+    def to_dict(self):
+        result = {key: getattr(self, key) for key in self.COUNTERS}
+        result['histogram'] = self.latency.encode()
+        result['phases'] = {
+            name: {'failures': self.phase_failures.get(name, 0), 'histogram': histogram.encode()}
+            for name, histogram in self.phases.items()
+        }
+        if self.quiet_at is not None:
+            result['quiet_at'] = self.quiet_at
+        if self.cache is not None:
+            result['cache'] = {name: entry.to_dict() for name, entry in self.cache.items()}
+        if self.policies is not None:
+            result['policies'] = {name: entry.to_dict() for name, entry in self.policies.items()}
+        return result
+
+    @classmethod
+    def merge(cls, dicts, elapsed):
+        total = {key: 0 for key in cls.COUNTERS}
+        histogram = LatencyHistogram()
+        for d in dicts:
+            for key in cls.COUNTERS:
+                total[key] += d[key]
+            histogram.merge(LatencyHistogram.decode(d['histogram']))
+        total['elapsed'] = elapsed
+        total['requests_per_second'] = total['requests'] / elapsed if elapsed else 0.0
+        total['transfer_rate'] = total['bytes'] / elapsed if elapsed else 0.0
+        total['latency'] = histogram.summary()
+        total['histogram'] = histogram.encode()
+        total['phases'] = {}
+        for name in PHASES:
+            entries = [d['phases'][name] for d in dicts]
+            phase_histogram = LatencyHistogram()
+            for entry in entries:
+                phase_histogram.merge(LatencyHistogram.decode(entry['histogram']))
+            total['phases'][name] = dict(phase_histogram.summary(), histogram=phase_histogram.encode())
+            if name in CONNECTION_PHASES:
+                total['phases'][name]['failures'] = sum(entry['failures'] for entry in entries)
+
+        quiet = [d['quiet_at'] for d in dicts if d.get('quiet_at') is not None]
+        if quiet:
+            # The test is quiet once the last process is
+            total['quiet_at'] = max(quiet)
+
+        cache_dicts = [d['cache'] for d in dicts if d.get('cache')]
+        if cache_dicts:
+            total['cache'] = {}
+            for name in CACHE_CLASSES:
+                entries = [cache[name] for cache in cache_dicts]
+                class_histogram = LatencyHistogram()
+                for entry in entries:
+                    class_histogram.merge(LatencyHistogram.decode(entry['histogram']))
+                requests = sum(entry['requests'] for entry in entries)
+                nbytes = sum(entry['bytes'] for entry in entries)
+                total['cache'][name] = {
+                    'requests': requests,
+                    'bytes': nbytes,
+                    'requests_per_second': requests / elapsed if elapsed else 0.0,
+                    'transfer_rate': nbytes / elapsed if elapsed else 0.0,
+                    'latency': class_histogram.summary(),
+                    'histogram': class_histogram.encode(),
+                }
+
+        policy_dicts = [d['policies'] for d in dicts if d.get('policies')]
+        if policy_dicts:
+            total['policies'] = {}
+            # A process with few users may not run every policy
+            names = list(dict.fromkeys(name for policies in policy_dicts for name in policies))
+            for name in names:
+                entries = [policies[name] for policies in policy_dicts if name in policies]
+                summed = {key: sum(entry[key] for entry in entries)
+                          for key in ('requests', 'failures', 'bytes', 'connections', 'handshakes', 'resumed')}
+                latency = LatencyHistogram()
+                tls = LatencyHistogram()
+                for entry in entries:
+                    latency.merge(LatencyHistogram.decode(entry['histogram']))
+                    tls.merge(LatencyHistogram.decode(entry['tls_histogram']))
+                total['policies'][name] = dict(
+                    summed,
+                    requests_per_second=summed['requests'] / elapsed if elapsed else 0.0,
+                    requests_per_connection=summed['requests'] / summed['connections'] if summed['connections'] else 0.0,
+                    # Full handshakes are what costs the load balancer CPU
+                    full_handshakes_per_second=(summed['handshakes'] - summed['resumed']) / elapsed if elapsed else 0.0,
+                    resumption_rate=summed['resumed'] / summed['handshakes'] if summed['handshakes'] else 0.0,
+                    latency=latency.summary(),
+                    tls=tls.summary(),
+                    histogram=latency.encode(),
+                    tls_histogram=tls.encode(),
+                )
+        return total
+
+
+class Connection:
+    def __init__(self, reader, writer, timings=None, fallbacks=0):
+        self.reader = reader
+        self.writer = writer
+        self.served = 0
+        # Seconds spent in each of CONNECTION_PHASES; tls is None for plain HTTP
+        self.timings = timings or dict.fromkeys(CONNECTION_PHASES)
+        # Addresses tried and given up on before this connection's
+        self.fallbacks = fallbacks
+        ssl_object = writer.get_extra_info('ssl_object')
+        self.resumed = ssl_object is not None and ssl_object.session_reused
+
+    def session(self):
+        ssl_object = self.writer.get_extra_info('ssl_object')
+        return ssl_object.session if ssl_object is not None else None
+
+    def close(self):
+        try:
+            self.writer.close()
+        except Exception:
+            pass
+
+
+def ssl_context():
+    # What ssl.create_default_context sets up, in a context that can resume sessions
+    ctx = ResumingContext(ssl.PROTOCOL_TLS_CLIENT)
+    ctx.load_default_certs(ssl.Purpose.SERVER_AUTH)
+    ctx.set_alpn_protocols(['http/1.1'])
+    return ctx
+
+
+async def open_connection(target, ctx, session=None):
+    """Resolve, connect and, for https, handshake as separately timed phases.
+
+    The resolver is asked for every connection, as a browser with a cold
+    cache would. The resolved addresses are tried in order, as asyncio does,
+    so a dual-stack target without an IPv6 route falls back to IPv4; each
+    attempt gets an even share of the time left, and connect is the time of
+    the attempt that succeeded. CONNECT_TIMEOUT bounds the three phases
+    together; a failure raises PhaseError naming the phase it happened in.
+    session, if given, is a TLS session to resume (ctx must be a
+    ResumingContext).
+    """
+    loop = asyncio.get_running_loop()
+    began = loop.time()
+    deadline = began + CONNECT_TIMEOUT
+    timings = dict.fromkeys(CONNECTION_PHASES)
+    phase = 'dns'
+    sock = None
+    fallbacks = 0
+    try:
+        if target.numeric:
+            # Nothing to look up, so skip the resolver's thread pool
+            addresses = socket.getaddrinfo(target.host, target.port, type=socket.SOCK_STREAM,
+                                           flags=socket.AI_NUMERICHOST)
+        else:
+            addresses = await asyncio.wait_for(
+                loop.getaddrinfo(target.host, target.port, type=socket.SOCK_STREAM), CONNECT_TIMEOUT)
+        resolved = loop.time()
+        timings['dns'] = resolved - began
+
+        phase = 'connect'
+        for index, (family, kind, proto, _, address) in enumerate(addresses):
+            attempt = loop.time()
+            remaining = len(addresses) - index
+            try:
+                sock = socket.socket(family, kind, proto)
+                sock.setblocking(False)
+                await asyncio.wait_for(loop.sock_connect(sock, address), (deadline - attempt) / remaining)
+                break
+            except (OSError, asyncio.TimeoutError):
+                if sock is not None:
+                    sock.close()
+                    sock = None
+                if remaining == 1:
+                    raise
+                fallbacks += 1
+        connected = loop.time()
+        timings['connect'] = connected - attempt
+
+        # Over plain HTTP this only wraps the socket in streams
+        phase = 'tls'
+        https = target.scheme == 'https'
+        token = resume_session.set(session)
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(
+                    sock=sock,
+                    ssl=ctx if https else None,
+                    server_hostname=target.host if https else None,
+                    limit=2 ** 20,
+                ),
+                deadline - connected,
+            )
+        finally:
+            resume_session.reset(token)
+        if https:
+            timings['tls'] = loop.time() - connected
+    except Exception as e:
+        if sock is not None:
+            sock.close()
+        raise PhaseError(phase, e) from e
+    return Connection(reader, writer, timings, fallbacks)
+
+
+async def read_response(reader, keep_body=False):
+    """Read one HTTP/1.1 response; returns (status, headers, wire_bytes, body, head_at).
+
+    body is only collected when keep_body is set and is b'' otherwise.
+    head_at is the loop time the response headers had arrived.
+    """
+    head = await reader.readuntil(b'\r\n\r\n')
+    head_at = asyncio.get_running_loop().time()
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split(' ', 2)[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+    nbytes = len(head)
+    body = b''
+    if 'content-length' in headers:
+        length = int(headers['content-length'])
+        if length:
+            data = await reader.readexactly(length)
+            if keep_body:
+                body = data
+        nbytes += length
+    elif headers.get('transfer-encoding', '').lower() == 'chunked':
+        chunks = []
+        while True:
+            size_line = await reader.readuntil(b'\r\n')
+            size = int(size_line.split(b';', 1)[0], 16)
+            data = await reader.readexactly(size + 2)
+            if keep_body and size:
+                chunks.append(data[:-2])
+            nbytes += len(size_line) + size + 2
+            if size == 0:
+                break
+        body = b''.join(chunks)
+    elif status not in (204, 304) and not 100 <= status < 200:
+        data = await reader.read()
+        nbytes += len(data)
+        if keep_body:
+            body = data
+        headers['connection'] = 'close'
+    return status, headers, nbytes, body, head_at
+
+
+class RequestMix:
+    """Picks the request to send next from the workload URLs."""
+
+    def __init__(self, target, urls, weights, buster=None):
+        self.target = target
+        self.paths = [Target(url).path for url in urls]
+        self.requests = [target.request_bytes(path) for path in self.paths]
+        self.alias = AliasTable(weights) if len(urls) > 1 else None
+        self.buster = buster
+
+    def pick(self, rng, stats):
+        """Return (url index, request bytes)."""
+        index = self.alias.pick(rng) if self.alias is not None else 0
+        if self.buster is not None:
+            busted = self.buster.request(self.target, self.paths[index], rng)
+            if busted is not None:
+                stats.busted += 1
+                return index, busted
+        return index, self.requests[index]
+
+
+class ArrivalSchedule:
+    """Intended send times for an open-loop test.
+
+    Shared by all senders on one event loop. Arrivals are generated in units of
+    "work" (one per request, or exponential gaps for Poisson) and mapped to
+    time through the integral of the offered rate, which ramps up linearly over
+    ramp_up seconds and then stays at rate.
+    """
+
+    def __init__(self, rate, start, ramp_up=0, arrival='constant', rng=None):
+        if arrival not in ARRIVALS:
+            raise ValueError(f'Unknown arrival process: {arrival}')
+        self.rate = float(rate)
+        self.start = start
+        self.ramp_up = ramp_up
+        self.poisson = arrival == 'poisson'
+        self.rng = rng or random.Random()
+        self.work = 0.0
+
+    def _time_at(self, work):
+        if work < self.rate * self.ramp_up / 2:
+            return math.sqrt(2 * self.ramp_up * work / self.rate)
+        return work / self.rate + self.ramp_up / 2
+
+    def next(self):
+        if self.poisson:
+            self.work += self.rng.expovariate(1.0)
+        intended = self.start + self._time_at(self.work)
+        if not self.poisson:
+            self.work += 1
+        return intended
+
+    def remaining(self, deadline):
+        """Count (and consume) the arrivals still due before deadline."""
+        count = 0
+        while self.next() < deadline:
+            count += 1
+        return count
+
+
+async def exchange(target, ctx, conn, picked, stats, series, started, archive=None, client=None):
+    """Send one request, opening a connection if needed, and record the outcome.
+
+    picked is (url index, request bytes) from RequestMix.pick. Latency is
+    measured from `started`. client, if given, applies a connection policy
+    and records into its stats as well. Returns the connection to reuse for
+    the next request, or None when it was closed.
+    """
+    loop = asyncio.get_running_loop()
+    url, request = picked
+    cache_aware = stats.cache is not None
+    # A connection warmed up before the start barrier has served nothing yet
+    reused = conn is not None and conn.served > 0
+    connect = 0.0
+    # Not decremented when the drain cancels the request, which leaves the abandoned count
+    stats.in_flight += 1
+    try:
+        if conn is None:
+            opening = loop.time()
+            conn = await open_connection(target, ctx, client.session if client is not None else None)
+            connect = loop.time() - opening
+            stats.connections += 1
+            stats.record_connection(conn)
+            if client is not None:
+                _record_policy_connection(client.stats, conn)
+        if client is not None and conn.served + 1 == client.policy.requests_per_connection:
+            # The server closes the connection after the last request, as it
+            # would for a browser, so TIME_WAIT does not use up this worker's ports
+            request = request.replace(b'Connection: keep-alive', b'Connection: close', 1)
+        sent = loop.time()
+        conn.writer.write(request)
+        status, headers, nbytes, body, head_at = await asyncio.wait_for(
+            read_response(conn.reader, cache_aware), REQUEST_TIMEOUT)
+    except Exception as e:
+        stats.in_flight -= 1
+        stats.failures += 1
+        if isinstance(e, PhaseError):
+            stats.phase_failures[e.phase] += 1
+        if client is not None:
+            client.stats.failures += 1
+        if series is not None:
+            series.record_failure()
+        if archive is not None:
+            archive.record(started, url, 0, 0, connect, 0.0, loop.time() - started)
+        if conn is not None:
+            conn.close()
+        return None
+
+    stats.in_flight -= 1
+    ended = loop.time()
+    latency = ended - started
+    stats.phases['ttfb'].record_seconds(head_at - sent)
+    stats.phases['transfer'].record_seconds(ended - head_at)
+    if archive is not None:
+        archive.record(started, url, status, nbytes, connect, head_at - started, latency)
+    stats.record(latency, status, nbytes, reused,
+                 classify_cache(headers, body) if cache_aware else None)
+    if series is not None:
+        series.record(latency, status, nbytes)
+    conn.served += 1
+    if client is not None:
+        entry = client.stats
+        entry.requests += 1
+        entry.bytes += nbytes
+        entry.latency.record_seconds(latency)
+        if conn.served == 1 and client.policy.tls_sessions:
+            # A TLS 1.3 ticket arrives after the handshake, so take it once a response is in
+            client.session = conn.session()
+        if conn.served == client.policy.requests_per_connection:
+            # Also when the server ignored the Connection: close
+            conn.close()
+            return None
+    if headers.get('connection', '').lower() == 'close':
+        conn.close()
+        return None
+    return conn
+
+
+def _record_policy_connection(entry, conn):
+    entry.connections += 1
+    if conn.timings['tls'] is not None:
+        entry.handshakes += 1
+        entry.tls.record_seconds(conn.timings['tls'])
+        if conn.resumed:
+            entry.resumed += 1
+
+
+async def warm_connection(target, ctx, stats, start_at, client=None):
+    """Open a connection just before start_at so the first request skips the handshake."""
+    loop = asyncio.get_running_loop()
+    delay = start_at - WARMUP_LEAD - loop.time()
+    if delay > 0:
+        await asyncio.sleep(delay)
+    try:
+        conn = await open_connection(target, ctx)
+    except Exception:
+        # The first request will simply connect itself
+        return None
+    stats.connections += 1
+    stats.record_connection(conn)
+    if client is not None:
+        _record_policy_connection(client.stats, conn)
+    return conn
+
+
+async def virtual_user(target, ctx, mix, stats, series, start_at, deadline, warm=False, archive=None,
+                       halting=None, client=None):
+    """Closed loop: send the next request as soon as the previous one completes.
+
+    Setting halting (an asyncio.Event) ends the loop after the request in
+    flight. client, if given, is the user's Client under a connection policy.
+    """
+    loop = asyncio.get_running_loop()
+    halting = halting or asyncio.Event()
+    conn = await warm_connection(target, ctx, stats, start_at, client) if warm else None
+    delay = start_at - loop.time()
+    if delay > 0:
+        await asyncio.sleep(delay)
+
+    rng = random.Random()
+    try:
+        while loop.time() < deadline and not halting.is_set():
+            conn = await exchange(target, ctx, conn, mix.pick(rng, stats), stats, series, loop.time(),
+                                  archive, client)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+async def sender(target, ctx, mix, stats, series, schedule, deadline, warm=False, archive=None,
+                 halting=None, client=None):
+    """Open loop: take the next slot from schedule and send at its intended time.
+
+    Latency runs from the intended send time, not the actual one, so time a
+    request spends waiting for a free sender while the target is slow counts
+    against the target (coordinated-omission correction). The pool of senders
+    bounds the requests in flight; overdue slots are sent as soon as a sender
+    frees up rather than queued as coroutines. Setting halting (an
+    asyncio.Event) ends the loop after the request in flight. client, if
+    given, is the sender's Client under a connection policy.
+    """
+    loop = asyncio.get_running_loop()
+    halting = halting or asyncio.Event()
+    rng = random.Random()
+    conn = await warm_connection(target, ctx, stats, schedule.start, client) if warm else None
+    try:
+        # Checked on every slot: a sender behind schedule never sleeps, so never sees it otherwise
+        while not halting.is_set():
+            intended = schedule.next()
+            if intended >= deadline:
+                break
+            now = loop.time()
+            if now >= deadline:
+                # Overloaded: this slot came due but never got a sender
+                stats.unsent += 1
+                break
+            if intended > now:
+                await asyncio.sleep(intended - now)
+                if halting.is_set():
+                    break
+            elif now - intended > LATE_THRESHOLD:
+                stats.late += 1
+            conn = await exchange(target, ctx, conn, mix.pick(rng, stats), stats, series, intended,
+                                  archive, client)
+    finally:
+        if conn is not None:
+            conn.close()
+
+
+async def _watch_stop(stop, tasks, halting, stats):
+    """Once stop is set, send nothing new and give requests in flight DRAIN_TIMEOUT to end.
+
+    Users waiting for their start or their next slot are cancelled with
+    whatever is still in flight after the timeout.
+    """
+    while not stop.is_set():
+        await asyncio.sleep(STOP_POLL_INTERVAL)
+    halting.set()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + DRAIN_TIMEOUT
+    while stats.in_flight and loop.time() < deadline:
+        await asyncio.sleep(0.01)
+    for task in tasks:
+        task.cancel()
+
+
+async def _flush_series(series, series_queue):
+    while True:
+        await asyncio.sleep(1)
+        buckets = series.drain()
+        if buckets:
+            series_queue.put(buckets)
+
+
+async def run_loop(urls, weights, users, duration, ramp_up=0, series_queue=None, cache=None,
+                   rate=None, arrival='constant', stop=None, start_at=None, clock_offset=0.0,
+                   archive=None, policies=None, policy_offset=0):
+    """Drive `users` virtual users on the current event loop.
+
+    When series_queue is given, completed per-second buckets are put on it
+    about once a second. cache, if given, is a cache-mode spec (see
+    cache_mode.CacheBuster.from_spec) that turns on cache-busting and
+    per-cache-class stats. When rate is given the test is open-loop: `users`
+    senders offer `rate` requests per second with constant or Poisson
+    arrivals instead of each user looping as fast as the target answers.
+    Setting the stop event ends the run early: requests in flight get up to
+    DRAIN_TIMEOUT seconds to complete and the stats record how many were cut
+    off ('abandoned') and when the loop went quiet ('quiet_at'). start_at,
+    if given, is the wall-clock time (corrected by clock_offset) to begin at:
+    connections are warmed up just before it and no request is sent earlier.
+    archive, if given, is the path of a Parquet file every request is written
+    to (see request_archive). policies, if given, is a connection policy spec
+    (see connection_policy); these users are numbers policy_offset onwards of
+    the whole test's, so every process together runs the policies' shares.
+    """
+    # Every URL shares the first one's origin, so one connection serves them all
+    target = Target(urls[0])
+    mix = RequestMix(target, urls, weights, CacheBuster.from_spec(cache))
+    ctx = ssl_context()
+    policies = parse_policies(policies)
+    stats = Stats(cache_aware=cache is not None, policies=policies)
+    clients = [None] * users
+    if policies:
+        clients = [Client(policy, stats.policies[policy.name])
+                   for policy in assign_policies(policies, policy_offset + users)[policy_offset:]]
+    series = None
+    if series_queue is not None:
+        # Keyed on corrected time so every worker's seconds line up
+        series = SeriesRecorder(clock=lambda: time.time() + clock_offset)
+    loop = asyncio.get_running_loop()
+    began = loop.time()
+    if start_at is not None:
+        # Map the barrier onto the loop clock
+        began += max(0.0, start_at - (time.time() + clock_offset))
+    warm = start_at is not None
+    deadline = began + ramp_up + duration
+    step = ramp_up / users if users and ramp_up else 0
+    if archive is not None:
+        from request_archive import ArchiveWriter
+
+        # Archive timestamps are wall-clock, on the same corrected clock as the series
+        archive = ArchiveWriter(archive, mix.paths, time.time() + clock_offset - loop.time())
+
+    flusher = asyncio.ensure_future(_flush_series(series, series_queue)) if series else None
+    halting = asyncio.Event()
+    if rate:
+        schedule = ArrivalSchedule(rate, began, ramp_up, arrival)
+        tasks = [asyncio.ensure_future(
+                     sender(target, ctx, mix, stats, series, schedule, deadline, warm, archive,
+                            halting, clients[i]))
+                 for i in range(users)]
+    else:
+        tasks = [asyncio.ensure_future(
+                     virtual_user(target, ctx, mix, stats, series, began + i * step, deadline, warm,
+                                  archive, halting, clients[i]))
+                 for i in range(users)]
+    watcher = asyncio.ensure_future(_watch_stop(stop, tasks, halting, stats)) if stop is not None else None
+    outcomes = await asyncio.gather(*tasks, return_exceptions=True)
+    if watcher is not None:
+        watcher.cancel()
+    if halting.is_set():
+        stats.quiet_at = time.time() + clock_offset
+        stats.abandoned = stats.in_flight
+    if archive is not None:
+        archive.close()
+    for outcome in outcomes:
+        if isinstance(outcome, Exception):
+            raise outcome
+    if rate and not (stop is not None and stop.is_set()):
+        stats.unsent += schedule.remaining(deadline)
+    if flusher is not None:
+        flusher.cancel()
+        buckets = series.drain(final=True)
+        if buckets:
+            series_queue.put(buckets)
+    return stats
+
+
+_series_queue = None
+_stop = None
+
+
+def _init_process(series_queue, stop=None):
+    global _series_queue, _stop
+    _series_queue = series_queue
+    _stop = stop
+
+
+def _process_main(args):
+    users, options = args
+    try:
+        import uvloop
+        uvloop.install()
+    except ImportError:
+        pass
+    stats = asyncio.run(run_loop(users=users, series_queue=_series_queue, stop=_stop, **options))
+    return stats.to_dict()
+
+
+def _consume_series(series_queue, on_series, done, clock_offset=0.0):
+    """Merge buckets from all processes and hand each finished second to on_series."""
+    pending = []
+    while True:
+        try:
+            pending.extend(series_queue.get(timeout=0.5))
+        except queue.Empty:
+            pass
+        finished = done.is_set()
+        if finished:
+            # Collect whatever the processes put on the queue before exiting
+            while True:
+                try:
+                    pending.extend(series_queue.get_nowait())
+                except queue.Empty:
+                    break
+        cutoff = None if finished else int(time.time() + clock_offset) - SERIES_LAG
+        ready = [b for b in pending if cutoff is None or b['second'] < cutoff]
+        if ready:
+            pending = [b for b in pending if not (cutoff is None or b['second'] < cutoff)]
+            on_series(merge_buckets(ready))
+        if finished:
+            return
+
+
+def split_users(users, processes):
+    """Spread users as evenly as possible over processes, dropping empty ones."""
+    base, extra = divmod(users, processes)
+    return [base + (1 if i < extra else 0) for i in range(processes) if base or i < extra]
+
+
+def _archive_part(archive_dir, index):
+    return os.path.join(archive_dir, f'part-{index:03d}.parquet') if archive_dir else None
+
+
+def run(url, users, duration, ramp_up=0, processes=None, on_series=None, workload=None,
+        cache=None, rate=None, arrival='constant', stop=None, start_at=None, clock_offset=0.0,
+        archive_dir=None, policies=None, policy_offset=0):
+    """Run a test using one event loop per CPU core and return merged stats.
+
+    on_series, if given, is called from a background thread with lists of
+    merged per-second buckets (see timeseries.merge_buckets) while the test
+    runs. workload, if given, is a (urls, weights) pair as returned by
+    workload.resolve and replaces url. cache, if given, is a cache-mode spec
+    such as {'bust_ratio': 0.2, 'bust_method': 'query'}; the result then has a
+    'cache' entry with stats per cache class. rate, if given, makes the test
+    open-loop at that many requests per second in total, with users as the
+    number of senders (the cap on requests in flight) and arrival 'constant'
+    or 'poisson'. stop, if given, is a multiprocessing.Event; setting it ends
+    the test early on every process, after a drain of at most DRAIN_TIMEOUT,
+    and marks the result 'stopped' with 'quiet_at', the corrected time the
+    last process stopped sending.
+    start_at, if given, is a Unix timestamp every process waits for (with
+    connections warmed up) before sending; clock_offset (true time minus this
+    host's clock, see clock_sync) corrects both the wait and the series keys.
+    archive_dir, if given, gets one Parquet file of every request per process,
+    named part-NNN.parquet. policies, if given, is a connection policy spec
+    (see connection_policy); the result then has a 'policies' entry with
+    throughput and handshake stats per policy. policy_offset is the number
+    of the first of these users in the whole test (see
+    launch_backends.plan_shards), so every shard together runs the shares.
+    """
+    urls, weights = workload or ([url], [1.0])
+    processes = processes or os.cpu_count() or 1
+    shares = split_users(int(users), processes)
+
+    series_queue = consumer = None
+    done = threading.Event()
+    if on_series is not None:
+        series_queue = multiprocessing.Queue()
+        consumer = threading.Thread(target=_consume_series,
+                                    args=(series_queue, on_series, done, clock_offset))
+        consumer.start()
+
+    options = {
+        'urls': urls, 'weights': weights, 'duration': duration, 'ramp_up': ramp_up,
+        'cache': cache, 'arrival': arrival, 'start_at': start_at, 'clock_offset': clock_offset,
+        'policies': policies,
+    }
+    # Throughput is measured from the barrier, not from when this call began
+    began = time.monotonic()
+    if start_at is not None:
+        began += max(0.0, start_at - (time.time() + clock_offset))
+    try:
+        if len(shares) == 1:
+            _init_process(series_queue, stop)
+            results = [_process_main((shares[0], dict(options, rate=rate,
+                                                       archive=_archive_part(archive_dir, 0),
+                                                       policy_offset=policy_offset)))]
+        else:
+            with multiprocessing.Pool(len(shares), _init_process, (series_queue, stop)) as pool:
+                # Each process offers the share of the rate that matches its senders
+                results = pool.map(
+                    _process_main,
+                    [(share, dict(options, rate=rate * share / int(users) if rate else None,
+                                  archive=_archive_part(archive_dir, index),
+                                  policy_offset=policy_offset + sum(shares[:index])))
+                     for index, share in enumerate(shares)],
+                )
+    finally:
+        elapsed = time.monotonic() - began
+        if consumer is not None:
+            done.set()
+            consumer.join()
+    total = Stats.merge(results, elapsed)
+    if stop is not None:
+        total['stopped'] = stop.is_set()
+    return total
+
+
+if __name__ == '__main__':
+    import argparse
+    import json
+
+    parser = argparse.ArgumentParser(description='Run a load test against a URL')
+    parser.add_argument('url')
+    parser.add_argument('-c', '--concurrency', type=int, default=10)
+    parser.add_argument('-t', '--duration', type=int, default=10)
+    parser.add_argument('-r', '--ramp-up', type=int, default=0)
+    parser.add_argument('-p', '--processes', type=int, default=None)
+    parser.add_argument('--cache-bust-ratio', type=float, default=None,
+                        help='Classify responses by cache layer and bust this share of requests')
+    parser.add_argument('--cache-bust-method', choices=('query', 'cookie'), default='query')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='Open-loop target requests per second; -c is then the sender pool')
+    parser.add_argument('--arrival', choices=ARRIVALS, default='constant')
+    parser.add_argument('--start-at', type=float, default=None,
+                        help='Unix time to start sending at, after warming up connections')
+    parser.add_argument('--archive-dir', default=None,
+                        help='Directory to write every request to as Parquet (needs pyarrow)')
+    parser.add_argument('--policies', default=None,
+                        help='Connection policy spec as JSON, see connection_policy')
+    args = parser.parse_args()
+    cache = None
+    if args.cache_bust_ratio is not None:
+        cache = {'bust_ratio': args.cache_bust_ratio, 'bust_method': args.cache_bust_method}
+    print(json.dumps(run(args.url, args.concurrency, args.duration,
+                         args.ramp_up, args.processes, cache=cache,
+                         rate=args.rate, arrival=args.arrival, start_at=args.start_at,
+                         archive_dir=args.archive_dir,
+                         policies=json.loads(args.policies) if args.policies else None), indent=2))
@@ -0,0 +1,500 @@
+#!/usr/bin/env python3
+"""Entry point run on a test engine instance launched by start_test.
+
+Runs the asyncio load engine against the configured target, batch-writes a
+per-second series to the results table while it runs and uploads the summary
+at the end. Capacity tests run a series of step tests instead (see
+capacity_search) and record each step as it finishes.
+
+With --claim the worker is a pooled engine: it waits for a shard of a running
+test, claims it (see work_queue) and takes the test settings from the config
+item instead of the command line. --serve keeps it claiming shards until it
+has been idle for --claim-timeout, as the engines of a warm pool do.
+
+With --start-at every shard of a test begins at the same instant: the worker
+estimates its clock offset (see clock_sync), warms up its connections and
+waits for the barrier, then records the offset with its results so the
+shards' series can be laid on one timeline.
+
+With --archive every request is also written to Parquet and uploaded to an
+object store (see request_archive) when the test ends.
+
+With --emf the per-second series is also published as CloudWatch Embedded
+Metric Format records (see emf), to CloudWatch Logs, a file or stdout, so
+the client-side view of a test sits on the dashboard next to the ALB's.
+
+While a shard runs the worker polls the config table for stop_test. On a
+stop the engine drains (see load_engine.DRAIN_TIMEOUT), the partial series
+and summary are uploaded with a 'stop' record of how long the load took to
+go quiet, and a launched worker exits with STOPPED_EXIT_CODE so its instance
+can shut down at once.
+"""
+import argparse
+import copy
+import json
+import multiprocessing
+import os
+import shutil
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from decimal import Decimal
+
+import capacity_search
+import clock_sync
+import emf
+import load_engine
+import object_store
+import request_archive
+import timeseries
+import work_queue
+import workload
+
+# Seconds between polls of the config item for a stop request
+STOP_CHECK_INTERVAL = 2.0
+STOPPED_EXIT_CODE = 3
+
+
+def to_item(value):
+    """Convert floats to Decimal so the value can be stored in DynamoDB."""
+    return json.loads(json.dumps(value), parse_float=Decimal)
+
+
+def results_table(table_name, region):
+    import boto3
+
+    dynamodb = boto3.resource('dynamodb', region_name=region,
+                              endpoint_url=os.environ.get('DYNAMODB_ENDPOINT'))
+    return dynamodb.Table(table_name)
+
+
+def series_writer(table, test_id, shard_id):
+    """Return an on_series callback that batch-writes per-second items."""
+    def write(merged):
+        try:
+            with table.batch_writer() as batch:
+                for item in timeseries.to_items(test_id, shard_id, merged):
+                    batch.put_item(Item=item)
+        except Exception as e:
+            # A lost second must not abort the test; the final summary still covers it
+            print(f'Error writing series: {e}')
+    return write
+
+
+def emf_publisher(args):
+    """Return the EmfPublisher for args.emf, or None when metrics are not published."""
+    if not args.emf:
+        return None
+    # The log group is in the manager's region, wherever the worker runs
+    sink = emf.sink_from_url(args.emf, f'{args.test_id}/{args.shard_id}', region=args.region)
+    return emf.EmfPublisher(sink, args.test_id, args.shard_id,
+                            properties={'Region': args.worker_region or args.region})
+
+
+def series_callback(table, args, publisher=None):
+    """series_writer for the shard, also handing each series to publisher."""
+    write_series = series_writer(table, args.test_id, args.shard_id)
+    if publisher is None:
+        return write_series
+
+    def on_series(merged):
+        write_series(merged)
+        publisher(merged)
+    return on_series
+
+
+def upload_results(table, test_id, shard_id, worker_region, stats, extra=None):
+    summary = {key: value for key, value in stats.items()
+               if key not in ('histogram', 'cache', 'phases', 'policies')}
+    item = {
+        'testId': test_id,
+        'timestamp': datetime.utcnow().isoformat(),
+        'engine': 'python',
+        'summary': to_item(summary),
+        'histogram': stats['histogram'],
+        'shardId': shard_id,
+        'region': worker_region
+    }
+    if 'cache' in stats:
+        # Per-class histograms sit next to the summary like the overall one
+        item['cache'] = to_item({
+            name: {key: value for key, value in entry.items() if key != 'histogram'}
+            for name, entry in stats['cache'].items()
+        })
+        item['cache_histograms'] = {name: entry['histogram'] for name, entry in stats['cache'].items()}
+    if 'phases' in stats:
+        item['phases'] = to_item({
+            name: {key: value for key, value in entry.items() if key != 'histogram'}
+            for name, entry in stats['phases'].items()
+        })
+        item['phase_histograms'] = {name: entry['histogram'] for name, entry in stats['phases'].items()}
+    if 'policies' in stats:
+        item['policies'] = to_item({
+            name: {key: value for key, value in entry.items() if key not in ('histogram', 'tls_histogram')}
+            for name, entry in stats['policies'].items()
+        })
+        item['policy_histograms'] = {
+            name: {'latency': entry['histogram'], 'tls': entry['tls_histogram']}
+            for name, entry in stats['policies'].items()
+        }
+    if extra:
+        item.update(to_item(extra))
+    table.put_item(Item=item)
+
+
+def sync_clock(args):
+    """Estimate the clock offset ahead of the start barrier; returns the 'clock' summary."""
+    estimate = clock_sync.estimate_offset(fallback_url=args.url)
+    uncertainty = estimate['uncertainty']
+    lag = time.time() + estimate['offset'] - args.start_at
+    print(f"Clock offset {estimate['offset'] * 1000:.1f} ms ({estimate['source']}), "
+          f"{-lag:.1f} s to start")
+    return {
+        'offset_ms': round(estimate['offset'] * 1000, 3),
+        'uncertainty_ms': round(uncertainty * 1000, 3) if uncertainty is not None else None,
+        'source': estimate['source'],
+        'start_at': args.start_at,
+        # Positive when the worker reached the barrier after it had passed
+        'start_lag_ms': round(max(lag, 0.0) * 1000, 1),
+    }
+
+
+class StopSignal:
+    """Polls the config table for stop_test and sets the engine stop events attached to it.
+
+    The record, added to the results as 'stop', has requested_at (the
+    manager's clock), seen_at and quiet_at (this worker's corrected clock)
+    and stop_to_quiet_ms, the time from stop_test until the last request
+    ended.
+    """
+
+    def __init__(self, store, test_id, clock_offset=0.0, interval=STOP_CHECK_INTERVAL):
+        self.store = store
+        self.test_id = test_id
+        self.clock_offset = clock_offset
+        self.interval = interval
+        self.events = []
+        self.requested_at = self.seen_at = None
+        self.done = threading.Event()
+        self.thread = threading.Thread(target=self._poll, daemon=True)
+
+    @property
+    def stopped(self):
+        return self.seen_at is not None
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def close(self):
+        self.done.set()
+
+    def attach(self, event):
+        self.events.append(event)
+        # Covers a stop seen before the event was attached
+        if self.stopped:
+            event.set()
+
+    def _poll(self):
+        # Jitter keeps the workers of a test from reading the item in lockstep
+        while not self.done.wait(self.interval * random.uniform(0.5, 1.0)):
+            try:
+                requested_at = self.store.stop_requested(self.test_id)
+            except Exception as e:
+                print(f'Error checking for stop: {e}')
+                continue
+            if requested_at is not None:
+                self.requested_at = requested_at
+                self.seen_at = time.time() + self.clock_offset
+                print('Stop requested, draining')
+                for event in list(self.events):
+                    event.set()
+                return
+
+    def record(self, stats):
+        quiet_at = stats.get('quiet_at') or time.time() + self.clock_offset
+        return {
+            'requested_at': self.requested_at,
+            'seen_at': round(self.seen_at, 3),
+            'quiet_at': round(quiet_at, 3),
+            'stop_to_quiet_ms': round((quiet_at - self.requested_at) * 1000, 1),
+            'abandoned': stats.get('abandoned', 0),
+        }
+
+
+def run_capacity(args, table, spec, mix, cache, signal=None, publisher=None):
+    """Search for the highest load meeting the SLO and return (stats, search result).
+
+    stats are those of the step with the highest passing throughput, or of
+    the last step when none passed. signal, if given, is a StopSignal that
+    ends the running step and the search; publisher, an EmfPublisher the
+    steps' series go to.
+    """
+    slo = capacity_search.Slo.from_spec(spec.get('slo'))
+    dimension = spec.get('dimension', 'users')
+    step_duration = int(spec.get('step_duration', capacity_search.DEFAULT_STEP_DURATION))
+    write_series = series_callback(table, args, publisher)
+    step_stats = {}
+
+    def run_step(level):
+        stop = multiprocessing.Event()
+        monitor = capacity_search.AbortMonitor(slo, stop.set)
+        if signal is not None:
+            signal.attach(stop)
+
+        def on_series(merged):
+            write_series(merged)
+            monitor(merged)
+
+        if dimension == 'users':
+            users, rate = level, None
+        else:
+            users, rate = args.concurrency, level
+        print(f'Capacity step: {dimension}={level}')
+        stats = load_engine.run(args.url, users, step_duration, processes=args.processes,
+                                on_series=on_series,
+                                workload=mix, cache=cache, rate=rate, arrival=args.arrival,
+                                stop=stop, policies=args.policies)
+        stats['aborted'] = monitor.aborted
+        # The engine's flag also covers SLO aborts
+        stats['stopped'] = signal is not None and signal.stopped
+        step_stats[level] = stats
+        return stats
+
+    def record_step(step):
+        table.put_item(Item={
+            'testId': args.test_id,
+            # Sorts with the summaries, ahead of the per-second series
+            'timestamp': f'capacity#step#{len(step_stats):03d}',
+            'kind': 'step',
+            'shardId': args.shard_id,
+            'step': to_item(step)
+        })
+
+    result = capacity_search.search(
+        run_step, slo,
+        start=float(spec.get('start', 10)),
+        maximum=float(spec.get('max', 1000)),
+        dimension=dimension,
+        factor=float(spec.get('factor', capacity_search.DEFAULT_FACTOR)),
+        tolerance=float(spec.get('tolerance', capacity_search.DEFAULT_TOLERANCE)),
+        max_steps=int(spec.get('max_steps', capacity_search.DEFAULT_MAX_STEPS)),
+        on_step=record_step
+    )
+    result['slo'] = slo.to_spec()
+    result['dimension'] = dimension
+    best = result['max_sustainable']
+    stats = step_stats[best['level']] if best else step_stats[result['steps'][-1]['level']]
+    return stats, result
+
+
+def apply_claim(args, config, shard_id):
+    """Fill in args from a claimed shard; returns (workload spec, capacity spec)."""
+    shard = config['shards'][shard_id]
+    target_url = config['target_url']
+    if not target_url.startswith(('http://', 'https://')):
+        target_url = f'https://{target_url}'
+    args.test_id = config['testId']
+    args.shard_id = shard_id
+    args.url = target_url
+    # An engine started in a known region (a pool engine) reports where it actually ran
+    args.worker_region = args.worker_region or shard.get('region')
+    args.concurrency = int(shard['concurrent_users'])
+    args.first_user = int(shard.get('first_user') or 0)
+    args.duration = int(config['duration'])
+    args.ramp_up = int(config.get('ramp_up') or 0)
+    args.arrival = config.get('arrival') or 'constant'
+    if config.get('start_at'):
+        args.start_at = float(config['start_at'])
+    args.archive = config.get('archive_url') or args.archive
+    args.policies = config.get('connection_policies') or args.policies
+    args.emf = config.get('metrics_url') or args.emf
+    if config.get('cache_mode'):
+        args.cache_bust_ratio = float(config['cache_mode']['bust_ratio'])
+        args.cache_bust_method = config['cache_mode']['bust_method']
+    if config.get('target_rps') and config.get('mode') != 'capacity':
+        # This shard's share of the offered rate, as start_test computes it for launched workers
+        args.rate = float(config['target_rps']) * args.concurrency / int(config['concurrent_users'])
+    return config.get('workload'), config.get('capacity') if config.get('mode') == 'capacity' else None
+
+
+def run_shard(args, table, workload_spec=None, capacity_spec=None, store=None):
+    """Run the shard described by args and upload its results to table.
+
+    store, if given, is the ClaimStore polled for stop_test. Returns True
+    when the shard was stopped.
+    """
+    mix = None
+    if workload_spec:
+        mix = workload.resolve(workload_spec)
+        print(f'Workload: {len(mix[0])} URLs')
+
+    cache = None
+    if args.cache_bust_ratio is not None:
+        cache = {'bust_ratio': args.cache_bust_ratio, 'bust_method': args.cache_bust_method}
+
+    extra = {}
+    clock = None
+    if args.start_at is not None and not capacity_spec:
+        # A capacity search is a single shard, so has nothing to line up with
+        clock = sync_clock(args)
+        extra['clock'] = clock
+    clock_offset = clock['offset_ms'] / 1000 if clock else 0.0
+    signal = stop = None
+    if store is not None:
+        signal = StopSignal(store, args.test_id, clock_offset).start()
+        if not capacity_spec:
+            stop = multiprocessing.Event()
+            signal.attach(stop)
+    publisher = emf_publisher(args)
+    if capacity_spec:
+        stats, result = run_capacity(args, table, capacity_spec, mix, cache, signal, publisher)
+        extra['capacity'] = result
+        print(json.dumps(result, indent=2))
+    else:
+        archive_dir = tempfile.mkdtemp(prefix='archive-') if args.archive else None
+        stats = load_engine.run(args.url, args.concurrency, args.duration, args.ramp_up,
+                                processes=args.processes,
+                                on_series=series_callback(table, args, publisher),
+                                workload=mix, cache=cache, rate=args.rate, arrival=args.arrival,
+                                stop=stop, start_at=args.start_at, clock_offset=clock_offset,
+                                archive_dir=archive_dir, policies=args.policies,
+                                policy_offset=args.first_user)
+        print(json.dumps(stats, indent=2))
+        if archive_dir:
+            parts = sorted(os.path.join(archive_dir, name) for name in os.listdir(archive_dir))
+            try:
+                extra['archive'] = request_archive.upload(object_store.from_url(args.archive),
+                                                          args.test_id, args.shard_id, parts)
+                print(f"Archived {extra['archive']['rows']} requests to {args.archive}")
+            except Exception as e:
+                # The summary is still worth uploading without the archive
+                print(f'Error archiving requests: {e}')
+            finally:
+                shutil.rmtree(archive_dir, ignore_errors=True)
+    stopped = signal is not None and signal.stopped
+    if signal is not None:
+        signal.close()
+    if publisher is not None:
+        try:
+            publisher.close()
+        except Exception as e:
+            print(f'Error publishing metrics: {e}')
+    if stopped:
+        extra['stop'] = signal.record(stats)
+        print(f"Quiet {extra['stop']['stop_to_quiet_ms']:.0f} ms after stop_test")
+    upload_results(table, args.test_id, args.shard_id, args.worker_region or args.region, stats,
+                   extra)
+    return stopped
+
+
+def serve(store, table, args, once=False):
+    """Claim and run shards until no shard turns up within args.claim_timeout.
+
+    This is the loop of a warm pool engine (see worker_pool): it pays for
+    booting and installing once and then serves test after test, exiting
+    once it has been idle for the timeout. With once, it returns after the
+    first shard. Returns the number of shards run.
+    """
+    served = 0
+    while True:
+        claimed = work_queue.wait_for_claim(store, args.worker_id,
+                                            accept=lambda config: config.get('engine') == 'python',
+                                            timeout=args.claim_timeout)
+        if claimed is None:
+            print('No shard claimed' if not served else f'Idle, exiting after {served} shards')
+            return served
+        # Each shard starts from the command-line defaults, not the previous test's settings
+        shard_args = copy.copy(args)
+        workload_spec, capacity_spec = apply_claim(shard_args, *claimed)
+        print(f'Claimed {shard_args.shard_id} of test {shard_args.test_id}')
+        try:
+            run_shard(shard_args, table, workload_spec, capacity_spec, store)
+        finally:
+            store.finish(shard_args.test_id, shard_args.shard_id, args.worker_id)
+        served += 1
+        if once:
+            return served
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description='Load test worker')
+    parser.add_argument('--test-id')
+    parser.add_argument('--url')
+    parser.add_argument('--shard-id', default='shard-000')
+    parser.add_argument('--worker-region', default=None)
+    parser.add_argument('--concurrency', type=int)
+    parser.add_argument('--first-user', type=int, default=0,
+                        help="Test-wide number of this shard's first user, for the connection policy mix")
+    parser.add_argument('--duration', type=int)
+    parser.add_argument('--ramp-up', type=int, default=0)
+    parser.add_argument('--processes', type=int, default=None,
+                        help='Engine processes (default: one per core)')
+    parser.add_argument('--workload', help='JSON file with urls/weights or a sitemap_url')
+    parser.add_argument('--cache-bust-ratio', type=float, default=None,
+                        help='Classify responses by cache layer and bust this share of requests')
+    parser.add_argument('--cache-bust-method', choices=('query', 'cookie'), default='query')
+    parser.add_argument('--rate', type=float, default=None,
+                        help='Open-loop requests per second for this shard')
+    parser.add_argument('--arrival', choices=load_engine.ARRIVALS, default='constant')
+    parser.add_argument('--capacity', help='JSON file with a capacity search spec')
+    parser.add_argument('--connection-policies',
+                        help='JSON file with connection policies (see connection_policy)')
+    parser.add_argument('--start-at', type=float, default=None,
+                        help='Unix time all shards start sending at (after warming up connections)')
+    parser.add_argument('--archive', default=None,
+                        help='Object store URL (s3://bucket/prefix or a directory) to archive every request to')
+    parser.add_argument('--emf', default=None,
+                        help="Publish per-second metrics as EMF to 'cloudwatch:<log group>', 'file:<path>' or 'stdout'")
+    parser.add_argument('--claim', action='store_true',
+                        help='Wait for and claim a shard of a running test from the config table')
+    parser.add_argument('--serve', action='store_true',
+                        help='With --claim, keep claiming shards until idle for --claim-timeout')
+    parser.add_argument('--claim-timeout', type=float, default=None,
+                        help='Seconds to wait for a shard before giving up')
+    parser.add_argument('--worker-id', default=socket.gethostname())
+    parser.add_argument('--config-table', default=os.environ.get('CONFIG_TABLE'),
+                        help='Config table to claim shards from and poll for stop_test')
+    parser.add_argument('--results-table', default=os.environ.get('RESULTS_TABLE'))
+    parser.add_argument('--region', default=os.environ.get('AWS_DEFAULT_REGION', 'us-east-1'))
+    # The policy spec itself, from --connection-policies or a claimed test's config
+    parser.set_defaults(policies=None)
+    return parser
+
+
+def main():
+    """Returns STOPPED_EXIT_CODE when a launched worker's test was stopped."""
+    parser = build_parser()
+    args = parser.parse_args()
+
+    if args.claim:
+        store = work_queue.DynamoDbClaimStore.from_name(args.config_table, args.region)
+        serve(store, results_table(args.results_table, args.region), args, once=not args.serve)
+        return 0
+
+    if not (args.test_id and args.url and args.concurrency and args.duration):
+        parser.error('--test-id, --url, --concurrency and --duration are required without --claim')
+    workload_spec = capacity_spec = None
+    if args.workload:
+        with open(args.workload) as f:
+            workload_spec = json.load(f)
+    if args.capacity:
+        with open(args.capacity) as f:
+            capacity_spec = json.load(f)
+    if args.connection_policies:
+        with open(args.connection_policies) as f:
+            args.policies = json.load(f)
+    store = None
+    if args.config_table:
+        store = work_queue.DynamoDbClaimStore.from_name(args.config_table, args.region)
+    stopped = run_shard(args, results_table(args.results_table, args.region), workload_spec,
+                        capacity_spec, store)
+    return STOPPED_EXIT_CODE if stopped else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
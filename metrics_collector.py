@@ -0,0 +1,241 @@
+"""Scheduled collector of WordPress stack metrics CloudWatch does not provide.
+
+Generalizes the EFS size monitor of aws-refarch-wordpress-03-efsfilesystem,
+which read one file system and wrote one metric per invocation, to every
+EFS file system, ElastiCache node and Aurora instance in the configured
+regions:
+
+- Custom/EFS: SizeInBytes, SizeInStandard, SizeInIA and MountTargets per
+  FileSystemId (SizeInBytes is the metric the size monitor wrote).
+- Custom/ElastiCache: NodeAvailable per CacheClusterId and CacheNodeId, and
+  CacheNodes per CacheClusterId.
+- Custom/RDS: InstanceAvailable per DBInstanceIdentifier, and
+  AvailableInstances per DBClusterIdentifier.
+
+Each (source, region) is read on a thread pool, paging through the describe
+API, and the datums are published with as few put_metric_data calls as the
+per-call limit allows, also on the pool. Every AWS call is timed; the
+handler returns the call count, errors and latency per operation.
+
+Clients come from a client_factory(service, region), so the collector runs
+against stubbed clients (botocore.stub.Stubber) as readily as real ones.
+
+aws-refarch-wordpress-03-efsfilesystem deploys it on a one-minute schedule,
+in place of the size monitor, when given the package's S3 bucket and key.
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+# put_metric_data takes at most this many datums per call (and 1 MB, far above 1000 of these)
+MAX_METRIC_DATA = 1000
+DEFAULT_MAX_WORKERS = 8
+DEFAULT_SOURCES = ('efs', 'elasticache', 'aurora')
+AURORA_ENGINES = ('aurora', 'aurora-mysql', 'aurora-postgresql')
+
+_clients = {}
+
+
+def _boto3_client(service, region):
+    # Cached per service and region so warm invocations skip endpoint resolution
+    key = (service, region)
+    if key not in _clients:
+        import boto3
+
+        _clients[key] = boto3.client(service, region_name=region)
+    return _clients[key]
+
+
+class CallLog:
+    """Latency of every AWS call, by operation; shared by the pool's threads."""
+
+    def __init__(self):
+        self.calls = {}
+        self.lock = threading.Lock()
+
+    def record(self, operation, seconds, error=False):
+        with self.lock:
+            entry = self.calls.setdefault(operation, {'calls': 0, 'errors': 0, 'latencies': []})
+            entry['calls'] += 1
+            entry['errors'] += int(error)
+            entry['latencies'].append(seconds)
+
+    def timed(self, operation, call, **kwargs):
+        began = time.perf_counter()
+        try:
+            result = call(**kwargs)
+        except Exception:
+            self.record(operation, time.perf_counter() - began, error=True)
+            raise
+        self.record(operation, time.perf_counter() - began)
+        return result
+
+    def summary(self):
+        with self.lock:
+            summary = {}
+            for operation, entry in self.calls.items():
+                latencies = sorted(entry['latencies'])
+                summary[operation] = {
+                    'calls': entry['calls'],
+                    'errors': entry['errors'],
+                    'total_ms': round(sum(latencies) * 1000, 3),
+                    'p50_ms': round(latencies[len(latencies) // 2] * 1000, 3),
+                    'max_ms': round(latencies[-1] * 1000, 3),
+                }
+            return summary
+
+
+def paginate(client, operation, log, **kwargs):
+    """Yield the pages of a describe operation, timing each page's call."""
+    pages = iter(client.get_paginator(operation).paginate(**kwargs))
+    while True:
+        began = time.perf_counter()
+        try:
+            page = next(pages)
+        except StopIteration:
+            return
+        except Exception:
+            log.record(operation, time.perf_counter() - began, error=True)
+            raise
+        log.record(operation, time.perf_counter() - began)
+        yield page
+
+
+def datum(name, dimensions, value, unit='None'):
+    return {
+        'MetricName': name,
+        'Dimensions': [{'Name': key, 'Value': str(dimension)} for key, dimension in dimensions.items()],
+        'Value': float(value),
+        'Unit': unit,
+    }
+
+
+def collect_efs(client, log):
+    data = []
+    for page in paginate(client, 'describe_file_systems', log):
+        for file_system in page['FileSystems']:
+            dimensions = {'FileSystemId': file_system['FileSystemId']}
+            size = file_system['SizeInBytes']
+            data.append(datum('SizeInBytes', dimensions, size['Value'], 'Bytes'))
+            if 'ValueInStandard' in size:
+                data.append(datum('SizeInStandard', dimensions, size['ValueInStandard'], 'Bytes'))
+            if 'ValueInIA' in size:
+                data.append(datum('SizeInIA', dimensions, size['ValueInIA'], 'Bytes'))
+            data.append(datum('MountTargets', dimensions, file_system['NumberOfMountTargets'], 'Count'))
+    return 'Custom/EFS', data
+
+
+def collect_elasticache(client, log):
+    data = []
+    for page in paginate(client, 'describe_cache_clusters', log, ShowCacheNodeInfo=True):
+        for cluster in page['CacheClusters']:
+            cluster_id = cluster['CacheClusterId']
+            nodes = cluster.get('CacheNodes', [])
+            data.append(datum('CacheNodes', {'CacheClusterId': cluster_id}, len(nodes), 'Count'))
+            for node in nodes:
+                data.append(datum('NodeAvailable',
+                                  {'CacheClusterId': cluster_id, 'CacheNodeId': node['CacheNodeId']},
+                                  node.get('CacheNodeStatus') == 'available', 'Count'))
+    return 'Custom/ElastiCache', data
+
+
+def collect_aurora(client, log):
+    data = []
+    available = {}
+    for page in paginate(client, 'describe_db_instances', log,
+                         Filters=[{'Name': 'engine', 'Values': list(AURORA_ENGINES)}]):
+        for instance in page['DBInstances']:
+            up = instance.get('DBInstanceStatus') == 'available'
+            data.append(datum('InstanceAvailable',
+                              {'DBInstanceIdentifier': instance['DBInstanceIdentifier']}, up, 'Count'))
+            cluster_id = instance.get('DBClusterIdentifier')
+            if cluster_id:
+                available[cluster_id] = available.get(cluster_id, 0) + int(up)
+    for cluster_id, count in available.items():
+        data.append(datum('AvailableInstances', {'DBClusterIdentifier': cluster_id}, count, 'Count'))
+    return 'Custom/RDS', data
+
+
+COLLECTORS = {
+    'efs': ('efs', collect_efs),
+    'elasticache': ('elasticache', collect_elasticache),
+    'aurora': ('rds', collect_aurora),
+}
+
+
+def batches(data, size=MAX_METRIC_DATA):
+    for start in range(0, len(data), size):
+        yield data[start:start + size]
+
+
+def collect(regions, sources=DEFAULT_SOURCES, client_factory=None, max_workers=DEFAULT_MAX_WORKERS,
+            batch_size=MAX_METRIC_DATA):
+    """Collect and publish the sources' metrics in every region.
+
+    Returns {'datums', 'put_calls', 'errors', 'calls'}; a source or batch
+    that fails is listed under errors and does not stop the others.
+    batch_size caps the datums per put_metric_data call.
+    """
+    for source in sources:
+        if source not in COLLECTORS:
+            raise ValueError(f'Unknown source {source}; expected one of {", ".join(COLLECTORS)}')
+    if not 1 <= batch_size <= MAX_METRIC_DATA:
+        raise ValueError(f'batch_size must be between 1 and {MAX_METRIC_DATA}')
+    client_factory = client_factory or _boto3_client
+    log = CallLog()
+    errors = []
+    tasks = [(source, region) for region in regions for source in sources]
+
+    def read(task):
+        source, region = task
+        service, collector = COLLECTORS[source]
+        try:
+            return region, collector(client_factory(service, region), log)
+        except Exception as e:
+            errors.append({'source': source, 'region': region, 'error': str(e)})
+            return region, None
+
+    def publish(job):
+        region, namespace, data = job
+        try:
+            log.timed('put_metric_data', client_factory('cloudwatch', region).put_metric_data,
+                      Namespace=namespace, MetricData=data)
+        except Exception as e:
+            errors.append({'namespace': namespace, 'region': region, 'datums': len(data), 'error': str(e)})
+
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tasks)))) as pool:
+        collected = list(pool.map(read, tasks))
+        # One timestamp per run, so every source's datums line up on the dashboard
+        timestamp = datetime.now(timezone.utc)
+        jobs = []
+        for region, result in collected:
+            if result is None:
+                continue
+            namespace, data = result
+            for entry in data:
+                entry['Timestamp'] = timestamp
+            jobs.extend((region, namespace, batch) for batch in batches(data, batch_size))
+        list(pool.map(publish, jobs))
+
+    return {
+        'datums': sum(len(job[2]) for job in jobs),
+        'put_calls': len(jobs),
+        'errors': errors,
+        'calls': log.summary(),
+    }
+
+
+def handler(event, context):
+    regions = (event or {}).get('regions') or os.environ.get(
+        'REGIONS', os.environ.get('AWS_REGION', 'us-east-1')).split(',')
+    sources = (event or {}).get('sources') or os.environ.get(
+        'SOURCES', ','.join(DEFAULT_SOURCES)).split(',')
+    result = collect([region.strip() for region in regions if region.strip()],
+                     [source.strip() for source in sources if source.strip()],
+                     max_workers=int(os.environ.get('MAX_WORKERS', DEFAULT_MAX_WORKERS)),
+                     batch_size=int(os.environ.get('BATCH_SIZE', MAX_METRIC_DATA)))
+    print(json.dumps(result))
+    return result
@@ -0,0 +1,98 @@
+"""Object stores for test artifacts too large for the results table.
+
+Workers write files locally and hand them to a store when the test ends; the
+offline tools fetch them back to local disk before reading. S3ObjectStore is
+used in production, LocalObjectStore (a plain directory) in tests and for
+local runs. from_url picks one from 's3://bucket/prefix' or a path.
+"""
+import os
+import shutil
+
+
+class ObjectStore:
+    """Interface over a flat key space of files."""
+
+    url = None
+
+    def put_file(self, key, path):
+        """Store the local file at path under key."""
+        raise NotImplementedError
+
+    def get_file(self, key, path):
+        """Copy the object at key to the local file at path."""
+        raise NotImplementedError
+
+    def list(self, prefix=''):
+        """Return the sorted keys starting with prefix."""
+        raise NotImplementedError
+
+
+class LocalObjectStore(ObjectStore):
+    def __init__(self, root):
+        self.root = os.path.abspath(root)
+        self.url = self.root
+
+    def _path(self, key):
+        path = os.path.abspath(os.path.join(self.root, key))
+        if not path.startswith(self.root + os.sep):
+            raise ValueError(f'Key outside the store: {key}')
+        return path
+
+    def put_file(self, key, path):
+        target = self._path(key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        shutil.copyfile(path, target)
+
+    def get_file(self, key, path):
+        shutil.copyfile(self._path(key), path)
+
+    def list(self, prefix=''):
+        keys = []
+        for directory, _, names in os.walk(self.root):
+            for name in names:
+                key = os.path.relpath(os.path.join(directory, name), self.root).replace(os.sep, '/')
+                if key.startswith(prefix):
+                    keys.append(key)
+        return sorted(keys)
+
+
+class S3ObjectStore(ObjectStore):
+    def __init__(self, bucket, prefix='', client=None):
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+        self.url = f's3://{bucket}/{self.prefix}'
+        self._client = client
+
+    @property
+    def client(self):
+        if self._client is None:
+            import boto3
+
+            self._client = boto3.client('s3')
+        return self._client
+
+    def put_file(self, key, path):
+        # upload_file switches to multipart uploads for large files
+        self.client.upload_file(path, self.bucket, self.prefix + key)
+
+    def get_file(self, key, path):
+        self.client.download_file(self.bucket, self.prefix + key, path)
+
+    def list(self, prefix=''):
+        keys = []
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            keys.extend(obj['Key'][len(self.prefix):] for obj in page.get('Contents', []))
+        return sorted(keys)
+
+
+def from_url(url):
+    """Return the store for 's3://bucket/prefix', 'file:///dir' or a directory path."""
+    if url.startswith('s3://'):
+        bucket, _, prefix = url[len('s3://'):].partition('/')
+        if not bucket:
+            raise ValueError(f'No bucket in {url}')
+        return S3ObjectStore(bucket, prefix)
+    if url.startswith('file://'):
+        url = url[len('file://'):]
+    return LocalObjectStore(url)
@@ -0,0 +1,167 @@
+"""Per-request archive of a test in Parquet.
+
+Each engine process streams one row per request into its own Parquet file:
+
+    timestamp   float64  wall-clock send time (intended time for open-loop tests)
+    url         dict     workload path the request was for
+    status      int16    HTTP status, 0 when the request failed
+    bytes       int64    bytes received
+    connect_ms  float32  time to open the connection, 0 when it was reused
+    ttfb_ms     float32  time to the end of the response headers
+    total_ms    float32  time to the end of the response
+
+Rows are buffered in typed arrays and written out one zstd-compressed row
+group at a time, so a worker holds at most one row group in memory however
+long the test runs. The worker uploads the files to an object store
+(object_store) when the test ends. Readers fetch them back and open them
+memory-mapped, reading only the columns they ask for.
+
+pyarrow is only needed to write or read archives; nothing else imports it.
+"""
+import os
+from array import array
+
+SCHEMA_FIELDS = ('timestamp', 'url', 'status', 'bytes', 'connect_ms', 'ttfb_ms', 'total_ms')
+# Rows per row group: about 2 MB of buffers, and a unit readers can skip over
+DEFAULT_ROW_GROUP_SIZE = 65536
+DEFAULT_COMPRESSION = 'zstd'
+PART_SUFFIX = '.parquet'
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        raise RuntimeError('Request archives require pyarrow (pip3 install pyarrow)')
+    return pyarrow, pyarrow.parquet
+
+
+def schema():
+    pa, _ = _pyarrow()
+    return pa.schema([
+        ('timestamp', pa.float64()),
+        ('url', pa.dictionary(pa.int32(), pa.string())),
+        ('status', pa.int16()),
+        ('bytes', pa.int64()),
+        ('connect_ms', pa.float32()),
+        ('ttfb_ms', pa.float32()),
+        ('total_ms', pa.float32()),
+    ])
+
+
+class ArchiveWriter:
+    """Streams request rows to a Parquet file one row group at a time.
+
+    Times are passed in seconds on the event loop clock; clock_base is added
+    to turn them into wall-clock timestamps.
+    """
+
+    def __init__(self, path, urls, clock_base=0.0, row_group_size=DEFAULT_ROW_GROUP_SIZE,
+                 compression=DEFAULT_COMPRESSION):
+        pa, pq = _pyarrow()
+        self._pa = pa
+        self.path = path
+        self.clock_base = clock_base
+        self.row_group_size = row_group_size
+        self.urls = pa.array(list(urls), pa.string())
+        self.schema = schema()
+        self.writer = pq.ParquetWriter(path, self.schema, compression=compression)
+        self.rows = 0
+        self._reset()
+
+    def _reset(self):
+        self.timestamp = array('d')
+        self.url = array('i')
+        self.status = array('h')
+        self.bytes = array('q')
+        self.connect = array('f')
+        self.ttfb = array('f')
+        self.total = array('f')
+
+    def record(self, started, url, status, nbytes, connect, ttfb, total):
+        self.timestamp.append(self.clock_base + started)
+        self.url.append(url)
+        self.status.append(status)
+        self.bytes.append(nbytes)
+        self.connect.append(connect * 1000.0)
+        self.ttfb.append(ttfb * 1000.0)
+        self.total.append(total * 1000.0)
+        if len(self.timestamp) >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        count = len(self.timestamp)
+        if not count:
+            return
+        pa = self._pa
+
+        def column(values, kind):
+            # The typed arrays already have Arrow's memory layout
+            return pa.Array.from_buffers(kind, count, [None, pa.py_buffer(values)])
+
+        columns = [
+            column(self.timestamp, pa.float64()),
+            pa.DictionaryArray.from_arrays(column(self.url, pa.int32()), self.urls),
+            column(self.status, pa.int16()),
+            column(self.bytes, pa.int64()),
+            column(self.connect, pa.float32()),
+            column(self.ttfb, pa.float32()),
+            column(self.total, pa.float32()),
+        ]
+        self.writer.write_table(pa.Table.from_arrays(columns, schema=self.schema),
+                                row_group_size=count)
+        self.rows += count
+        self._reset()
+
+    def close(self):
+        self.flush()
+        self.writer.close()
+        return self.rows
+
+
+def part_key(test_id, shard_id, index):
+    return f'{test_id}/{shard_id}/part-{index:03d}{PART_SUFFIX}'
+
+
+def upload(store, test_id, shard_id, paths):
+    """Upload a shard's part files; returns {'url', 'keys', 'rows'}."""
+    _, pq = _pyarrow()
+    keys = []
+    rows = 0
+    for index, path in enumerate(paths):
+        rows += pq.ParquetFile(path).metadata.num_rows
+        key = part_key(test_id, shard_id, index)
+        store.put_file(key, path)
+        keys.append(key)
+    return {'url': store.url, 'keys': keys, 'rows': rows}
+
+
+def download(store, test_id, directory):
+    """Fetch every part of a test into directory; returns the local paths."""
+    paths = []
+    for key in store.list(f'{test_id}/'):
+        if not key.endswith(PART_SUFFIX):
+            continue
+        path = os.path.join(directory, key.replace('/', '_'))
+        if not os.path.exists(path):
+            store.get_file(key, path)
+        paths.append(path)
+    return paths
+
+
+def iter_batches(paths, columns=None, batch_size=DEFAULT_ROW_GROUP_SIZE):
+    """Yield record batches of the given columns, memory-mapping each file."""
+    _, pq = _pyarrow()
+    for path in paths:
+        parquet = pq.ParquetFile(path, memory_map=True)
+        yield from parquet.iter_batches(batch_size=batch_size, columns=columns)
+
+
+def read_table(paths, columns=None):
+    """Read the given columns of every part into one Arrow table."""
+    pa, pq = _pyarrow()
+    tables = [pq.read_table(path, columns=columns, memory_map=True) for path in paths]
+    if not tables:
+        raise ValueError('No archive parts to read')
+    return pa.concat_tables(tables)
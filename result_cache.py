@@ -0,0 +1,85 @@
+"""Bounded in-process cache for status and results responses.
+
+Lives at module level in the manager Lambda, so it is shared by the warm
+invocations of one execution environment. Entries for finished tests never
+change and are only evicted by LRU; entries for tests still running expire
+after a short TTL so pollers see fresh data.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+DEFAULT_MAX_ENTRIES = 256
+DEFAULT_TTL = 5.0
+
+
+class ResultCache:
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL, clock=time.monotonic):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        # Batch requests look entries up from several threads
+        self.lock = threading.Lock()
+
+    def _live(self, key):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[2] is None or entry[2] > self.clock():
+                return entry
+            del self.entries[key]
+        return None
+
+    def get(self, key):
+        with self.lock:
+            entry = self._live(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0], entry[1]
+
+    def peek(self, key):
+        """Like get, but leaves the hit/miss counters and LRU order alone."""
+        with self.lock:
+            entry = self._live(key)
+            return None if entry is None else (entry[0], entry[1])
+
+    def put(self, key, body, final):
+        """Cache body; final entries do not expire."""
+        etag = make_etag(body)
+        expires = None if final else self.clock() + self.ttl
+        with self.lock:
+            self.entries[key] = (body, etag, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        return etag
+
+    def invalidate(self, test_id):
+        with self.lock:
+            for key in [key for key in self.entries if key[1] == test_id]:
+                del self.entries[key]
+
+    @property
+    def hit_ratio(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+def make_etag(body):
+    return '"' + hashlib.sha1(body.encode('utf-8')).hexdigest() + '"'
+
+
+def etag_matches(if_none_match, etag):
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == '*':
+        return True
+    # Clients may send several tags and weak validators
+    tags = [tag.strip() for tag in if_none_match.split(',')]
+    return etag in tags or f'W/{etag}' in tags
@@ -0,0 +1,53 @@
+import os
+import sys
+
+import pytest
+
+# The modules are top-level files in the repository root
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+
+@pytest.fixture
+def tables(monkeypatch):
+    """Config and results tables, with the templates' schema, in moto's DynamoDB.
+
+    Yields (config table, results table); lambda_function's cached resource and
+    tables are reset so it talks to the mock.
+    """
+    boto3 = pytest.importorskip('boto3')
+    moto = pytest.importorskip('moto')
+    for name, value in {'AWS_ACCESS_KEY_ID': 'testing', 'AWS_SECRET_ACCESS_KEY': 'testing',
+                        'AWS_DEFAULT_REGION': 'us-east-1', 'AWS_REGION': 'us-east-1',
+                        'CONFIG_TABLE': 'lt-config', 'RESULTS_TABLE': 'lt-results'}.items():
+        monkeypatch.setenv(name, value)
+    monkeypatch.delenv('DYNAMODB_ENDPOINT', raising=False)
+
+    import lambda_function
+
+    monkeypatch.setattr(lambda_function, '_dynamodb', None)
+    monkeypatch.setattr(lambda_function, '_tables', {})
+    monkeypatch.setattr(lambda_function, '_result_cache', None)
+    with moto.mock_aws():
+        dynamodb = boto3.resource('dynamodb')
+        config = dynamodb.create_table(
+            TableName='lt-config',
+            BillingMode='PAY_PER_REQUEST',
+            AttributeDefinitions=[{'AttributeName': name, 'AttributeType': 'S'}
+                                  for name in ('testId', 'status', 'created_at')],
+            KeySchema=[{'AttributeName': 'testId', 'KeyType': 'HASH'}],
+            GlobalSecondaryIndexes=[{
+                'IndexName': 'status-created_at-index',
+                'KeySchema': [{'AttributeName': 'status', 'KeyType': 'HASH'},
+                              {'AttributeName': 'created_at', 'KeyType': 'RANGE'}],
+                'Projection': {'ProjectionType': 'ALL'}
+            }]
+        )
+        results = dynamodb.create_table(
+            TableName='lt-results',
+            BillingMode='PAY_PER_REQUEST',
+            AttributeDefinitions=[{'AttributeName': name, 'AttributeType': 'S'}
+                                  for name in ('testId', 'timestamp')],
+            KeySchema=[{'AttributeName': 'testId', 'KeyType': 'HASH'},
+                       {'AttributeName': 'timestamp', 'KeyType': 'RANGE'}]
+        )
+        yield config, results
@@ -0,0 +1,25 @@
+import pytest
+
+from latency_histogram import LatencyHistogram
+
+analysis = pytest.importorskip('analysis')
+
+# (total_ms, status): status 0 is a request that got no response
+REQUESTS = [(100, 200)] * 6 + [(1000, 200)] * 2 + [(100, 500)] * 3 + [(3000, 404)] + [(30000, 0)] * 2
+
+
+def test_archive_and_histogram_apdex_agree_on_error_responses():
+    total_ms = [ms for ms, _ in REQUESTS]
+    status = [code for _, code in REQUESTS]
+    histogram = LatencyHistogram()
+    for ms, code in REQUESTS:
+        if code:
+            histogram.record_seconds(ms / 1000.0)
+    values, counts = histogram.buckets()
+
+    from_archive = analysis.apdex(total_ms, 500, status)
+    from_histogram = analysis.histogram_apdex(values, counts, 500 * 1000.0, errors=status.count(0))
+
+    # 9 satisfied (the fast 500s too) and 2 tolerating of 14; the slow 404 and failures are frustrated
+    assert from_archive == pytest.approx((9 + 2 / 2) / 14)
+    assert from_histogram == pytest.approx(from_archive)
@@ -0,0 +1,37 @@
+import capacity_search
+from latency_histogram import LatencyHistogram
+
+
+def engine_stats(ok, non_2xx, failures, latency_ms=100):
+    histogram = LatencyHistogram()
+    histogram.record_seconds(latency_ms / 1000.0, ok + non_2xx)
+    return {'requests': ok + non_2xx, 'non_2xx': non_2xx, 'failures': failures,
+            'histogram': histogram.encode()}
+
+
+def test_error_rate_counts_non_2xx_once():
+    # 50 of 100 responses are 5xx: half the attempts failed, not a third
+    assert capacity_search.error_rate(100, 0, 50) == 0.5
+
+
+def test_error_rate_mixes_5xx_and_connection_failures():
+    # 80 responses (20 of them 5xx) and 20 attempts with no response at all
+    assert capacity_search.error_rate(80, 20, 20) == 0.4
+    assert capacity_search.error_rate(0, 0, 0) == 0.0
+
+
+def test_slo_fails_step_with_half_5xx():
+    slo = capacity_search.Slo(percentile=95, latency_ms=2000, error_rate=0.4)
+    latency_ms, rate, passed = slo.evaluate(engine_stats(ok=50, non_2xx=50, failures=0))
+    assert rate == 0.5
+    assert not passed
+
+
+def test_slo_evaluates_5xx_and_failures_together():
+    slo = capacity_search.Slo(percentile=95, latency_ms=2000, error_rate=0.25)
+    _, rate, passed = slo.evaluate(engine_stats(ok=70, non_2xx=10, failures=20))
+    assert rate == 0.3
+    assert not passed
+    _, rate, passed = slo.evaluate(engine_stats(ok=90, non_2xx=5, failures=5))
+    assert rate == 0.1
+    assert passed
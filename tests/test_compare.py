@@ -0,0 +1,57 @@
+import pytest
+
+import compare
+from latency_histogram import LatencyHistogram
+
+np = pytest.importorskip('numpy')
+
+
+def histogram(buckets):
+    h = LatencyHistogram()
+    for i in range(buckets):
+        h.record(1000 + i * 37, count=1 + i % 5)
+    return h
+
+
+def test_chunked_percentile_replicates_match_one_draw():
+    h = histogram(2000)
+
+    whole = compare._percentile_replicates(np, h, (50, 99), 50, np.random.default_rng(1),
+                                           chunk_cells=10 ** 9)
+    chunked = compare._percentile_replicates(np, h, (50, 99), 50, np.random.default_rng(1),
+                                             chunk_cells=3 * len(h.buckets()[0]))
+
+    for p in (50, 99):
+        assert len(chunked[p]) == 50
+        np.testing.assert_array_equal(whole[p], chunked[p])
+
+
+def test_chunked_mean_replicates_match_one_draw():
+    data = list(range(100))
+    whole = compare._mean_replicates(np, data, 25, np.random.default_rng(2), chunk_cells=10 ** 9)
+    chunked = compare._mean_replicates(np, data, 25, np.random.default_rng(2), chunk_cells=700)
+    np.testing.assert_array_equal(whole, chunked)
+
+
+class TrackingRng:
+    """Generator wrapper recording the cells of every multinomial draw."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.cells = []
+
+    def multinomial(self, n, pvals, size=None):
+        self.cells.append(size * len(pvals))
+        return self.rng.multinomial(n, pvals, size=size)
+
+
+def test_many_buckets_and_resamples_stay_within_a_chunk():
+    h = histogram(5000)
+    buckets = len(h.buckets()[0])
+    rng = TrackingRng(np.random.default_rng(0))
+
+    result = compare._percentile_replicates(np, h, (50, 99), 10000, rng)
+
+    assert len(result[99]) == 10000
+    assert max(rng.cells) <= compare.REPLICATE_CHUNK_CELLS
+    assert sum(rng.cells) == 10000 * buckets
@@ -0,0 +1,74 @@
+import multiprocessing
+from collections import Counter
+
+import pytest
+
+import connection_policy
+import load_engine
+import load_worker
+from launch_backends import plan_shards
+from test_load_engine_stop import slow_server
+
+MIX = [{'name': 'browsers', 'share': 0.8, 'requests_per_connection': 6, 'tls_sessions': True},
+       {'name': 'bots', 'share': 0.2, 'requests_per_connection': 1}]
+
+
+@pytest.fixture
+def assigned(monkeypatch):
+    """Policy names of every Client load_engine creates, engine processes included.
+
+    The pool forks, so processes inherit the patched class and the managed list.
+    """
+    manager = multiprocessing.Manager()
+    names = manager.list()
+
+    class RecordingClient(load_engine.Client):
+        __slots__ = ()
+
+        def __init__(self, policy, stats):
+            super().__init__(policy, stats)
+            names.append(policy.name)
+
+    monkeypatch.setattr(load_engine, 'Client', RecordingClient)
+    yield names
+    manager.shutdown()
+
+
+def test_assign_prefixes_follow_shares():
+    policies = connection_policy.parse(MIX)
+    assigned = Counter(policy.name for policy in connection_policy.assign(policies, 10))
+    assert assigned == {'browsers': 8, 'bots': 2}
+
+
+def test_small_shards_together_follow_the_mix(assigned):
+    port = slow_server(0)
+    shards = plan_shards(10, ['us-east-1'], workers_per_region=5)
+    assert [shard['first_user'] for shard in shards] == [0, 2, 4, 6, 8]
+
+    for shard in shards:
+        load_engine.run(f'http://127.0.0.1:{port}/', shard['concurrent_users'], 1, processes=1,
+                        policies=MIX, policy_offset=shard['first_user'])
+
+    assert Counter(assigned) == {'browsers': 8, 'bots': 2}
+
+
+def test_engine_processes_together_follow_the_mix(assigned):
+    port = slow_server(0)
+
+    # Processes of 4, 3 and 3 users: assigned on their own they would run 7 browsers and 3 bots
+    result = load_engine.run(f'http://127.0.0.1:{port}/', 10, 1, processes=3, policies=MIX)
+
+    assert Counter(assigned) == {'browsers': 8, 'bots': 2}
+    assert set(result['policies']) == {'browsers', 'bots'}
+
+
+def test_apply_claim_takes_first_user_from_the_shard():
+    args = load_worker.build_parser().parse_args([])
+    config = {
+        'testId': 't1', 'target_url': 'http://127.0.0.1/', 'duration': 10,
+        'concurrent_users': 4,
+        'connection_policies': MIX,
+        'shards': {'shard-001': {'region': 'local', 'concurrent_users': 2, 'first_user': 2}},
+    }
+    load_worker.apply_claim(args, config, 'shard-001')
+    assert args.first_user == 2
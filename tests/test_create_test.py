@@ -0,0 +1,34 @@
+import json
+
+import pytest
+
+import lambda_function
+from launch_backends import plan_shards
+
+
+def create(**event):
+    return lambda_function.create_test(dict({'target_url': 'http://127.0.0.1:8080/', 'duration': 10,
+                                             'regions': ['us-east-1']}, **event))
+
+
+@pytest.mark.parametrize('users', [0, -5, 2.5, '2.5', 'many', True, None, [4]])
+def test_create_rejects_users_other_than_a_positive_integer(tables, users):
+    response = create(concurrent_users=users)
+
+    assert response['statusCode'] == 400
+    assert json.loads(response['body'])['error'] == 'concurrent_users must be a positive integer'
+
+
+@pytest.mark.parametrize('users, stored', [(4, 4), ('12', 12)])
+def test_create_stores_users_as_an_integer(tables, users, stored):
+    response = create(concurrent_users=users)
+
+    assert response['statusCode'] == 200
+    config, _ = tables
+    item = config.get_item(Key={'testId': json.loads(response['body'])['testId']})['Item']
+    assert item['concurrent_users'] == stored
+
+
+def test_plan_shards_rejects_zero_users():
+    with pytest.raises(ValueError):
+        plan_shards(0, ['us-east-1'])
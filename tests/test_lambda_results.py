@@ -0,0 +1,50 @@
+import json
+
+import pytest
+
+import lambda_function
+import timeseries
+from latency_histogram import LatencyHistogram
+
+
+def put_series(results, test_id, shard_id, counts, first_second=1700000000):
+    merged = []
+    for offset, count in enumerate(counts):
+        histogram = LatencyHistogram(significant_figures=timeseries.SERIES_SIGNIFICANT_FIGURES)
+        histogram.record_seconds(0.05, count)
+        merged.append({'second': first_second + offset, 'requests': count, 'errors': 0,
+                       'bytes': count * 100, 'latency': histogram})
+    with results.batch_writer() as batch:
+        for item in timeseries.to_items(test_id, shard_id, merged):
+            batch.put_item(Item=item)
+
+
+def test_results_with_series_include_throughput(tables):
+    pytest.importorskip('numpy')
+    config, results = tables
+    config.put_item(Item={'testId': 't1', 'status': 'running', 'created_at': '2024-01-01T00:00:00',
+                          'shards': {}})
+    put_series(results, 't1', 'shard-000', [10, 20, 30])
+    put_series(results, 't1', 'shard-001', [5, 5, 5])
+
+    response = lambda_function.get_test_results({'testId': 't1', 'series': True})
+
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert [point['rps'] for point in body['series']] == [15, 25, 35]
+    assert body['throughput']['seconds'] == 3
+    assert body['throughput']['mean'] == 25.0
+    assert body['next_since'] == 1700000002
+
+
+def test_results_since_returns_only_newer_seconds(tables):
+    config, results = tables
+    config.put_item(Item={'testId': 't2', 'status': 'running', 'created_at': '2024-01-01T00:00:00',
+                          'shards': {}})
+    put_series(results, 't2', 'shard-000', [10, 20, 30])
+
+    response = lambda_function.get_test_results({'testId': 't2', 'since': 1700000000})
+
+    assert response['statusCode'] == 200
+    body = json.loads(response['body'])
+    assert [point['second'] for point in body['series']] == [1700000001, 1700000002]
@@ -0,0 +1,54 @@
+import asyncio
+import socket
+
+import pytest
+
+import load_engine
+
+
+@pytest.fixture
+def server():
+    """IPv4-only listener; yields its port."""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    sock.listen()
+    yield sock.getsockname()[1]
+    sock.close()
+
+
+def dual_stack(monkeypatch, port):
+    # The name resolves to an IPv6 address nothing listens on, then to the IPv4 listener
+    async def getaddrinfo(self, host, port_, **kwargs):
+        return [
+            (socket.AF_INET6, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', ('::1', port, 0, 0)),
+            (socket.AF_INET, socket.SOCK_STREAM, socket.IPPROTO_TCP, '', ('127.0.0.1', port)),
+        ]
+    monkeypatch.setattr(asyncio.BaseEventLoop, 'getaddrinfo', getaddrinfo)
+
+
+def test_falls_back_to_next_address(monkeypatch, server):
+    dual_stack(monkeypatch, server)
+    target = load_engine.Target(f'http://dual-stack.test:{server}/')
+
+    async def connect():
+        conn = await load_engine.open_connection(target, None)
+        conn.close()
+        return conn
+
+    conn = asyncio.run(connect())
+    assert conn.fallbacks == 1
+    assert conn.timings['dns'] is not None
+    assert conn.timings['connect'] is not None
+
+
+def test_connect_fails_once_every_address_has(monkeypatch):
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    closed = sock.getsockname()[1]
+    sock.close()
+    dual_stack(monkeypatch, closed)
+    target = load_engine.Target(f'http://dual-stack.test:{closed}/')
+
+    with pytest.raises(load_engine.PhaseError) as error:
+        asyncio.run(load_engine.open_connection(target, None))
+    assert error.value.phase == 'connect'
@@ -0,0 +1,54 @@
+import asyncio
+import multiprocessing
+import socket
+import threading
+import time
+
+import load_engine
+
+
+def slow_server(delay):
+    """Keep-alive server answering every request after delay seconds; returns its port."""
+    sock = socket.socket()
+    sock.bind(('127.0.0.1', 0))
+    port = sock.getsockname()[1]
+
+    async def handle(reader, writer):
+        try:
+            while True:
+                await reader.readuntil(b'\r\n\r\n')
+                await asyncio.sleep(delay)
+                writer.write(b'HTTP/1.1 200 OK\r\nContent-Length: 2\r\n\r\nok')
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            writer.close()
+
+    async def main():
+        server = await asyncio.start_server(handle, sock=sock)
+        async with server:
+            await server.serve_forever()
+
+    threading.Thread(target=asyncio.run, args=(main(),), daemon=True).start()
+    return port
+
+
+def test_open_loop_behind_schedule_halts_on_stop():
+    # 20 senders at 50 ms per request manage 400/s, far behind the 2000/s asked for,
+    # so every slot is overdue and no sender ever sleeps before sending
+    port = slow_server(0.05)
+    stop = multiprocessing.Event()
+    stopped_at = []
+
+    def stop_later():
+        time.sleep(1.5)
+        stopped_at.append(time.time())
+        stop.set()
+
+    threading.Thread(target=stop_later, daemon=True).start()
+    stats = load_engine.run(f'http://127.0.0.1:{port}/', 20, 30, processes=1, stop=stop, rate=2000)
+
+    assert stats['stopped']
+    assert stats['abandoned'] == 0
+    # Only the requests in flight at the stop are waited for, not DRAIN_TIMEOUT
+    assert stats['quiet_at'] - stopped_at[0] < 1.0
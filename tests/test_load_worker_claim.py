@@ -0,0 +1,18 @@
+import load_worker
+
+CONFIG = {
+    'testId': 't1', 'target_url': 'http://127.0.0.1/', 'duration': 10, 'concurrent_users': 4,
+    'shards': {'shard-000': {'region': 'us-west-2', 'concurrent_users': 4, 'first_user': 0}},
+}
+
+
+def test_claim_reports_the_shard_region_when_the_engine_has_none():
+    args = load_worker.build_parser().parse_args(['--claim'])
+    load_worker.apply_claim(args, CONFIG, 'shard-000')
+    assert args.worker_region == 'us-west-2'
+
+
+def test_pool_engine_reports_its_own_region():
+    args = load_worker.build_parser().parse_args(['--claim', '--worker-region', 'us-east-1'])
+    load_worker.apply_claim(args, CONFIG, 'shard-000')
+    assert args.worker_region == 'us-east-1'
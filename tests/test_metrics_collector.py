@@ -0,0 +1,172 @@
+import threading
+
+import pytest
+
+import metrics_collector
+
+boto3 = pytest.importorskip('boto3')
+from botocore.stub import ANY, Stubber  # noqa: E402
+
+REGIONS = ('us-east-1', 'us-west-2')
+
+
+class StubbedClients:
+    """client_factory handing out one Stubber-backed client per service and region."""
+
+    def __init__(self):
+        self.clients = {}
+        self.stubbers = {}
+        self.puts = []
+        self.lock = threading.Lock()
+
+    def stub(self, service, region):
+        key = (service, region)
+        if key not in self.clients:
+            client = boto3.client(service, region_name=region, aws_access_key_id='testing',
+                                  aws_secret_access_key='testing')
+            self.clients[key] = client
+            self.stubbers[key] = Stubber(client)
+        return self.stubbers[key]
+
+    def __call__(self, service, region):
+        return self.clients[(service, region)]
+
+    def expect_puts(self, region, count):
+        stubber = self.stub('cloudwatch', region)
+        client = self.clients[('cloudwatch', region)]
+
+        def record(params, **kwargs):
+            with self.lock:
+                self.puts.append((region, params['Namespace'], len(params['MetricData'])))
+        client.meta.events.register('provide-client-params.cloudwatch.PutMetricData', record)
+        for _ in range(count):
+            stubber.add_response('put_metric_data', {}, {'Namespace': ANY, 'MetricData': ANY})
+
+    def activate(self):
+        for stubber in self.stubbers.values():
+            stubber.activate()
+
+    def assert_done(self):
+        for stubber in self.stubbers.values():
+            stubber.assert_no_pending_responses()
+
+
+def file_system(index):
+    return {
+        'FileSystemId': f'fs-{index:08x}', 'OwnerId': '123456789012', 'CreationToken': str(index),
+        'CreationTime': 0, 'LifeCycleState': 'available', 'NumberOfMountTargets': 3,
+        'SizeInBytes': {'Value': 6144 + index, 'ValueInStandard': 6144, 'ValueInIA': index},
+        'PerformanceMode': 'generalPurpose', 'Tags': [],
+    }
+
+
+def stub_efs(clients, region, pages):
+    stubber = clients.stub('efs', region)
+    marker = None
+    for index, count in enumerate(pages):
+        start = sum(pages[:index])
+        response = {'FileSystems': [file_system(start + i) for i in range(count)]}
+        if index < len(pages) - 1:
+            response['NextMarker'] = f'page-{index + 1}'
+        stubber.add_response('describe_file_systems', response, {'Marker': marker} if marker else {})
+        marker = response.get('NextMarker')
+
+
+def stub_elasticache(clients, region):
+    clients.stub('elasticache', region).add_response('describe_cache_clusters', {'CacheClusters': [
+        {'CacheClusterId': 'wordpress', 'CacheNodes': [
+            {'CacheNodeId': '0001', 'CacheNodeStatus': 'available'},
+            {'CacheNodeId': '0002', 'CacheNodeStatus': 'rebooting cache cluster nodes'},
+        ]},
+    ]}, {'ShowCacheNodeInfo': True})
+
+
+def stub_aurora(clients, region, error=None):
+    stubber = clients.stub('rds', region)
+    if error:
+        stubber.add_client_error('describe_db_instances', error, 'Not allowed')
+        return
+    stubber.add_response('describe_db_instances', {'DBInstances': [
+        {'DBInstanceIdentifier': 'wordpress-1', 'DBInstanceStatus': 'available', 'DBClusterIdentifier': 'wordpress'},
+        {'DBInstanceIdentifier': 'wordpress-2', 'DBInstanceStatus': 'modifying', 'DBClusterIdentifier': 'wordpress'},
+    ]}, {'Filters': [{'Name': 'engine', 'Values': list(metrics_collector.AURORA_ENGINES)}]})
+
+
+def test_pages_efs_and_batches_put_metric_data():
+    clients = StubbedClients()
+    # 2500 file systems over three pages: 4 datums each, so 10,000 datums in 10 calls
+    stub_efs(clients, 'us-east-1', [1000, 1000, 500])
+    clients.expect_puts('us-east-1', 10)
+    clients.activate()
+
+    result = metrics_collector.collect(['us-east-1'], ['efs'], client_factory=clients)
+
+    clients.assert_done()
+    assert result['errors'] == []
+    assert result['datums'] == 10000
+    assert result['put_calls'] == 10
+    assert all(size <= metrics_collector.MAX_METRIC_DATA for _, _, size in clients.puts)
+    assert sum(size for _, _, size in clients.puts) == 10000
+    assert result['calls']['describe_file_systems']['calls'] == 3
+    assert result['calls']['put_metric_data']['calls'] == 10
+
+
+def test_batch_size_caps_datums_per_call():
+    clients = StubbedClients()
+    stub_efs(clients, 'us-east-1', [30])
+    clients.expect_puts('us-east-1', 6)
+    clients.activate()
+
+    result = metrics_collector.collect(['us-east-1'], ['efs'], client_factory=clients, batch_size=20)
+
+    clients.assert_done()
+    assert [size for _, _, size in clients.puts] == [20] * 6
+    assert result['put_calls'] == 6
+    with pytest.raises(ValueError):
+        metrics_collector.collect(['us-east-1'], ['efs'], client_factory=clients, batch_size=1001)
+
+
+def test_sources_and_regions_are_read_in_parallel():
+    clients = StubbedClients()
+    for region in REGIONS:
+        stub_efs(clients, region, [2])
+        stub_elasticache(clients, region)
+        stub_aurora(clients, region)
+        clients.expect_puts(region, 3)
+    # Every describe call waits for all six: read one after another, the first would time out
+    barrier = threading.Barrier(6, timeout=5)
+    for (service, region), client in clients.clients.items():
+        if service != 'cloudwatch':
+            client.meta.events.register('before-call', lambda **kwargs: barrier.wait())
+    clients.activate()
+
+    result = metrics_collector.collect(list(REGIONS), client_factory=clients, max_workers=6)
+
+    clients.assert_done()
+    assert result['errors'] == []
+    assert not barrier.broken
+    # Per region: 8 EFS, 3 ElastiCache and 3 RDS datums, one call per namespace
+    assert sorted(clients.puts) == sorted(
+        (region, namespace, size) for region in REGIONS
+        for namespace, size in (('Custom/EFS', 8), ('Custom/ElastiCache', 3), ('Custom/RDS', 3)))
+
+
+def test_failing_source_does_not_stop_the_others():
+    clients = StubbedClients()
+    stub_efs(clients, 'us-east-1', [1])
+    stub_elasticache(clients, 'us-east-1')
+    stub_aurora(clients, 'us-east-1', error='AccessDenied')
+    clients.expect_puts('us-east-1', 2)
+    clients.activate()
+
+    result = metrics_collector.collect(['us-east-1'], client_factory=clients)
+
+    clients.assert_done()
+    assert [(error['source'], error['region']) for error in result['errors']] == [('aurora', 'us-east-1')]
+    assert sorted(namespace for _, namespace, _ in clients.puts) == ['Custom/EFS', 'Custom/ElastiCache']
+    assert result['calls']['describe_db_instances']['errors'] == 1
+
+
+def test_unknown_source_is_rejected():
+    with pytest.raises(ValueError):
+        metrics_collector.collect(['us-east-1'], ['s3'], client_factory=StubbedClients())
@@ -0,0 +1,70 @@
+import json
+
+import pytest
+
+import lambda_function
+from launch_backends import LocalBackend, PoolBackend, QueueBackend
+
+
+def create(**event):
+    response = lambda_function.create_test(dict({'target_url': 'http://127.0.0.1:8080/',
+                                                 'concurrent_users': 4, 'duration': 10,
+                                                 'regions': ['us-east-1']}, **event))
+    assert response['statusCode'] == 200
+    return json.loads(response['body'])['testId']
+
+
+@pytest.mark.parametrize('backend', [LocalBackend(processes=1), PoolBackend()])
+def test_claiming_backends_reject_ab_tests(tables, backend):
+    test_id = create(engine='ab')
+
+    response = lambda_function.start_test({'testId': test_id}, backend)
+
+    assert response['statusCode'] == 400
+    assert 'python engine' in json.loads(response['body'])['error']
+    config, _ = tables
+    assert config.get_item(Key={'testId': test_id})['Item']['status'] == 'created'
+
+
+def test_queue_backend_opens_ab_and_python_shards(tables):
+    for engine in ('ab', 'python'):
+        test_id = create(engine=engine)
+        response = lambda_function.start_test({'testId': test_id}, QueueBackend())
+        assert response['statusCode'] == 200
+
+
+def test_pool_backend_opens_python_shards(tables):
+    test_id = create(engine='python')
+
+    response = lambda_function.start_test({'testId': test_id}, PoolBackend())
+
+    assert response['statusCode'] == 200
+
+
+class StubPool:
+    def __init__(self, region):
+        self.provider = type('Provider', (), {'region': region})()
+
+    def scale(self, demand=0):
+        return []
+
+
+@pytest.mark.parametrize('regions', [['us-east-1', 'us-west-2'], ['eu-west-1']])
+def test_pool_backend_rejects_regions_its_engines_do_not_run_in(tables, regions):
+    test_id = create(engine='python', regions=regions)
+
+    response = lambda_function.start_test({'testId': test_id}, PoolBackend(StubPool('us-east-1')))
+
+    assert response['statusCode'] == 400
+    assert 'us-east-1' in json.loads(response['body'])['error']
+
+
+def test_pool_backend_opens_shards_in_its_region(tables):
+    test_id = create(engine='python', concurrent_users=600)
+
+    response = lambda_function.start_test({'testId': test_id}, PoolBackend(StubPool('us-east-1')))
+
+    assert response['statusCode'] == 200
+    config, _ = tables
+    shards = config.get_item(Key={'testId': test_id})['Item']['shards']
+    assert {shard['region'] for shard in shards.values()} == {'us-east-1'}
@@ -0,0 +1,69 @@
+import work_queue
+from work_queue import DEFAULT_SCAN_LIMIT, LocalClaimStore, claim_next, leased_workers
+
+
+def config(test_id, created_at, shards=1):
+    return {
+        'testId': test_id,
+        'status': 'running',
+        'engine': 'python',
+        'created_at': created_at,
+        'shards': {f'shard-{i:03d}': {'region': 'us-east-1', 'users': 10} for i in range(shards)},
+    }
+
+
+def run_to_completion(store, worker_id):
+    claimed = claim_next(store, worker_id)
+    assert claimed is not None
+    store.finish(claimed[0]['testId'], claimed[1], worker_id)
+    return claimed
+
+
+def test_last_finished_shard_completes_the_test():
+    store = LocalClaimStore([config('t1', '2026-01-01T00:00:00', shards=2)])
+
+    run_to_completion(store, 'w1')
+    assert store.items['t1']['status'] == 'running'
+    run_to_completion(store, 'w2')
+
+    assert store.items['t1']['status'] == 'completed'
+    assert 'completed_at' in store.items['t1']
+    assert store.running() == []
+
+
+def test_finish_leaves_a_stopped_test_stopped():
+    store = LocalClaimStore([config('t1', '2026-01-01T00:00:00')])
+    _, shard_id = claim_next(store, 'w1')
+    store.stop('t1')
+
+    assert store.finish('t1', shard_id, 'w1')
+    assert store.items['t1']['status'] == 'stopped'
+
+
+def test_open_test_is_claimed_behind_more_than_a_page_of_finished_tests():
+    # Created first, started (published) only after a page's worth of newer tests ran
+    buried = config('buried', '2026-01-01T00:00:00')
+    store = LocalClaimStore()
+    for i in range(DEFAULT_SCAN_LIMIT + 2):
+        store.put(config(f'stale-{i:02d}', f'2026-01-02T00:00:{i:02d}'))
+        run_to_completion(store, f'w{i}')
+    store.put(buried)
+
+    claimed_test, shard_id = claim_next(store, 'late')
+    assert (claimed_test['testId'], shard_id) == ('buried', 'shard-000')
+    assert store.items['buried']['shards']['shard-000']['claimed_by'] == 'late'
+    assert leased_workers(store) == {'late'}
+
+
+def test_dynamodb_store_completes_the_test(tables):
+    config_table, _ = tables
+    config_table.put_item(Item=config('t1', '2026-01-01T00:00:00', shards=2))
+    store = work_queue.DynamoDbClaimStore(config_table)
+
+    run_to_completion(store, 'w1')
+    assert config_table.get_item(Key={'testId': 't1'})['Item']['status'] == 'running'
+    run_to_completion(store, 'w2')
+
+    item = config_table.get_item(Key={'testId': 't1'})['Item']
+    assert item['status'] == 'completed'
+    assert store.running() == []
@@ -0,0 +1,142 @@
+"""Per-second result buckets written while a test is running.
+
+Workers keep one bucket per wall-clock second, flush completed seconds to the
+results table as they go, and the manager merges the buckets of all shards
+into a live throughput/latency curve.
+
+Series items share the results table with the summary items. Their sort key
+is "series#<ISO second>#<shard>", which keeps them in a range of their own:
+summaries (which start with the year) sort before "series#".
+"""
+import time
+from datetime import datetime, timezone
+from decimal import Decimal
+
+from latency_histogram import LatencyHistogram
+
+SERIES_PREFIX = 'series#'
+# Per-second histograms trade precision for size: they are stored per item
+SERIES_SIGNIFICANT_FIGURES = 2
+
+
+def series_key(second, shard_id=''):
+    stamp = datetime.fromtimestamp(second, timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+    return f'{SERIES_PREFIX}{stamp}#{shard_id}' if shard_id else f'{SERIES_PREFIX}{stamp}'
+
+
+def _new_histogram():
+    return LatencyHistogram(significant_figures=SERIES_SIGNIFICANT_FIGURES)
+
+
+class Bucket:
+    __slots__ = ('second', 'requests', 'errors', 'bytes', 'latency')
+
+    def __init__(self, second):
+        self.second = second
+        self.requests = 0
+        self.errors = 0
+        self.bytes = 0
+        self.latency = _new_histogram()
+
+    def to_dict(self):
+        return {
+            'second': self.second,
+            'requests': self.requests,
+            'errors': self.errors,
+            'bytes': self.bytes,
+            'histogram': self.latency.encode(),
+        }
+
+
+class SeriesRecorder:
+    """Collects per-second buckets inside one engine process."""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self.buckets = {}
+
+    def _bucket(self):
+        second = int(self.clock())
+        bucket = self.buckets.get(second)
+        if bucket is None:
+            bucket = self.buckets[second] = Bucket(second)
+        return bucket
+
+    def record(self, latency, status, nbytes):
+        bucket = self._bucket()
+        bucket.requests += 1
+        bucket.bytes += nbytes
+        if status >= 400:
+            bucket.errors += 1
+        bucket.latency.record_seconds(latency)
+
+    def record_failure(self):
+        self._bucket().errors += 1
+
+    def drain(self, final=False):
+        """Remove and return completed seconds (every second when final)."""
+        current = int(self.clock())
+        done = sorted(second for second in self.buckets if final or second < current)
+        return [self.buckets.pop(second).to_dict() for second in done]
+
+
+def merge_buckets(buckets):
+    """Merge bucket dicts (from processes or shards) into one dict per second."""
+    merged = {}
+    for bucket in buckets:
+        second = int(bucket['second'])
+        entry = merged.get(second)
+        histogram = LatencyHistogram.decode(bucket['histogram'])
+        if entry is None:
+            merged[second] = {
+                'second': second,
+                'requests': int(bucket['requests']),
+                'errors': int(bucket['errors']),
+                'bytes': int(bucket['bytes']),
+                'latency': histogram,
+            }
+        else:
+            entry['requests'] += int(bucket['requests'])
+            entry['errors'] += int(bucket['errors'])
+            entry['bytes'] += int(bucket['bytes'])
+            entry['latency'].merge(histogram)
+    return [merged[second] for second in sorted(merged)]
+
+
+def to_items(test_id, shard_id, merged):
+    """Results-table items for merged per-second buckets of one shard."""
+    items = []
+    for entry in merged:
+        histogram = entry['latency']
+        items.append({
+            'testId': test_id,
+            'timestamp': series_key(entry['second'], shard_id),
+            'kind': 'second',
+            'shardId': shard_id,
+            'second': entry['second'],
+            'rps': entry['requests'],
+            'errors': entry['errors'],
+            'bytes': entry['bytes'],
+            'p50_ms': Decimal(str(histogram.value_at_percentile(50) / 1000.0)),
+            'p99_ms': Decimal(str(histogram.value_at_percentile(99) / 1000.0)),
+            'histogram': histogram.encode(),
+        })
+    return items
+
+
+def curve(items):
+    """Combine per-shard series items into one point per second."""
+    points = []
+    for entry in merge_buckets(
+            {'second': item['second'], 'requests': item['rps'], 'errors': item['errors'],
+             'bytes': item['bytes'], 'histogram': item['histogram']} for item in items):
+        histogram = entry['latency']
+        points.append({
+            'second': entry['second'],
+            'rps': entry['requests'],
+            'errors': entry['errors'],
+            'bytes': entry['bytes'],
+            'p50_ms': histogram.value_at_percentile(50) / 1000.0,
+            'p99_ms': histogram.value_at_percentile(99) / 1000.0,
+        })
+    return points
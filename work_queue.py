@@ -0,0 +1,248 @@
+"""Claim-based work queue for pooled test engines.
+
+start_test publishes a test's shards on its config item; idle engines find
+running tests through the status-created_at-index GSI (a keyed query that
+reads only running tests, never the whole table) and claim one shard each
+with a conditional update, so no two engines run the same shard:
+
+    SET shards.<id>.claimed_by = :worker
+    IF #status = 'running' AND attribute_not_exists(shards.<id>.claimed_by)
+
+A claim is the engine's lease on the shard; the engine marks the shard
+finished when its results are in, which frees it for the next test (see
+worker_pool). The engine finishing the last shard also marks the test
+completed, so finished tests leave the index whether or not anyone fetches
+their results, and cannot push open tests past the newest-first page.
+
+stop_test stamps stop_requested_at on the config item. Engines poll for it
+with a get_item projecting just that attribute, which is how a running
+shard learns it has to stop.
+
+The claim logic only talks to a store. DynamoDbClaimStore wraps a boto3
+table (and works against DynamoDB Local through DYNAMODB_ENDPOINT);
+LocalClaimStore is an in-process stand-in with the same atomicity, for
+exercising the protocol without AWS.
+"""
+import os
+import random
+import threading
+import time
+from datetime import datetime
+
+STATUS_INDEX = 'status-created_at-index'
+# Newest running tests looked at per poll; keeps a poll O(1) in table size
+DEFAULT_SCAN_LIMIT = 10
+DEFAULT_POLL_INTERVAL = 1.0
+
+
+class ClaimStore:
+    """Interface over the config table used by the claim protocol."""
+
+    def running(self, limit=DEFAULT_SCAN_LIMIT):
+        """Return config items of running tests, newest first."""
+        raise NotImplementedError
+
+    def claim(self, test_id, shard_id, worker_id):
+        """Atomically claim an unclaimed shard of a running test; return True on success."""
+        raise NotImplementedError
+
+    def finish(self, test_id, shard_id, worker_id):
+        """Mark a shard claimed by worker_id as done, releasing the worker's lease.
+
+        Marks a running test completed once every shard is done.
+        """
+        raise NotImplementedError
+
+    def stop_requested(self, test_id):
+        """Return the Unix time stop_test was called for the test, or None."""
+        raise NotImplementedError
+
+
+class DynamoDbClaimStore(ClaimStore):
+    def __init__(self, table):
+        self.table = table
+
+    @classmethod
+    def from_name(cls, table_name, region=None):
+        import boto3
+
+        kwargs = {'region_name': region}
+        if os.environ.get('DYNAMODB_ENDPOINT'):
+            # e.g. http://localhost:8000 for DynamoDB Local
+            kwargs['endpoint_url'] = os.environ['DYNAMODB_ENDPOINT']
+        return cls(boto3.resource('dynamodb', **kwargs).Table(table_name))
+
+    def running(self, limit=DEFAULT_SCAN_LIMIT):
+        response = self.table.query(
+            IndexName=STATUS_INDEX,
+            KeyConditionExpression='#status = :running',
+            ExpressionAttributeNames={'#status': 'status'},
+            ExpressionAttributeValues={':running': 'running'},
+            ScanIndexForward=False,
+            Limit=limit
+        )
+        return response.get('Items', [])
+
+    def claim(self, test_id, shard_id, worker_id):
+        try:
+            self.table.update_item(
+                Key={'testId': test_id},
+                UpdateExpression='SET shards.#shard.claimed_by = :worker, shards.#shard.claimed_at = :now',
+                ConditionExpression='#status = :running AND attribute_not_exists(shards.#shard.claimed_by)',
+                ExpressionAttributeNames={'#status': 'status', '#shard': shard_id},
+                ExpressionAttributeValues={
+                    ':worker': worker_id,
+                    ':running': 'running',
+                    ':now': datetime.utcnow().isoformat()
+                }
+            )
+        except Exception as e:
+            # botocore's ClientError; checked by code so botocore need not be imported here
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+        return True
+
+    def finish(self, test_id, shard_id, worker_id):
+        now = datetime.utcnow().isoformat()
+        try:
+            item = self.table.update_item(
+                Key={'testId': test_id},
+                UpdateExpression='SET shards.#shard.finished_at = :now',
+                ConditionExpression='shards.#shard.claimed_by = :worker',
+                ExpressionAttributeNames={'#shard': shard_id},
+                ExpressionAttributeValues={':worker': worker_id, ':now': now},
+                ReturnValues='ALL_NEW'
+            )['Attributes']
+        except Exception as e:
+            if getattr(e, 'response', {}).get('Error', {}).get('Code') == 'ConditionalCheckFailedException':
+                return False
+            raise
+        # Updates are atomic, so whichever finish comes last sees every shard done
+        if item.get('status') == 'running' and all_finished(item):
+            try:
+                self.table.update_item(
+                    Key={'testId': test_id},
+                    UpdateExpression='SET #status = :completed, completed_at = :now',
+                    ConditionExpression='#status = :running',
+                    ExpressionAttributeNames={'#status': 'status'},
+                    ExpressionAttributeValues={':completed': 'completed', ':running': 'running', ':now': now}
+                )
+            except Exception as e:
+                # Stopped or completed in the meantime
+                if getattr(e, 'response', {}).get('Error', {}).get('Code') != 'ConditionalCheckFailedException':
+                    raise
+        return True
+
+    def stop_requested(self, test_id):
+        # Consistent, so a stop is seen on the next poll rather than after replication
+        item = self.table.get_item(
+            Key={'testId': test_id},
+            ProjectionExpression='stop_requested_at',
+            ConsistentRead=True
+        ).get('Item') or {}
+        requested_at = item.get('stop_requested_at')
+        return float(requested_at) if requested_at is not None else None
+
+
+class LocalClaimStore(ClaimStore):
+    """In-memory config table with the same claim semantics as DynamoDB."""
+
+    def __init__(self, items=()):
+        self.items = {item['testId']: item for item in items}
+        self.lock = threading.Lock()
+        self.queries = 0
+
+    def put(self, item):
+        with self.lock:
+            self.items[item['testId']] = item
+
+    def running(self, limit=DEFAULT_SCAN_LIMIT):
+        with self.lock:
+            self.queries += 1
+            items = [item for item in self.items.values() if item.get('status') == 'running']
+            items.sort(key=lambda item: item.get('created_at', ''), reverse=True)
+            # Copies, as a query result would be
+            return [dict(item, shards={k: dict(v) for k, v in (item.get('shards') or {}).items()})
+                    for item in items[:limit]]
+
+    def claim(self, test_id, shard_id, worker_id):
+        with self.lock:
+            item = self.items.get(test_id)
+            shard = (item or {}).get('shards', {}).get(shard_id)
+            if item is None or item.get('status') != 'running' or shard is None or 'claimed_by' in shard:
+                return False
+            shard['claimed_by'] = worker_id
+            shard['claimed_at'] = datetime.utcnow().isoformat()
+            return True
+
+    def finish(self, test_id, shard_id, worker_id):
+        with self.lock:
+            item = self.items.get(test_id) or {}
+            shard = item.get('shards', {}).get(shard_id)
+            if shard is None or shard.get('claimed_by') != worker_id:
+                return False
+            shard['finished_at'] = datetime.utcnow().isoformat()
+            if item.get('status') == 'running' and all_finished(item):
+                item['status'] = 'completed'
+                item['completed_at'] = shard['finished_at']
+            return True
+
+    def stop_requested(self, test_id):
+        with self.lock:
+            requested_at = (self.items.get(test_id) or {}).get('stop_requested_at')
+            return float(requested_at) if requested_at is not None else None
+
+    def stop(self, test_id, requested_at=None):
+        """Stop a test as stop_test does."""
+        with self.lock:
+            item = self.items[test_id]
+            item['status'] = 'stopped'
+            item.setdefault('stop_requested_at', requested_at or time.time())
+
+
+def all_finished(config):
+    shards = config.get('shards') or {}
+    return bool(shards) and all('finished_at' in shard for shard in shards.values())
+
+
+def claim_next(store, worker_id, accept=None, limit=DEFAULT_SCAN_LIMIT):
+    """Claim one open shard of a running test.
+
+    Returns (config, shard_id) or None when there is nothing to claim. Losing
+    a race for a shard just moves on to the next open one. accept, if given,
+    filters the tests this worker can run (e.g. by engine).
+    """
+    for config in store.running(limit):
+        if accept is not None and not accept(config):
+            continue
+        for shard_id, shard in sorted((config.get('shards') or {}).items()):
+            if 'claimed_by' in shard:
+                continue
+            if store.claim(config['testId'], shard_id, worker_id):
+                return config, shard_id
+    return None
+
+
+def leased_workers(store, limit=DEFAULT_SCAN_LIMIT):
+    """Workers holding an unfinished shard of a running test."""
+    return {
+        shard['claimed_by']
+        for config in store.running(limit)
+        for shard in (config.get('shards') or {}).values()
+        if 'claimed_by' in shard and 'finished_at' not in shard
+    }
+
+
+def wait_for_claim(store, worker_id, accept=None, interval=DEFAULT_POLL_INTERVAL, timeout=None,
+                   sleep=time.sleep, clock=time.monotonic):
+    """Poll until a shard is claimed; returns (config, shard_id) or None on timeout."""
+    deadline = clock() + timeout if timeout is not None else None
+    while True:
+        claimed = claim_next(store, worker_id, accept)
+        if claimed is not None:
+            return claimed
+        if deadline is not None and clock() >= deadline:
+            return None
+        # Jitter keeps a pool that started together from polling in lockstep
+        sleep(interval * random.uniform(0.5, 1.0))
@@ -0,0 +1,204 @@
+"""Pool of warm test engines.
+
+Launching an instance per shard makes every test pay for booting, `yum` and
+`pip` before its first request. Pool engines pay that once: each runs
+`load_worker.py --claim --serve`, claiming shard after shard from the work
+queue (see work_queue; a claim is the engine's lease on the shard) and
+exiting once it has been idle for the idle timeout, which is how the pool
+scales down. The manager only scales up: before a test's shards are
+published, WorkerPool.scale starts enough engines that every shard, plus
+min_idle spare, finds an idle one.
+
+Engines are brought up by a provider: Ec2PoolProvider in production,
+LocalProcessProvider (engine processes on this host, sharing a
+LocalClaimStore and writing results to JSON lines files) to exercise the
+pool and measure time to first request offline.
+"""
+import json
+import multiprocessing
+import os
+import time
+from contextlib import contextmanager
+from multiprocessing.managers import BaseManager
+
+import work_queue
+from launch_backends import AMAZON_LINUX_AMI, DEFAULT_INSTANCE_TYPE, _boto3_ec2_client
+
+DEFAULT_POOL_NAME = 'default'
+DEFAULT_MIN_IDLE = 0
+DEFAULT_MAX_WORKERS = 20
+# Seconds an engine waits for a shard before exiting (and its instance terminating)
+DEFAULT_IDLE_TIMEOUT = 600
+# Running tests looked at when counting leased engines
+LEASE_SCAN_LIMIT = 100
+
+
+class PoolProvider:
+    """Brings pool engines up; engines take themselves down when idle."""
+
+    def live(self):
+        """Return the ids of engines that are up or starting."""
+        raise NotImplementedError
+
+    def start(self, count):
+        """Start count engines and return their ids."""
+        raise NotImplementedError
+
+
+class WorkerPool:
+    def __init__(self, store, provider, min_idle=DEFAULT_MIN_IDLE, max_workers=DEFAULT_MAX_WORKERS):
+        self.store = store
+        self.provider = provider
+        self.min_idle = int(min_idle)
+        self.max_workers = int(max_workers)
+
+    def status(self):
+        live = set(self.provider.live())
+        leased = work_queue.leased_workers(self.store, LEASE_SCAN_LIMIT) & live
+        return {'live': len(live), 'leased': len(leased), 'idle': len(live - leased)}
+
+    def scale(self, demand=0):
+        """Start engines so demand new shards plus min_idle spare find an idle one.
+
+        Never goes past max_workers; returns the ids of the engines started.
+        """
+        status = self.status()
+        count = min(demand + self.min_idle - status['idle'], self.max_workers - status['live'])
+        return self.provider.start(count) if count > 0 else []
+
+
+class Ec2PoolProvider(PoolProvider):
+    """Pool engines are instances tagged LoadTestPool=<name>."""
+
+    def __init__(self, user_data, name=DEFAULT_POOL_NAME, region='us-east-1',
+                 instance_type=DEFAULT_INSTANCE_TYPE, image_id=AMAZON_LINUX_AMI,
+                 instance_profile=None, client_factory=None):
+        self.user_data = user_data
+        self.name = name
+        self.region = region
+        self.instance_type = instance_type
+        self.image_id = image_id
+        self.instance_profile = instance_profile
+        self.client_factory = client_factory or _boto3_ec2_client
+
+    def live(self):
+        client = self.client_factory(self.region)
+        ids = []
+        for page in client.get_paginator('describe_instances').paginate(Filters=[
+            {'Name': 'tag:LoadTestPool', 'Values': [self.name]},
+            {'Name': 'instance-state-name', 'Values': ['pending', 'running']}
+        ]):
+            for reservation in page['Reservations']:
+                ids.extend(instance['InstanceId'] for instance in reservation['Instances'])
+        return ids
+
+    def start(self, count):
+        params = {
+            'ImageId': self.image_id,
+            'MinCount': count,
+            'MaxCount': count,
+            'InstanceType': self.instance_type,
+            'UserData': self.user_data,
+            # The engine shuts the instance down when it exits idle
+            'InstanceInitiatedShutdownBehavior': 'terminate',
+            'TagSpecifications': [{
+                'ResourceType': 'instance',
+                'Tags': [
+                    {'Key': 'Name', 'Value': f'LoadTestPool-{self.name}'},
+                    {'Key': 'LoadTestPool', 'Value': self.name}
+                ]
+            }]
+        }
+        if self.instance_profile:
+            params['IamInstanceProfile'] = {'Arn': self.instance_profile}
+        response = self.client_factory(self.region).run_instances(**params)
+        return [instance['InstanceId'] for instance in response['Instances']]
+
+
+class JsonLinesTable:
+    """Results table stand-in for local engines: one JSON line per item, a file per test."""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, test_id):
+        return os.path.join(self.directory, f'{test_id}.jsonl')
+
+    def put_item(self, Item):
+        line = json.dumps(Item, default=str) + '\n'
+        # One write per line so engine processes can share a file
+        with open(self._path(Item['testId']), 'a') as f:
+            f.write(line)
+
+    @contextmanager
+    def batch_writer(self):
+        yield self
+
+    def items(self, test_id):
+        try:
+            with open(self._path(test_id)) as f:
+                return [json.loads(line) for line in f]
+        except FileNotFoundError:
+            return []
+
+
+class _StoreManager(BaseManager):
+    pass
+
+
+_StoreManager.register('LocalClaimStore', work_queue.LocalClaimStore)
+
+
+def shared_claim_store():
+    """Start a manager process holding a LocalClaimStore; returns (manager, store proxy)."""
+    manager = _StoreManager()
+    manager.start()
+    return manager, manager.LocalClaimStore()
+
+
+def _local_engine(store, results_dir, worker_id, idle_timeout, boot_delay):
+    import load_worker
+
+    # Stands in for instance boot and install when comparing with a cold start
+    time.sleep(boot_delay)
+    args = load_worker.build_parser().parse_args([
+        '--claim', '--serve', '--worker-id', worker_id, '--claim-timeout', str(idle_timeout)
+    ])
+    load_worker.serve(store, JsonLinesTable(results_dir), args)
+
+
+class LocalProcessProvider(PoolProvider):
+    """Pool engines are processes on this host sharing a claim store proxy."""
+
+    def __init__(self, store, results_dir, idle_timeout=DEFAULT_IDLE_TIMEOUT, boot_delay=0.0):
+        self.store = store
+        self.results_dir = results_dir
+        self.idle_timeout = idle_timeout
+        self.boot_delay = boot_delay
+        self.processes = {}
+        self.started = 0
+
+    def live(self):
+        # Engines that exited idle drop out of the pool
+        self.processes = {worker_id: process for worker_id, process in self.processes.items()
+                          if process.is_alive()}
+        return list(self.processes)
+
+    def start(self, count):
+        ids = []
+        for _ in range(count):
+            worker_id = f'local-{os.getpid()}-{self.started:03d}'
+            self.started += 1
+            process = multiprocessing.Process(
+                target=_local_engine,
+                args=(self.store, self.results_dir, worker_id, self.idle_timeout, self.boot_delay)
+            )
+            process.start()
+            self.processes[worker_id] = process
+            ids.append(worker_id)
+        return ids
+
+    def join(self, timeout=None):
+        for process in self.processes.values():
+            process.join(timeout)
@@ -0,0 +1,126 @@
+"""Weighted URL mixes for the load engine.
+
+A workload is a list of URLs on one origin with relative weights, either given
+directly in the test config or sampled from a WordPress sitemap. Each engine
+process builds a Vose alias table from the weights so picking the URL for a
+request is O(1) however many URLs there are.
+"""
+import math
+import random
+import xml.etree.ElementTree as ElementTree
+from urllib.parse import urlsplit
+from urllib.request import Request, urlopen
+
+DEFAULT_SITEMAP_SAMPLE = 200
+MAX_SITEMAPS = 50
+SITEMAP_NS = '{http://www.sitemaps.org/schemas/sitemap/0.9}'
+
+
+class AliasTable:
+    """Vose's alias method: O(n) build, O(1) weighted pick."""
+
+    def __init__(self, weights):
+        count = len(weights)
+        total = float(sum(weights))
+        if not count or total <= 0:
+            raise ValueError('Weights must contain at least one positive value')
+
+        scaled = [weight * count / total for weight in weights]
+        self.probability = [0.0] * count
+        self.alias = [0] * count
+        small = [i for i, value in enumerate(scaled) if value < 1.0]
+        large = [i for i, value in enumerate(scaled) if value >= 1.0]
+        while small and large:
+            less = small.pop()
+            more = large.pop()
+            self.probability[less] = scaled[less]
+            self.alias[less] = more
+            scaled[more] = scaled[more] + scaled[less] - 1.0
+            (small if scaled[more] < 1.0 else large).append(more)
+        # Whatever is left is 1.0 up to rounding error
+        for i in large + small:
+            self.probability[i] = 1.0
+
+    def pick(self, rng=random):
+        column = int(rng.random() * len(self.probability))
+        return column if rng.random() < self.probability[column] else self.alias[column]
+
+
+def normalize_urls(urls):
+    """Turn a list of URLs or {'url', 'weight'} dicts into (urls, weights)."""
+    result_urls = []
+    weights = []
+    for entry in urls:
+        if isinstance(entry, str):
+            url, weight = entry, 1.0
+        else:
+            url, weight = entry['url'], float(entry.get('weight', 1))
+        if not math.isfinite(weight) or weight < 0:
+            raise ValueError(f'Weight for {url} must be a non-negative number')
+        if not url.startswith(('http://', 'https://')):
+            url = f'https://{url}'
+        result_urls.append(url)
+        weights.append(weight)
+    # The alias table needs something to pick: all-zero weights would fail on the workers
+    if not weights or sum(weights) <= 0:
+        raise ValueError('At least one URL must have a positive weight')
+
+    origins = {origin(url) for url in result_urls}
+    if len(origins) > 1:
+        raise ValueError('All workload URLs must share one scheme, host and port')
+    return result_urls, weights
+
+
+def origin(url):
+    parts = urlsplit(url)
+    return parts.scheme, parts.hostname, parts.port
+
+
+def _fetch(url, timeout):
+    request = Request(url, headers={'User-Agent': 'load-test-sitemap/1.0'})
+    with urlopen(request, timeout=timeout) as response:
+        return response.read()
+
+
+def sitemap_urls(sitemap_url, fetch=_fetch, timeout=10):
+    """Collect page URLs from a sitemap, following sitemap indexes.
+
+    WordPress serves /wp-sitemap.xml as an index of per-type sitemaps, so
+    nested sitemaps are followed up to MAX_SITEMAPS documents.
+    """
+    pending = [sitemap_url]
+    seen = set()
+    urls = []
+    while pending and len(seen) < MAX_SITEMAPS:
+        current = pending.pop(0)
+        if current in seen:
+            continue
+        seen.add(current)
+        root = ElementTree.fromstring(fetch(current, timeout))
+        if root.tag == f'{SITEMAP_NS}sitemapindex':
+            pending.extend(loc.text.strip() for loc in root.iter(f'{SITEMAP_NS}loc') if loc.text)
+        else:
+            urls.extend(loc.text.strip() for loc in root.iter(f'{SITEMAP_NS}loc') if loc.text)
+    return urls
+
+
+def from_sitemap(sitemap_url, sample=DEFAULT_SITEMAP_SAMPLE, seed=0, fetch=_fetch):
+    """Sample up to `sample` URLs from a sitemap with equal weights.
+
+    The sample is seeded so every worker of a test that crawls the same
+    sitemap ends up with the same URL set.
+    """
+    urls = sorted(set(sitemap_urls(sitemap_url, fetch=fetch)))
+    if not urls:
+        raise ValueError(f'No URLs found in sitemap {sitemap_url}')
+    if len(urls) > sample:
+        urls = random.Random(seed).sample(urls, sample)
+    return normalize_urls(urls)
+
+
+def resolve(spec):
+    """Expand a workload spec from the test config into (urls, weights)."""
+    if spec.get('sitemap_url'):
+        return from_sitemap(spec['sitemap_url'], int(spec.get('sample', DEFAULT_SITEMAP_SAMPLE)),
+                            int(spec.get('seed', 0)))
+    return normalize_urls(spec['urls'])